@@ -1,19 +1,32 @@
-import base64
+import asyncio
+import csv
+import glob
+import hashlib
 import secrets
 import socket
+import sqlite3
 import subprocess
 import sys
 import textwrap
+import threading
 import time
+import traceback
 import json
+import multiprocessing
 import os
 import pathlib
+import queue
+import re
+import shutil
 import urllib.parse
 import zipfile
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import closing, contextmanager, nullcontext
 from runpy import run_module
 from click_default_group import DefaultGroup
 import yaml
 import click
+from playwright.async_api import async_playwright
 from playwright.sync_api import sync_playwright, Error, TimeoutError
 
 
@@ -34,14 +47,71 @@ from shot_scraper.video import (
     WaitForUrlAction,
     load_storyboard,
 )
+from shot_scraper.har import (
+    MANIFEST_FILENAME,
+    EntryFilter,
+    HarDatabase,
+    HarError,
+    Manifest,
+    attached_file_path,
+    base64_decoded_size,
+    copy_stored_member,
+    iter_base64_chunks,
+    open_har,
+    parse_status_pattern,
+    summarize_har,
+)
 from shot_scraper.utils import (
+    FilenameAllocator,
+    apply_host_mapping,
     filename_for_url,
     filename_for_har_entry,
     load_github_script,
+    parse_host_mapping,
     url_or_file_path,
 )
 
-BROWSERS = ("chromium", "firefox", "webkit", "chrome", "chrome-beta")
+BROWSERS = (
+    "chromium",
+    "chromium-headless-shell",
+    "firefox",
+    "webkit",
+    "chrome",
+    "chrome-beta",
+)
+
+# Curated Chromium flags and context options for headless capture workloads.
+# Profile arguments are applied before any --browser-arg values, so those
+# can still be used to override an individual flag.
+LAUNCH_PROFILES = {
+    "throughput": {
+        "args": [
+            "--disable-background-timer-throttling",
+            "--disable-backgrounding-occluded-windows",
+            "--disable-renderer-backgrounding",
+            "--disable-ipc-flooding-protection",
+            "--disable-features=Translate,MediaRouter,OptimizationHints",
+        ],
+        "context": {},
+    },
+    "low-memory": {
+        "args": [
+            "--renderer-process-limit=1",
+            "--disable-gpu",
+            "--disable-features=BackForwardCache,Translate,MediaRouter",
+            "--js-flags=--max-old-space-size=512",
+        ],
+        "context": {"service_workers": "block"},
+    },
+    "container": {
+        "args": [
+            "--disable-dev-shm-usage",
+            "--disable-gpu",
+            "--disable-software-rasterizer",
+        ],
+        "context": {},
+    },
+}
 
 
 def console_log(msg):
@@ -69,6 +139,167 @@ def browser_args_option(fn):
     return fn
 
 
+def launch_profile_option(fn):
+    click.option(
+        "--launch-profile",
+        type=click.Choice(sorted(LAUNCH_PROFILES), case_sensitive=False),
+        help="Apply a curated set of Chromium flags tuned for this workload",
+    )(fn)
+    return fn
+
+
+def replay_har_options(fn):
+    click.option(
+        "--replay-har",
+        type=click.Path(exists=True, file_okay=True, dir_okay=False),
+        help="Serve matching requests from this .har or .har.zip file",
+    )(fn)
+    click.option(
+        "--replay-har-miss",
+        type=click.Choice(("abort", "fallback")),
+        default="abort",
+        show_default=True,
+        help="Abort requests missing from --replay-har, or fall back to the network",
+    )(fn)
+    return fn
+
+
+def har_recording_options(fn):
+    click.option(
+        "--har-content",
+        type=click.Choice(("embed", "attach", "omit")),
+        help="Embed response bodies in the HAR, attach them as separate files, "
+        "or omit them",
+    )(fn)
+    click.option(
+        "--har-mode",
+        type=click.Choice(("full", "minimal")),
+        help="Record a full HAR, or only what is needed to replay it",
+    )(fn)
+    click.option(
+        "--har-url-filter",
+        help="Only record requests with URLs matching this glob",
+    )(fn)
+    return fn
+
+
+def _har_recording_args(record_har_path, content=None, mode=None, url_filter=None):
+    "Context arguments for recording a HAR to record_har_path"
+    args = {"record_har_path": str(record_har_path)}
+    if content:
+        args["record_har_content"] = content
+    if mode:
+        args["record_har_mode"] = mode
+    if url_filter:
+        args["record_har_url_filter"] = url_filter
+    return args
+
+
+def resolve_options(fn):
+    click.option(
+        "resolve",
+        "--resolve",
+        multiple=True,
+        help="Resolve a host to this address, e.g. example.com=127.0.0.1:8000",
+    )(fn)
+    click.option(
+        "--resolve-file",
+        type=click.File("r"),
+        help="File containing host=address lines to resolve",
+    )(fn)
+    return fn
+
+
+HAR_CHUNK_SIZE = 1024 * 1024
+
+
+def har_extract_options(fn):
+    click.option(
+        "--workers",
+        type=click.IntRange(min=1),
+        default=4,
+        show_default=True,
+        help="Number of threads to use when extracting resources",
+    )(fn)
+    click.option(
+        "--dedupe",
+        is_flag=True,
+        help="Hardlink resources with identical content instead of writing copies",
+    )(fn)
+    click.option(
+        "--manifest",
+        is_flag=True,
+        help="Write a manifest.db SQLite index of the extracted resources",
+    )(fn)
+    click.option(
+        "--content-type",
+        "content_types",
+        multiple=True,
+        help="Only extract resources matching this content type, e.g. 'image/*'",
+    )(fn)
+    click.option(
+        "--url-glob",
+        "url_globs",
+        multiple=True,
+        help="Only extract resources with URLs matching this glob",
+    )(fn)
+    click.option(
+        "--min-size",
+        type=click.IntRange(min=0),
+        help="Only extract resources at least this many bytes in size",
+    )(fn)
+    click.option(
+        "--max-size",
+        type=click.IntRange(min=0),
+        help="Only extract resources at most this many bytes in size",
+    )(fn)
+    click.option(
+        "--status",
+        "statuses",
+        multiple=True,
+        callback=_validate_statuses,
+        help="Only extract responses with this status code or class, e.g. 2xx",
+    )(fn)
+    click.option(
+        "--first-party",
+        is_flag=True,
+        help="Only extract resources from the site of the first request",
+    )(fn)
+    return fn
+
+
+def _validate_statuses(ctx, param, value):
+    try:
+        return tuple(parse_status_pattern(status) for status in value)
+    except ValueError as ex:
+        raise click.BadParameter(str(ex))
+
+
+def _entry_filter(content_types, url_globs, min_size, max_size, statuses, first_party):
+    "Build an EntryFilter from the har_extract_options, or None if unfiltered"
+    entry_filter = EntryFilter(
+        content_types=content_types,
+        url_globs=url_globs,
+        min_size=min_size,
+        max_size=max_size,
+        statuses=statuses,
+        first_party=first_party,
+    )
+    return entry_filter or None
+
+
+def _host_mapping(resolve, resolve_file=None):
+    "Combine --resolve-file and --resolve into a {host: address} dictionary"
+    rules = []
+    if resolve_file:
+        rules.extend(resolve_file.read().splitlines())
+    rules.extend(resolve or [])
+    try:
+        return parse_host_mapping(rules)
+    except ValueError as ex:
+        raise click.ClickException(str(ex))
+
+
 def user_agent_option(fn):
     click.option("--user-agent", help="User-Agent header to use")(fn)
     return fn
@@ -86,6 +317,16 @@ def silent_option(fn):
     return fn
 
 
+def python_worker_option(fn):
+    click.option(
+        "--python-worker",
+        is_flag=True,
+        help="Run python: steps in one persistent Python process that keeps "
+        "imports and variables between steps",
+    )(fn)
+    return fn
+
+
 def skip_fail_options(fn):
     click.option("--skip", is_flag=True, help="Skip pages that return HTTP errors")(fn)
     click.option(
@@ -302,12 +543,15 @@ def cli():
 @log_console_option
 @browser_option
 @browser_args_option
+@launch_profile_option
 @user_agent_option
 @reduced_motion_option
 @skip_fail_options
 @bypass_csp_option
 @silent_option
 @http_auth_options
+@resolve_options
+@replay_har_options
 def shot(
     url,
     auth,
@@ -334,6 +578,7 @@ def shot(
     log_console,
     browser,
     browser_args,
+    launch_profile,
     user_agent,
     reduced_motion,
     skip,
@@ -342,6 +587,10 @@ def shot(
     silent,
     auth_username,
     auth_password,
+    resolve,
+    resolve_file,
+    replay_har,
+    replay_har_miss,
 ):
     """
     Take a single screenshot of a page or portion of a page.
@@ -399,11 +648,15 @@ def shot(
         context, browser_obj = _browser_context(
             p,
             auth,
+            resolve=_host_mapping(resolve, resolve_file),
+            replay_har=replay_har,
+            replay_har_miss=replay_har_miss,
             interactive=interactive,
             devtools=devtools,
             scale_factor=scale_factor,
             browser=browser,
             browser_args=browser_args,
+            launch_profile=launch_profile,
             user_agent=user_agent,
             timeout=timeout,
             reduced_motion=reduced_motion,
@@ -452,7 +705,27 @@ def shot(
 
 
 def _browser_context(
-    p,
+    p, auth, timeout=None, replay_har=None, replay_har_miss="abort", **options
+):
+    """
+    Launch a browser and create a new context in it, returning
+    (context, browser). options are passed to _browser_launch_options().
+
+    If replay_har is set, requests are served from that HAR file. Requests
+    that are not in the file are aborted, or sent to the network if
+    replay_har_miss is "fallback".
+    """
+    browser_type, launch_kwargs, context_args = _browser_launch_options(auth, **options)
+    browser_obj = getattr(p, browser_type).launch(**launch_kwargs)
+    context = browser_obj.new_context(**context_args)
+    if timeout:
+        context.set_default_timeout(timeout)
+    if replay_har:
+        context.route_from_har(replay_har, not_found=replay_har_miss)
+    return context, browser_obj
+
+
+def _browser_launch_options(
     auth,
     interactive=False,
     devtools=False,
@@ -460,36 +733,64 @@ def _browser_context(
     browser="chromium",
     browser_args=None,
     user_agent=None,
-    timeout=None,
     reduced_motion=False,
     bypass_csp=False,
     auth_username=None,
     auth_password=None,
     record_har_path=None,
+    record_har_content=None,
+    record_har_mode=None,
+    record_har_url_filter=None,
     record_video_dir=None,
     record_video_size=None,
     viewport=None,
+    launch_profile=None,
+    storage_state=None,
+    resolve=None,
 ):
+    """
+    Work out the options for launching the browser and creating a context.
+
+    Returns a (browser_type, launch_kwargs, context_kwargs) tuple, where
+    browser_type is the name of the Playwright browser type to launch.
+    """
+    profile = {"args": [], "context": {}}
+    if launch_profile:
+        if browser in ("firefox", "webkit"):
+            raise click.ClickException(
+                "--launch-profile can only be used with Chromium-based browsers"
+            )
+        profile = LAUNCH_PROFILES[launch_profile.lower()]
+    if browser == "chromium-headless-shell" and interactive:
+        raise click.ClickException(
+            "chromium-headless-shell cannot be used for interactive sessions"
+        )
     # Playwright 1.58 removed the `devtools` launch option. Emulate the
     # previous behavior for Chromium by passing the corresponding flag.
-    args = list(browser_args or [])
+    args = list(profile["args"]) + list(browser_args or [])
+    if resolve:
+        if browser in ("firefox", "webkit"):
+            raise click.ClickException(
+                "--resolve can only be used with Chromium-based browsers"
+            )
+        args.append(
+            "--host-resolver-rules="
+            + ", ".join(f"MAP {host} {address}" for host, address in resolve.items())
+        )
     browser_kwargs = dict(headless=not interactive, args=args)
-    if browser == "chromium":
-        if devtools and "--auto-open-devtools-for-tabs" not in args:
-            args.append("--auto-open-devtools-for-tabs")
-        browser_obj = p.chromium.launch(**browser_kwargs)
-    elif browser == "firefox":
-        browser_obj = p.firefox.launch(**browser_kwargs)
-    elif browser == "webkit":
-        browser_obj = p.webkit.launch(**browser_kwargs)
+    if browser in ("firefox", "webkit"):
+        browser_type = browser
     else:
-        browser_kwargs["channel"] = browser
+        browser_type = "chromium"
+        if browser != "chromium":
+            browser_kwargs["channel"] = browser
         if devtools and "--auto-open-devtools-for-tabs" not in args:
             args.append("--auto-open-devtools-for-tabs")
-        browser_obj = p.chromium.launch(**browser_kwargs)
-    context_args = {}
+    context_args = dict(profile["context"])
     if auth:
         context_args["storage_state"] = json.load(auth)
+    elif storage_state:
+        context_args["storage_state"] = storage_state
     if scale_factor:
         context_args["device_scale_factor"] = scale_factor
     if reduced_motion:
@@ -504,21 +805,25 @@ def _browser_context(
             "password": auth_password,
         }
     if record_har_path:
-        context_args["record_har_path"] = record_har_path
+        context_args.update(
+            _har_recording_args(
+                record_har_path,
+                record_har_content,
+                record_har_mode,
+                record_har_url_filter,
+            )
+        )
     if record_video_dir:
         context_args["record_video_dir"] = record_video_dir
     if record_video_size:
         context_args["record_video_size"] = record_video_size
     if viewport:
         context_args["viewport"] = viewport
-    context = browser_obj.new_context(**context_args)
-    if timeout:
-        context.set_default_timeout(timeout)
-    return context, browser_obj
+    return browser_type, browser_kwargs, context_args
 
 
 @cli.command()
-@click.argument("storyboard_file", type=click.File(mode="r"))
+@click.argument("storyboard_files", nargs=-1, required=True)
 @click.option(
     "-o",
     "--output",
@@ -538,6 +843,7 @@ def _browser_context(
 )
 @browser_option
 @browser_args_option
+@launch_profile_option
 @user_agent_option
 @reduced_motion_option
 @log_console_option
@@ -556,13 +862,62 @@ def _browser_context(
     is_flag=True,
     help="Also convert the recorded WebM video to MP4 using ffmpeg",
 )
+@click.option(
+    "--live",
+    is_flag=True,
+    help="With --mp4, encode the MP4 while recording instead of converting "
+    "the WebM afterwards",
+)
+@click.option(
+    "--no-webm",
+    is_flag=True,
+    help="With --mp4 --live, only write the MP4",
+)
+@click.option(
+    "--concurrency",
+    type=click.IntRange(min=1),
+    default=1,
+    show_default=True,
+    help="Record up to this many storyboards at once",
+)
+@click.option(
+    "--cache-dir",
+    type=click.Path(file_okay=False, writable=True),
+    help="Reuse recordings of unchanged scenes from this directory",
+)
+@click.option(
+    "--profile",
+    type=click.File("w"),
+    help="Write a JSON timeline of how long each scene and action took",
+)
+@click.option(
+    "--dry-run",
+    is_flag=True,
+    help="Run the storyboard without recording, skipping pauses, to check "
+    "its selectors and estimate the video duration",
+)
+@click.option(
+    "--virtual-time",
+    is_flag=True,
+    help="Record frame by frame against a virtual clock, so pauses and "
+    "delays do not take real time",
+)
+@click.option(
+    "--max-idle",
+    type=click.FloatRange(min=0, min_open=True),
+    help="Shorten stretches where the video does not change to at most this "
+    "many seconds",
+)
+@python_worker_option
+@resolve_options
 def video(
-    storyboard_file,
+    storyboard_files,
     output,
     auth,
     timeout,
     browser,
     browser_args,
+    launch_profile,
     user_agent,
     reduced_motion,
     log_console,
@@ -574,6 +929,17 @@ def video(
     auth_password,
     leave_server,
     mp4,
+    live,
+    no_webm,
+    concurrency,
+    cache_dir,
+    profile,
+    dry_run,
+    virtual_time,
+    python_worker,
+    max_idle,
+    resolve,
+    resolve_file,
 ):
     """
     Record a WebM video from a YAML storyboard.
@@ -583,6 +949,21 @@ def video(
     \b
         shot-scraper video storyboard.yml
         shot-scraper video storyboard.yml -o demo.webm --mp4
+        shot-scraper video demos/ --concurrency 4
+        shot-scraper video storyboard.yml --cache-dir .video-cache
+        shot-scraper video storyboard.yml --dry-run --profile timeline.json
+        shot-scraper video demos/ --virtual-time --concurrency 4
+        shot-scraper video storyboard.yml --max-idle 1.5 --mp4
+
+    Pass several storyboard files, directories containing .yml files or glob
+    patterns to record more than one video.
+
+    With --cache-dir, each scene is recorded separately and stored in that
+    directory. Later runs only record the scenes that changed (and the scenes
+    after them) and join the segments with ffmpeg.
+
+    With --virtual-time, time in the page only moves forward as each frame is
+    captured, so a long video can be recorded faster than real time.
 
     A storyboard is a YAML mapping with an output filename, a starting URL (or
     an opening scene), and a list of scenes. Each scene can wait, run commands,
@@ -641,6 +1022,9 @@ def video(
         wait_for_url: URL pattern to wait for.
         javascript: JavaScript to run before scene recording starts.
         scenes: Required list of scenes.
+        exports: Optional list of mp4, gif, webm or png exports to create from
+          the recording, each a format or a mapping with format, output,
+          width, height, fps and (for png) at.
 
     Scene YAML keys:
 
@@ -677,38 +1061,152 @@ def video(
     For full YAML syntax documentation, see:
     https://shot-scraper.datasette.io/en/stable/video.html
     """
-    try:
-        storyboard_config = load_storyboard(storyboard_file)
-    except StoryboardError as ex:
-        raise click.ClickException(str(ex))
+    if live and not mp4:
+        raise click.UsageError("--live can only be used with --mp4")
+    if no_webm and not live:
+        raise click.UsageError("--no-webm can only be used with --mp4 --live")
+    if cache_dir and live:
+        raise click.UsageError("--cache-dir cannot be used with --live")
+    if dry_run and (mp4 or cache_dir):
+        raise click.UsageError("--dry-run cannot be used with --mp4 or --cache-dir")
+    if max_idle and (live or dry_run):
+        raise click.UsageError("--max-idle cannot be used with --live or --dry-run")
+    if virtual_time and (live or cache_dir or dry_run):
+        raise click.UsageError(
+            "--virtual-time cannot be used with --live, --cache-dir or --dry-run"
+        )
+    paths = _storyboard_paths(storyboard_files)
+    if output and len(paths) > 1:
+        raise click.UsageError("--output can only be used with a single storyboard")
+    if (profile or dry_run) and len(paths) > 1:
+        raise click.UsageError(
+            "--profile and --dry-run can only be used with a single storyboard"
+        )
+    storyboards = []
+    for path in paths:
+        try:
+            with click.open_file(path) as storyboard_file:
+                storyboards.append((path, load_storyboard(storyboard_file)))
+        except StoryboardError as ex:
+            raise click.ClickException(str(ex) if len(paths) == 1 else f"{path}: {ex}")
     if output:
-        storyboard_config = storyboard_config.model_copy(update={"output": output})
-    try:
-        _record_storyboard(
-            storyboard_config,
-            auth=auth,
-            timeout=timeout,
-            browser=browser,
-            browser_args=browser_args,
-            user_agent=user_agent,
-            reduced_motion=reduced_motion,
-            log_console=log_console,
-            skip=skip,
-            fail=fail,
-            bypass_csp=bypass_csp,
-            silent=silent,
-            auth_username=auth_username,
-            auth_password=auth_password,
-            leave_server=leave_server,
+        storyboards[0] = (
+            storyboards[0][0],
+            storyboards[0][1].model_copy(update={"output": output}),
         )
-        if mp4:
+    for path, storyboard_config in storyboards:
+        _check_video_exports(storyboard_config, webm=not no_webm, mp4=mp4)
+    if len(storyboards) > 1:
+        with _python_worker(python_worker):
+            _record_storyboards(
+                storyboards,
+                concurrency=concurrency,
+                mp4=mp4,
+                live_mp4=live,
+                webm=not no_webm,
+                auth=auth,
+                timeout=timeout,
+                resolve=_host_mapping(resolve, resolve_file),
+                log_console=log_console,
+                skip=skip,
+                fail=fail,
+                silent=silent,
+                leave_server=leave_server,
+                cache_dir=cache_dir,
+                virtual_time=virtual_time,
+                max_idle=max_idle,
+                browser=browser,
+                browser_args=browser_args,
+                launch_profile=launch_profile,
+                user_agent=user_agent,
+                reduced_motion=reduced_motion,
+                bypass_csp=bypass_csp,
+                auth_username=auth_username,
+                auth_password=auth_password,
+            )
+        return
+    storyboard_config = storyboards[0][1]
+    timer = _StoryboardTimer(dry_run=dry_run) if profile or dry_run else None
+    try:
+        with _python_worker(python_worker):
+            _record_storyboard(
+                storyboard_config,
+                auth=auth,
+                timeout=timeout,
+                browser=browser,
+                browser_args=browser_args,
+                launch_profile=launch_profile,
+                resolve=_host_mapping(resolve, resolve_file),
+                user_agent=user_agent,
+                reduced_motion=reduced_motion,
+                log_console=log_console,
+                skip=skip,
+                fail=fail,
+                bypass_csp=bypass_csp,
+                silent=silent,
+                auth_username=auth_username,
+                auth_password=auth_password,
+                leave_server=leave_server,
+                live_mp4=live,
+                webm=not no_webm,
+                cache_dir=cache_dir,
+                timer=timer,
+                virtual_time=virtual_time,
+            )
+        if dry_run:
+            timer.echo_estimate()
+            return
+        if max_idle:
+            _compress_idle_video(storyboard_config.output, max_idle, silent=silent)
+        if mp4 and not live:
             _convert_video_to_mp4(storyboard_config.output, silent=silent)
+        if storyboard_config.exports:
+            _export_video(
+                storyboard_config.output, storyboard_config.exports, silent=silent
+            )
     except TimeoutError as e:
         raise click.ClickException(str(e))
+    finally:
+        if profile:
+            json.dump(timer.timeline(storyboard_config.output), profile, indent=2)
+            profile.write("\n")
+
+
+def _storyboard_paths(arguments):
+    """
+    Expand the storyboard arguments to the video command. Each one can be a
+    file, - for standard input, a directory of .yml or .yaml files or a glob.
+    """
+    paths = []
+    for argument in arguments:
+        if argument == "-" or os.path.isfile(argument):
+            found = [argument]
+        elif os.path.isdir(argument):
+            directory = glob.escape(argument)
+            found = sorted(
+                glob.glob(os.path.join(directory, "*.yml"))
+                + glob.glob(os.path.join(directory, "*.yaml"))
+            )
+            if not found:
+                raise click.ClickException(
+                    f"No .yml or .yaml storyboards found in '{argument}'"
+                )
+        else:
+            found = sorted(glob.glob(argument))
+            if not found:
+                raise click.ClickException(
+                    f"No storyboards found matching '{argument}'"
+                )
+        paths.extend(path for path in found if path not in paths)
+    return paths
+
+
+def _mp4_path(output):
+    return str(pathlib.Path(output).with_suffix(".mp4"))
 
 
 def _convert_video_to_mp4(output, silent=False):
-    mp4_output = str(pathlib.Path(output).with_suffix(".mp4"))
+    mp4_output = _mp4_path(output)
     args = [
         "ffmpeg",
         "-y",
@@ -741,80 +1239,744 @@ def _convert_video_to_mp4(output, silent=False):
     return mp4_output
 
 
-@cli.command()
-@click.argument("config", type=click.File(mode="r"))
-@click.option(
-    "-a",
-    "--auth",
-    type=click.File("r"),
-    help="Path to JSON authentication context file",
-)
-@scale_factor_options
-@click.option(
-    "--timeout",
-    type=int,
-    help="Wait this many milliseconds before failing",
-)
-# Hidden because will be removed if I release shot-scraper 2.0
-# See https://github.com/simonw/shot-scraper/issues/103
-@click.option(
-    "--fail-on-error", is_flag=True, help="Fail noisily on error", hidden=True
-)
-@click.option(
-    "noclobber",
-    "-n",
-    "--no-clobber",
-    is_flag=True,
-    help="Skip images that already exist",
-)
-@click.option(
-    "outputs",
-    "-o",
-    "--output",
-    help="Just take shots matching these output files",
-    multiple=True,
-)
-@browser_option
-@browser_args_option
-@user_agent_option
-@reduced_motion_option
-@log_console_option
-@skip_fail_options
-@silent_option
-@http_auth_options
-@click.option(
-    "leave_server",
-    "--leave-server",
-    is_flag=True,
-    help="Leave servers running when script finishes",
-)
-@click.option(
-    "--har",
-    is_flag=True,
-    help="Save all requests to trace.har file",
-)
-@click.option(
-    "--har-zip",
-    is_flag=True,
-    help="Save all requests to trace.har.zip file",
-)
-@click.option(
-    "--har-file",
-    type=click.Path(file_okay=True, writable=True, dir_okay=False),
-    help="Path to HAR file to save all requests",
-)
-def multi(
-    config,
-    auth,
-    retina,
-    scale_factor,
-    timeout,
-    fail_on_error,
-    noclobber,
-    outputs,
-    browser,
-    browser_args,
-    user_agent,
+# ffmpeg output options for each exports: format
+VIDEO_EXPORT_ARGS = {
+    "mp4": ["-c:v", "libx264", "-pix_fmt", "yuv420p", "-movflags", "+faststart"],
+    "webm": ["-c:v", "libvpx-vp9", "-b:v", "0", "-crf", "32"],
+    "gif": [],
+    "png": ["-frames:v", "1", "-update", "1"],
+}
+
+
+def _check_video_exports(storyboard_config, webm=True, mp4=False):
+    "Check the exports: of a storyboard before it is recorded"
+    output = storyboard_config.output
+    if not storyboard_config.exports or not output:
+        return
+    if not webm:
+        raise click.ClickException("exports: cannot be used with --no-webm")
+    paths = {str(pathlib.Path(output))}
+    mp4_path = str(pathlib.Path(_mp4_path(output))) if mp4 else None
+    for export in storyboard_config.exports:
+        path = str(pathlib.Path(export.output_path(output)))
+        if path == mp4_path:
+            raise click.ClickException(
+                f"exports: {export.format} output '{path}' is also written by "
+                "--mp4, remove --mp4 or set a different output:"
+            )
+        if path in paths:
+            raise click.ClickException(
+                f"exports: {export.format} output '{path}' is already in use, "
+                "set a different output:"
+            )
+        paths.add(path)
+
+
+def _video_export_args(source, exports):
+    """
+    Build an ffmpeg command that creates every export from a single decode
+    of source, by splitting the decoded video between the outputs in one
+    filter graph.
+    """
+    graph = [
+        "[0:v]split={}{}".format(
+            len(exports), "".join(f"[in{i}]" for i in range(len(exports)))
+        )
+    ]
+    output_args = []
+    for i, export in enumerate(exports):
+        filters = []
+        if export.at:
+            filters.append(f"trim=start={export.at:g},setpts=PTS-STARTPTS")
+        if export.fps:
+            filters.append(f"fps={export.fps:g}")
+        flags = ":flags=lanczos" if export.format == "gif" else ""
+        if export.width and export.height:
+            filters.append(f"scale={export.width}:{export.height}{flags}")
+        elif export.width:
+            filters.append(f"scale={export.width}:-2{flags}")
+        elif export.height:
+            filters.append(f"scale=-2:{export.height}{flags}")
+        elif export.format == "mp4":
+            # libx264 needs even dimensions
+            filters.append("pad=ceil(iw/2)*2:ceil(ih/2)*2")
+        chain = f"[in{i}]" + ",".join(filters or ["null"])
+        if export.format == "gif":
+            # Generate an optimized palette from this output's own frames
+            chain += (
+                f",split[gif{i}][pal{i}];"
+                f"[pal{i}]palettegen=stats_mode=diff[palette{i}];"
+                f"[gif{i}][palette{i}]paletteuse=dither=bayer:bayer_scale=5"
+            )
+        graph.append(f"{chain}[out{i}]")
+        output_args += (
+            ["-map", f"[out{i}]"]
+            + VIDEO_EXPORT_ARGS[export.format]
+            + [export.output_path(source)]
+        )
+    return ["ffmpeg", "-y", "-i", source, "-filter_complex", ";".join(graph)] + (
+        output_args
+    )
+
+
+def _export_video(source, exports, silent=False):
+    args = _video_export_args(source, exports)
+    try:
+        subprocess.run(args, check=True, capture_output=True, text=True)
+    except FileNotFoundError:
+        raise click.ClickException(
+            "WebM was created, but exports failed: ffmpeg is not installed "
+            "or not on PATH"
+        )
+    except subprocess.CalledProcessError as ex:
+        reason = (ex.stderr or ex.stdout or "").strip()
+        if not reason:
+            reason = f"ffmpeg exited with status {ex.returncode}"
+        raise click.ClickException(f"WebM was created, but exports failed: {reason}")
+    if not silent:
+        for export in exports:
+            click.echo(
+                "{} written to '{}'".format(
+                    export.format.upper(), export.output_path(source)
+                ),
+                err=True,
+            )
+
+
+# freezedetect noise tolerance, so near-identical frames count as idle
+IDLE_NOISE = 0.003
+
+
+def _run_idle_ffmpeg(args):
+    try:
+        return subprocess.run(args, check=True, capture_output=True, text=True)
+    except FileNotFoundError:
+        raise click.ClickException(
+            "WebM was created, but idle compression failed: ffmpeg is not "
+            "installed or not on PATH"
+        )
+    except subprocess.CalledProcessError as ex:
+        reason = (ex.stderr or ex.stdout or "").strip()
+        if not reason:
+            reason = f"ffmpeg exited with status {ex.returncode}"
+        raise click.ClickException(
+            f"WebM was created, but idle compression failed: {reason}"
+        )
+
+
+def _idle_stretches(path, max_idle):
+    """
+    Find the stretches of a video where the frames stay identical or nearly
+    identical for longer than max_idle seconds.
+
+    ffmpeg's freezedetect filter compares each frame with the last on a
+    downscaled copy of the video. Returns (stretches, duration), where
+    stretches is a list of (start, end) times in seconds - end is None if
+    the video is still idle when it finishes.
+    """
+    result = _run_idle_ffmpeg(
+        [
+            "ffmpeg",
+            "-hide_banner",
+            "-i",
+            path,
+            "-vf",
+            f"scale=160:-2,freezedetect=n={IDLE_NOISE}:d={max_idle:g}",
+            "-an",
+            "-f",
+            "null",
+            "-",
+        ]
+    )
+    stretches = []
+    for name, value in re.findall(
+        r"lavfi\.freezedetect\.freeze_(start|end): ([\d.]+)", result.stderr
+    ):
+        if name == "start":
+            stretches.append((float(value), None))
+        elif stretches:
+            stretches[-1] = (stretches[-1][0], float(value))
+    times = re.findall(r"time=(\d+):(\d+):([\d.]+)", result.stderr)
+    duration = None
+    if times:
+        hours, minutes, seconds = times[-1]
+        duration = int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+    return stretches, duration
+
+
+def _compress_idle_video(path, max_idle, silent=False):
+    """
+    Shorten each idle stretch of the video at path to max_idle seconds,
+    replacing the file, and report how much time was removed.
+    """
+    stretches, duration = _idle_stretches(path, max_idle)
+    if not stretches:
+        if not silent:
+            click.echo(f"No idle stretches longer than {max_idle:g}s", err=True)
+        return
+    # The parts of the video to keep, as (start, end) with end=None for the
+    # rest of the video
+    keep = []
+    position = 0.0
+    for start, end in stretches:
+        keep.append((position, start + max_idle))
+        position = end
+        if end is None:
+            break
+    if position is not None:
+        keep.append((position, None))
+    graph = []
+    for i, (start, end) in enumerate(keep):
+        trim = f"trim=start={start:g}" + (f":end={end:g}" if end is not None else "")
+        graph.append(f"[0:v]{trim},setpts=PTS-STARTPTS[v{i}]")
+    graph.append(
+        "{}concat=n={}:v=1:a=0[out]".format(
+            "".join(f"[v{i}]" for i in range(len(keep))), len(keep)
+        )
+    )
+    source = pathlib.Path(path)
+    compressed = source.with_name(f"{source.stem}.idle{source.suffix}")
+    _run_idle_ffmpeg(
+        ["ffmpeg", "-y", "-i", path, "-filter_complex", ";".join(graph)]
+        + ["-map", "[out]"]
+        + VIDEO_EXPORT_ARGS["webm"]
+        + [str(compressed)]
+    )
+    os.replace(compressed, source)
+    if silent:
+        return
+    removed = 0.0
+    for start, end in stretches:
+        end = duration if end is None else end
+        if end is None:
+            click.echo(f"Idle from {start:.1f}s to the end: shortened", err=True)
+            continue
+        removed += end - start - max_idle
+        click.echo(
+            f"Idle from {start:.1f}s to {end:.1f}s: shortened from "
+            f"{end - start:.1f}s to {max_idle:g}s",
+            err=True,
+        )
+    click.echo(
+        f"Removed {removed:.1f}s of idle video from '{path}'"
+        + (f", {duration:.1f}s to {duration - removed:.1f}s" if duration else ""),
+        err=True,
+    )
+
+
+class _StoryboardTimer:
+    """
+    Records how long each step of a storyboard recording takes, for
+    video --profile and --dry-run.
+
+    With dry_run=True pauses are skipped instead of slept, but still count
+    towards the times in the timeline - so the timeline estimates how long
+    the recording would take.
+    """
+
+    def __init__(self, dry_run=False):
+        self.dry_run = dry_run
+        self.started = time.monotonic()
+        self.skipped = 0.0
+        self.recording_started = None
+        self.setup = []
+        self.scenes = []
+
+    def now(self):
+        return time.monotonic() - self.started + self.skipped
+
+    def pause(self, seconds):
+        if self.dry_run:
+            self.skipped += seconds
+        else:
+            time.sleep(seconds)
+
+    def start_recording(self):
+        self.recording_started = self.now()
+
+    @contextmanager
+    def step(self, step, **options):
+        steps = self.scenes[-1]["steps"] if self.scenes else self.setup
+        record = {"step": step}
+        if options:
+            record["options"] = options
+        steps.append(record)
+        start = self.now()
+        try:
+            yield
+        except BaseException as ex:
+            record["error"] = str(getattr(ex, "message", ex))
+            raise
+        finally:
+            record["start"] = round(start, 3)
+            record["duration"] = round(self.now() - start, 3)
+
+    @contextmanager
+    def scene(self, index, name):
+        record = {"scene": index, "name": name, "steps": []}
+        self.scenes.append(record)
+        start = self.now()
+        try:
+            yield
+        finally:
+            record["start"] = round(start, 3)
+            record["duration"] = round(self.now() - start, 3)
+
+    def video_duration(self):
+        if self.recording_started is None:
+            return None
+        return round(self.now() - self.recording_started, 3)
+
+    def timeline(self, output):
+        return {
+            "output": output,
+            "dry_run": self.dry_run,
+            "total": round(self.now(), 3),
+            "video_duration": self.video_duration(),
+            "setup": self.setup,
+            "scenes": self.scenes,
+        }
+
+    def echo_estimate(self):
+        for scene in self.scenes:
+            click.echo(
+                "Scene {}: {} - {:.1f}s".format(
+                    scene["scene"], scene["name"], scene["duration"]
+                )
+            )
+        click.echo(f"Estimated video duration: {self.video_duration():.1f}s")
+
+
+def _timed(timer, step, **options):
+    "Time a step with timer.step(), if there is a timer"
+    if timer is None:
+        return nullcontext()
+    return timer.step(step, **options)
+
+
+class _SceneCache:
+    """
+    Stores the recording of each scene of a storyboard in a directory, so
+    scenes that have not changed can be reused instead of recorded again.
+
+    Each scene is keyed by a hash of its definition and the key of the scene
+    before it, starting from a hash of the top-level storyboard settings and
+    the browser options - so a change to one scene also invalidates every
+    scene after it. A scene is stored as <key>.webm alongside <key>.json,
+    which holds the page URL and storage state at the end of the scene so
+    recording can resume from that point.
+
+    Storyboards that differ only in their output share keys, so recordings
+    in progress and the ffmpeg list file use a name unique to this cache,
+    and finished files are moved into place with os.replace().
+    """
+
+    def __init__(self, directory, storyboard_config, options):
+        self.directory = pathlib.Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.token = secrets.token_hex(8)
+        settings = storyboard_config.model_dump(
+            mode="json", exclude={"output", "exports", "scenes"}
+        )
+        key = self._hash({"storyboard": settings, "options": options})
+        self.keys = []
+        for scene in storyboard_config.scenes:
+            key = self._hash([key, scene.model_dump(mode="json")])
+            self.keys.append(key)
+        # Recording resumes at the first scene missing from the cache
+        self.start = next(
+            (
+                index
+                for index, key in enumerate(self.keys)
+                if not self._path(key, ".webm").exists()
+                or not self._path(key, ".json").exists()
+            ),
+            len(self.keys),
+        )
+
+    @staticmethod
+    def _hash(value):
+        return hashlib.sha256(
+            json.dumps(value, sort_keys=True, default=str).encode("utf-8")
+        ).hexdigest()
+
+    def _path(self, key, suffix):
+        return self.directory / f"{key}{suffix}"
+
+    @property
+    def complete(self):
+        return self.start == len(self.keys)
+
+    def state(self, index):
+        "The URL and storage state saved at the end of scene index"
+        return json.loads(self._path(self.keys[index], ".json").read_text("utf-8"))
+
+    def recording_path(self, index):
+        return str(self._path(self.keys[index], f".{self.token}.partial.webm"))
+
+    def save(self, index, url, storage_state):
+        key = self.keys[index]
+        state_path = self._path(key, f".{self.token}.partial.json")
+        state_path.write_text(
+            json.dumps({"url": url, "storage_state": storage_state}), "utf-8"
+        )
+        os.replace(self.recording_path(index), self._path(key, ".webm"))
+        os.replace(state_path, self._path(key, ".json"))
+
+    def discard_partial(self):
+        for index, key in enumerate(self.keys):
+            pathlib.Path(self.recording_path(index)).unlink(missing_ok=True)
+            self._path(key, f".{self.token}.partial.json").unlink(missing_ok=True)
+
+    def concat(self, output):
+        "Join the cached scene recordings into output without re-encoding"
+        list_path = self._path(self.keys[-1], f".{self.token}.txt")
+        list_path.write_text(
+            "".join(
+                "file '{}'\n".format(
+                    str(self._path(key, ".webm").resolve()).replace("'", "'\\''")
+                )
+                for key in self.keys
+            ),
+            "utf-8",
+        )
+        args = [
+            "ffmpeg",
+            "-y",
+            "-f",
+            "concat",
+            "-safe",
+            "0",
+            "-i",
+            str(list_path),
+            "-c",
+            "copy",
+            output,
+        ]
+        try:
+            subprocess.run(args, check=True, capture_output=True, text=True)
+        except FileNotFoundError:
+            raise click.ClickException(
+                "Could not join cached scenes: ffmpeg is not installed or not on PATH"
+            )
+        except subprocess.CalledProcessError as ex:
+            reason = (ex.stderr or ex.stdout or "").strip()
+            if not reason:
+                reason = f"ffmpeg exited with status {ex.returncode}"
+            raise click.ClickException(f"Could not join cached scenes: {reason}")
+        finally:
+            list_path.unlink(missing_ok=True)
+
+
+class _LiveMP4Encoder:
+    """
+    Encodes screencast frames to an MP4 file as they are captured, by piping
+    them to ffmpeg.
+
+    The browser only sends a frame when something on the page changes, so
+    each frame is repeated until the next one is due, based on the frame
+    timestamps. That keeps the video at a constant frame rate.
+    """
+
+    fps = 25
+
+    def __init__(self, output):
+        self.output = output
+        self.first_timestamp = None
+        self.first_received = None
+        self.last_frame = None
+        self.frames_written = 0
+        self.broken = False
+        args = [
+            "ffmpeg",
+            "-y",
+            "-loglevel",
+            "error",
+            "-f",
+            "image2pipe",
+            "-c:v",
+            "mjpeg",
+            "-framerate",
+            str(self.fps),
+            "-i",
+            "-",
+            "-c:v",
+            "libx264",
+            "-pix_fmt",
+            "yuv420p",
+            # libx264 needs even dimensions
+            "-vf",
+            "pad=ceil(iw/2)*2:ceil(ih/2)*2",
+            "-movflags",
+            "+faststart",
+            output,
+        ]
+        try:
+            self.process = subprocess.Popen(
+                args, stdin=subprocess.PIPE, stderr=subprocess.PIPE
+            )
+        except FileNotFoundError:
+            raise click.ClickException(
+                "MP4 encoding failed: ffmpeg is not installed or not on PATH"
+            )
+
+    def add_frame(self, frame):
+        "on_frame callback for page.screencast.start()"
+        if self.first_timestamp is None:
+            # Timestamps are in milliseconds
+            self.first_timestamp = frame["timestamp"]
+            self.first_received = time.monotonic()
+        due = round((frame["timestamp"] - self.first_timestamp) * self.fps / 1000)
+        self._write_until(due)
+        self.last_frame = frame["data"]
+
+    def _write_until(self, count):
+        while self.frames_written < count and not self.broken:
+            try:
+                self.process.stdin.write(self.last_frame)
+            except (BrokenPipeError, ValueError):
+                # ffmpeg exited - close() reports the error
+                self.broken = True
+            self.frames_written += 1
+
+    def close(self):
+        """
+        Write the final frame until the end of the recording, then wait for
+        ffmpeg to finish the file.
+        """
+        if self.last_frame is not None:
+            elapsed = time.monotonic() - self.first_received
+            self._write_until(max(self.frames_written + 1, round(elapsed * self.fps)))
+        try:
+            self.process.stdin.close()
+        except BrokenPipeError:
+            pass
+        stderr = self.process.stderr.read().decode("utf-8", "replace").strip()
+        returncode = self.process.wait()
+        if returncode:
+            raise click.ClickException(
+                "MP4 encoding failed: {}".format(
+                    stderr or f"ffmpeg exited with status {returncode}"
+                )
+            )
+        if self.last_frame is None:
+            raise click.ClickException("MP4 encoding failed: no frames were captured")
+
+    def abort(self):
+        self.process.kill()
+        self.process.wait()
+
+
+class _VirtualTimeRecorder:
+    """
+    Records a page to a WebM file frame by frame against Playwright's fake
+    clock, for video --virtual-time.
+
+    Once started the page clock is paused, so time in the page only moves
+    forward when advance() is called. Each frame runs the page's timers and
+    requestAnimationFrame callbacks for one frame interval, then takes a
+    screenshot and pipes it to ffmpeg - so recording is limited by how fast
+    frames can be rendered rather than by the length of the video.
+    """
+
+    fps = 25
+    # Longest a virtual wait_for can wait, in seconds of page time
+    wait_limit = 30
+
+    def __init__(self, page, output):
+        self.page = page
+        self.output = output
+        self.frames = 0
+        self.elapsed_ms = 0
+        self.pending = 0.0
+        self.broken = False
+        self.process = None
+
+    def start(self):
+        # The installed clock keeps running in real time until it is paused,
+        # and Playwright refuses to pause at a time in the past - so pause at
+        # a whole second at least one second ahead of the page's clock
+        page_now = self.page.evaluate("Date.now()")
+        self.page.clock.pause_at(int(page_now // 1000) + 2)
+        args = (
+            [
+                "ffmpeg",
+                "-y",
+                "-loglevel",
+                "error",
+                "-f",
+                "image2pipe",
+                "-c:v",
+                "mjpeg",
+                "-framerate",
+                str(self.fps),
+                "-i",
+                "-",
+            ]
+            + VIDEO_EXPORT_ARGS["webm"]
+            + [self.output]
+        )
+        try:
+            self.process = subprocess.Popen(
+                args, stdin=subprocess.PIPE, stderr=subprocess.PIPE
+            )
+        except FileNotFoundError:
+            raise click.ClickException(
+                "Video encoding failed: ffmpeg is not installed or not on PATH"
+            )
+        self._capture()
+
+    def _capture(self):
+        frame = self.page.screenshot(type="jpeg", quality=90, scale="css")
+        if not self.broken:
+            try:
+                self.process.stdin.write(frame)
+            except (BrokenPipeError, ValueError):
+                # ffmpeg exited - close() reports the error
+                self.broken = True
+
+    def step(self):
+        "Run the page clock forward by one frame and capture that frame"
+        self.frames += 1
+        due_ms = round(self.frames * 1000 / self.fps)
+        self.page.clock.run_for(due_ms - self.elapsed_ms)
+        self.elapsed_ms = due_ms
+        self._capture()
+
+    def advance(self, seconds):
+        "Capture seconds worth of frames, carrying over any part of a frame"
+        frames, self.pending = divmod(self.pending + seconds * self.fps, 1)
+        for _ in range(int(frames)):
+            self.step()
+
+    def wait_until(self, check, description):
+        "Capture frames until check() returns True"
+        for _ in range(self.wait_limit * self.fps):
+            if check():
+                return
+            self.step()
+        raise click.ClickException(
+            f"Timed out after {self.wait_limit}s of virtual time waiting for "
+            f"{description}"
+        )
+
+    def close(self):
+        try:
+            self.process.stdin.close()
+        except BrokenPipeError:
+            pass
+        stderr = self.process.stderr.read().decode("utf-8", "replace").strip()
+        returncode = self.process.wait()
+        if returncode:
+            raise click.ClickException(
+                "Video encoding failed: {}".format(
+                    stderr or f"ffmpeg exited with status {returncode}"
+                )
+            )
+
+    def abort(self):
+        if self.process is not None:
+            self.process.kill()
+            self.process.wait()
+
+
+@cli.command()
+@click.argument("config", type=click.File(mode="r"))
+@click.option(
+    "-a",
+    "--auth",
+    type=click.File("r"),
+    help="Path to JSON authentication context file",
+)
+@scale_factor_options
+@click.option(
+    "--timeout",
+    type=int,
+    help="Wait this many milliseconds before failing",
+)
+# Hidden because will be removed if I release shot-scraper 2.0
+# See https://github.com/simonw/shot-scraper/issues/103
+@click.option(
+    "--fail-on-error", is_flag=True, help="Fail noisily on error", hidden=True
+)
+@click.option(
+    "noclobber",
+    "-n",
+    "--no-clobber",
+    is_flag=True,
+    help="Skip images that already exist",
+)
+@click.option(
+    "outputs",
+    "-o",
+    "--output",
+    help="Just take shots matching these output files",
+    multiple=True,
+)
+@browser_option
+@browser_args_option
+@launch_profile_option
+@user_agent_option
+@reduced_motion_option
+@log_console_option
+@skip_fail_options
+@silent_option
+@http_auth_options
+@click.option(
+    "leave_server",
+    "--leave-server",
+    is_flag=True,
+    help="Leave servers running when script finishes",
+)
+@click.option(
+    "--har",
+    is_flag=True,
+    help="Save all requests to trace.har file",
+)
+@click.option(
+    "--har-zip",
+    is_flag=True,
+    help="Save all requests to trace.har.zip file",
+)
+@click.option(
+    "--har-file",
+    type=click.Path(file_okay=True, writable=True, dir_okay=False),
+    help="Path to HAR file to save all requests",
+)
+@click.option(
+    "--recycle-after",
+    type=click.IntRange(min=1),
+    help="Relaunch the browser after this many shots",
+)
+@click.option(
+    "--recycle-memory",
+    type=click.IntRange(min=1),
+    help="Relaunch the browser once its processes use more than this many MB",
+)
+@click.option(
+    "--crash-retries",
+    type=click.IntRange(min=0),
+    default=2,
+    show_default=True,
+    help="Relaunch the browser and retry an entry this many times if it crashes",
+)
+@har_recording_options
+@python_worker_option
+@resolve_options
+@replay_har_options
+def multi(
+    config,
+    auth,
+    retina,
+    scale_factor,
+    timeout,
+    fail_on_error,
+    noclobber,
+    outputs,
+    browser,
+    browser_args,
+    launch_profile,
+    user_agent,
     reduced_motion,
     log_console,
     skip,
@@ -826,6 +1988,17 @@ def multi(
     har,
     har_zip,
     har_file,
+    recycle_after,
+    recycle_memory,
+    crash_retries,
+    har_content,
+    har_mode,
+    har_url_filter,
+    python_worker,
+    resolve,
+    resolve_file,
+    replay_har,
+    replay_har_miss,
 ):
     """
     Take multiple screenshots, defined by a YAML file
@@ -844,9 +2017,16 @@ def multi(
     For full YAML syntax documentation, see:
     https://shot-scraper.datasette.io/en/stable/multi.html
     """
+    if (har_content or har_mode or har_url_filter) and not (har or har_zip or har_file):
+        raise click.ClickException(
+            "--har-content, --har-mode and --har-url-filter require --har, "
+            "--har-zip or --har-file"
+        )
     if (har or har_zip) and not har_file:
         har_file = filename_for_url(
-            "trace", ext="har.zip" if har_zip else "har", file_exists=os.path.exists
+            "trace",
+            ext="har.zip" if har_zip else "har",
+            file_exists=os.path.exists,
         )
 
     scale_factor = normalize_scale_factor(retina, scale_factor)
@@ -864,19 +2044,48 @@ def multi(
         shots = []
     if not isinstance(shots, list):
         raise click.ClickException("YAML file must contain a list")
-    with sync_playwright() as p:
-        context, browser_obj = _browser_context(
+    # Host mappings from resolve: keys apply to the browser for the whole run
+    resolve = _host_mapping(resolve, resolve_file)
+    for shot in shots:
+        if shot.get("resolve"):
+            if not isinstance(shot["resolve"], dict):
+                raise click.ClickException(
+                    "resolve: must be a mapping of hosts to addresses"
+                )
+            try:
+                resolve.update(
+                    parse_host_mapping(
+                        f"{host}={address}" for host, address in shot["resolve"].items()
+                    )
+                )
+            except ValueError as ex:
+                raise click.ClickException(str(ex))
+    if recycle_memory and _process_tree_rss(os.getpid()) is None:
+        raise click.ClickException("--recycle-memory is not supported on this platform")
+    storage_state = json.load(auth) if auth else None
+    # sh: and python: steps can create files part way through, so check the
+    # disk for each new candidate name as well as tracking allocated names
+    filename_allocator = FilenameAllocator(file_exists=os.path.exists)
+    with _python_worker(python_worker), sync_playwright() as p:
+        session = _BrowserSession(
             p,
-            auth,
+            har_file=har_file,
+            record_har_content=har_content,
+            record_har_mode=har_mode,
+            record_har_url_filter=har_url_filter,
+            storage_state=storage_state,
+            resolve=resolve,
+            replay_har=replay_har,
+            replay_har_miss=replay_har_miss,
             scale_factor=scale_factor,
             browser=browser,
             browser_args=browser_args,
+            launch_profile=launch_profile,
             user_agent=user_agent,
             timeout=timeout,
             reduced_motion=reduced_motion,
             auth_username=auth_username,
             auth_password=auth_password,
-            record_har_path=har_file or None,
         )
         try:
             for shot in shots:
@@ -902,33 +2111,254 @@ def multi(
                     if server_needs_ready_check:
                         _wait_for_server(
                             server_processes,
-                            url_or_file_path(shot["url"], _check_and_absolutize),
+                            apply_host_mapping(
+                                url_or_file_path(shot["url"], _check_and_absolutize),
+                                resolve,
+                            ),
                         )
                         server_needs_ready_check = False
-                    try:
-                        take_shot(
-                            context,
-                            shot,
-                            log_console=log_console,
-                            skip=skip,
-                            fail=fail,
-                            silent=silent,
+                    recycle_reason = session.recycle_reason(
+                        recycle_after,
+                        recycle_memory,
+                        # Only count the browser, not servers or the Python worker
+                        exclude_pids={process.pid for process, _ in server_processes}
+                        | _python_worker_pids(),
+                    )
+                    if recycle_reason:
+                        session.relaunch(recycle_reason, silent=silent)
+                    if (
+                        not shot.get("skip_shot")
+                        and not str(shot.get("output") or "").strip()
+                    ):
+                        # Pick the default filename once so retries reuse it
+                        shot["output"] = filename_for_url(
+                            url_or_file_path(shot["url"], _check_and_absolutize),
+                            ext="png",
+                            allocator=filename_allocator,
                         )
-                    except TimeoutError as e:
-                        if fail or fail_on_error:
-                            raise click.ClickException(str(e))
-                        else:
-                            click.echo(str(e), err=True)
-                            continue
+                    attempts = 0
+                    while True:
+                        try:
+                            take_shot(
+                                session.context,
+                                shot,
+                                log_console=log_console,
+                                skip=skip,
+                                fail=fail,
+                                silent=silent,
+                            )
+                        except TimeoutError as e:
+                            if fail or fail_on_error:
+                                raise click.ClickException(str(e))
+                            else:
+                                click.echo(str(e), err=True)
+                        except Error as e:
+                            if not session.crashed(e):
+                                raise
+                            # Always relaunch, so later entries can continue
+                            session.relaunch(
+                                "browser crashed: {}".format(
+                                    e.message.strip().split("\n")[0]
+                                ),
+                                silent=silent,
+                            )
+                            if attempts < crash_retries:
+                                attempts += 1
+                                continue
+                            message = (
+                                "Browser crashed {} times taking shot of '{}'".format(
+                                    attempts + 1, shot["url"]
+                                )
+                            )
+                            if fail or fail_on_error:
+                                raise click.ClickException(message)
+                            click.echo(message, err=True)
+                            break
+                        session.shot_finished()
+                        break
         finally:
-            context.close()
-            browser_obj.close()
+            session.close()
             if server_processes:
                 _cleanup_servers(server_processes, leave_server)
             if har_file and not silent:
                 click.echo(f"Wrote to HAR file: {har_file}", err=True)
 
 
+# Playwright error messages that mean the browser or a renderer has died
+CRASH_MESSAGES = (
+    "Target crashed",
+    "Page crashed",
+    "Target page, context or browser has been closed",
+    "Browser has been closed",
+    "Browser closed",
+    "Connection closed",
+)
+
+
+class _BrowserSession:
+    """
+    The browser and context used by a multi run, which can be closed and
+    relaunched between entries. When recording a HAR each launch records
+    to its own segment file, and the segments are merged on close.
+    """
+
+    def __init__(self, p, har_file=None, **context_kwargs):
+        self.p = p
+        self.har_file = har_file
+        self.context_kwargs = context_kwargs
+        self.har_segments = []
+        self.launch()
+
+    def launch(self):
+        record_har_path = None
+        if self.har_file:
+            record_har_path = _har_segment_path(self.har_file, len(self.har_segments))
+            self.har_segments.append(record_har_path)
+        self.context, self.browser_obj = _browser_context(
+            self.p, None, record_har_path=record_har_path, **self.context_kwargs
+        )
+        self.shots_since_launch = 0
+
+    def shot_finished(self):
+        self.shots_since_launch += 1
+        # Pages are not reused between entries, so close them rather than
+        # letting them accumulate in the context
+        for page in self.context.pages:
+            try:
+                page.close()
+            except Error:
+                pass
+
+    def crashed(self, error):
+        "Did this error come from a crashed browser or page renderer?"
+        if not self.browser_obj.is_connected():
+            return True
+        return any(message in error.message for message in CRASH_MESSAGES)
+
+    def recycle_reason(self, recycle_after=None, recycle_memory=None, exclude_pids=()):
+        if not self.shots_since_launch:
+            return None
+        if recycle_after and self.shots_since_launch >= recycle_after:
+            return f"{self.shots_since_launch} shots since launch"
+        if recycle_memory:
+            rss = _process_tree_rss(os.getpid(), exclude_pids)
+            if rss is not None and rss > recycle_memory * 1024 * 1024:
+                return "browser memory {} MB exceeds {} MB".format(
+                    rss // (1024 * 1024), recycle_memory
+                )
+        return None
+
+    def relaunch(self, reason, silent=False):
+        if not silent:
+            click.echo(f"Relaunching browser: {reason}", err=True)
+        self._close_browser()
+        self.launch()
+
+    def close(self):
+        self._close_browser()
+        if len(self.har_segments) > 1:
+            # A browser that crashed may not have written its segment
+            har_segments = [path for path in self.har_segments if os.path.exists(path)]
+            if har_segments:
+                _merge_har_files(har_segments, self.har_file)
+
+    def _close_browser(self):
+        try:
+            self.context.close()
+        except Error:
+            pass
+        self.browser_obj.close()
+
+
+def _har_segment_path(har_file, index):
+    if not index:
+        return har_file
+    har_file = str(har_file)
+    for ext in (".har.zip", ".har", ".zip"):
+        if har_file.endswith(ext):
+            return f"{har_file[: -len(ext)]}.part{index}{ext}"
+    return f"{har_file}.part{index}"
+
+
+def _merge_har_files(har_paths, output):
+    """Combine the pages and entries of several HAR files into output."""
+    merged = None
+
+    def merge(har_data):
+        nonlocal merged
+        if merged is None:
+            merged = har_data
+            return
+        log = merged.setdefault("log", {})
+        for key in ("pages", "entries"):
+            log.setdefault(key, []).extend(har_data.get("log", {}).get(key, []))
+
+    if zipfile.is_zipfile(har_paths[0]):
+        tmp_output = f"{output}.tmp"
+        names_written = set()
+        with zipfile.ZipFile(tmp_output, "w", zipfile.ZIP_DEFLATED) as out_zip:
+            for har_path in har_paths:
+                with zipfile.ZipFile(har_path) as zf:
+                    for name in zf.namelist():
+                        if name == "har.har":
+                            with zf.open(name) as har_file:
+                                merge(json.load(har_file))
+                        elif name not in names_written:
+                            # Resources are named by content hash, so the
+                            # same name means the same content
+                            names_written.add(name)
+                            with zf.open(name) as src, out_zip.open(name, "w") as dest:
+                                shutil.copyfileobj(src, dest)
+            out_zip.writestr("har.har", json.dumps(merged))
+        os.replace(tmp_output, output)
+    else:
+        for har_path in har_paths:
+            with open(har_path) as har_file:
+                merge(json.load(har_file))
+        with open(output, "w") as har_file:
+            json.dump(merged, har_file)
+    for har_path in har_paths:
+        if str(har_path) != str(output):
+            os.remove(har_path)
+
+
+def _process_tree_rss(root_pid, exclude_pids=()):
+    """
+    Total resident memory in bytes of the processes descended from root_pid,
+    skipping the process trees rooted at exclude_pids.
+
+    Returns None if /proc is not available to read process information from.
+    """
+    proc = pathlib.Path("/proc")
+    if not (proc / "self" / "status").exists():
+        return None
+    children = {}
+    for stat_path in proc.glob("[0-9]*/stat"):
+        try:
+            stat = stat_path.read_text()
+        except OSError:
+            continue
+        # The command name in the second field can contain spaces and brackets
+        fields = stat[stat.rindex(")") + 2 :].split()
+        children.setdefault(int(fields[1]), []).append(int(stat_path.parent.name))
+    total = 0
+    pending = list(children.get(root_pid, []))
+    while pending:
+        pid = pending.pop()
+        if pid in exclude_pids:
+            continue
+        pending.extend(children.get(pid, []))
+        try:
+            status = (proc / str(pid) / "status").read_text()
+        except OSError:
+            continue
+        for line in status.splitlines():
+            if line.startswith("VmRSS:"):
+                total += int(line.split()[1]) * 1024
+                break
+    return total
+
+
 @cli.command()
 @click.argument("url")
 @click.option(
@@ -954,6 +2384,7 @@ def multi(
 @skip_fail_options
 @bypass_csp_option
 @http_auth_options
+@resolve_options
 def accessibility(
     url,
     auth,
@@ -967,6 +2398,8 @@ def accessibility(
     bypass_csp,
     auth_username,
     auth_password,
+    resolve,
+    resolve_file,
 ):
     """
     Dump the Chromium accessibility tree for the specifed page
@@ -981,6 +2414,7 @@ def accessibility(
         context, browser_obj = _browser_context(
             p,
             auth,
+            resolve=_host_mapping(resolve, resolve_file),
             timeout=timeout,
             bypass_csp=bypass_csp,
             auth_username=auth_username,
@@ -1001,7 +2435,7 @@ def accessibility(
 
 
 @cli.command()
-@click.argument("url")
+@click.argument("url", required=False)
 @click.option("zip_", "-z", "--zip", is_flag=True, help="Save as a .har.zip file")
 @click.option(
     "extract",
@@ -1037,6 +2471,22 @@ def accessibility(
 @skip_fail_options
 @bypass_csp_option
 @http_auth_options
+@resolve_options
+@har_recording_options
+@har_extract_options
+@click.option(
+    "urls_file",
+    "--urls",
+    type=click.File("r"),
+    help="File containing URLs to record, one per line - use - for stdin",
+)
+@click.option(
+    "--concurrency",
+    type=click.IntRange(min=1),
+    default=1,
+    show_default=True,
+    help="Number of --urls to record at once",
+)
 def har(
     url,
     zip_,
@@ -1054,6 +2504,22 @@ def har(
     bypass_csp,
     auth_username,
     auth_password,
+    resolve,
+    resolve_file,
+    har_content,
+    har_mode,
+    har_url_filter,
+    workers,
+    dedupe,
+    manifest,
+    content_types,
+    url_globs,
+    min_size,
+    max_size,
+    statuses,
+    first_party,
+    urls_file,
+    concurrency,
 ):
     """
     Record a HAR file for the specified page
@@ -1074,8 +2540,63 @@ def har(
         shot-scraper har https://datasette.io/ -x -o /tmp/datasette
 
     This creates /tmp/datasette.har and extracts resources to /tmp/datasette/
+
+    Use --urls to record a list of URLs, read from a file or from standard
+    input, using a single browser. Each URL is recorded to its own HAR file,
+    or use -o to combine them into one:
+
+        shot-scraper har --urls urls.txt --concurrency 4 -o audit.har.zip
+
+    Use --har-content omit to record the requests without their response
+    bodies, for a much smaller file.
     """
     javascript = _resolve_javascript(javascript, js_file)
+    entry_filter = _entry_filter(
+        content_types, url_globs, min_size, max_size, statuses, first_party
+    )
+    if skip and fail:
+        raise click.ClickException("--skip and --fail cannot be used together")
+    if urls_file is not None:
+        if url:
+            raise click.UsageError("Pass either a URL or --urls, not both")
+        _record_har_batch(
+            urls_file,
+            output,
+            zip_=zip_,
+            concurrency=concurrency,
+            har_options=dict(
+                content=har_content, mode=har_mode, url_filter=har_url_filter
+            ),
+            launch_options=dict(
+                auth=auth,
+                resolve=_host_mapping(resolve, resolve_file),
+                bypass_csp=bypass_csp,
+                auth_username=auth_username,
+                auth_password=auth_password,
+            ),
+            page_options=dict(
+                timeout=timeout,
+                wait=wait,
+                wait_for=wait_for,
+                javascript=javascript,
+                log_console=log_console,
+                skip=skip,
+                fail=fail,
+            ),
+            extract_options=(
+                dict(
+                    workers=workers,
+                    dedupe=dedupe,
+                    manifest=manifest,
+                    entry_filter=entry_filter,
+                )
+                if extract
+                else None
+            ),
+        )
+        return
+    if not url:
+        raise click.UsageError("Missing argument 'URL'")
     if output is None:
         output = filename_for_url(
             url, ext="har.zip" if zip_ else "har", file_exists=os.path.exists
@@ -1089,11 +2610,15 @@ def har(
         context, browser_obj = _browser_context(
             p,
             auth,
+            resolve=_host_mapping(resolve, resolve_file),
             timeout=timeout,
             bypass_csp=bypass_csp,
             auth_username=auth_username,
             auth_password=auth_password,
             record_har_path=str(output),
+            record_har_content=har_content,
+            record_har_mode=har_mode,
+            record_har_url_filter=har_url_filter,
         )
         page = context.new_page()
         if log_console:
@@ -1113,64 +2638,604 @@ def har(
         browser_obj.close()
 
     if extract:
-        _extract_har_resources(output)
+        _extract_har_resources(
+            output,
+            workers=workers,
+            dedupe=dedupe,
+            manifest=manifest,
+            entry_filter=entry_filter,
+        )
 
 
-def _extract_har_resources(har_path):
-    """Extract resources from a HAR file into a directory."""
-    har_path = pathlib.Path(har_path)
+def _record_har_batch(
+    urls_file,
+    output,
+    zip_,
+    concurrency,
+    launch_options,
+    page_options,
+    extract_options=None,
+    har_options=None,
+):
+    """
+    Record HAR files for every URL listed in urls_file.
+
+    Each URL gets its own browser context, so its own HAR file. If output
+    is set those files are combined into that single HAR file at the end.
+    """
+    urls = [
+        url_or_file_path(line.strip(), _check_and_absolutize)
+        for line in urls_file
+        if line.strip() and not line.strip().startswith("#")
+    ]
+    if not urls:
+        raise click.ClickException("No URLs to record")
+    ext = "har.zip" if zip_ else "har"
+    if output is not None and not (
+        output.endswith(".har") or output.endswith(".har.zip")
+    ):
+        output = f"{output}.{ext}"
+    if output is not None:
+        ext = "har.zip" if output.endswith(".har.zip") else "har"
+    # Filenames are allocated up front, in order, so repeated URLs are
+    # recorded to separate files
+    allocator = FilenameAllocator(".")
+    har_paths = []
+    for index, url in enumerate(urls):
+        if output is not None:
+            har_path = _har_segment_path(output, index + 1)
+        else:
+            har_path = filename_for_url(url, ext=ext, allocator=allocator)
+        har_paths.append(har_path)
+
+    try:
+        recorded = asyncio.run(
+            _record_hars(
+                list(zip(urls, har_paths)),
+                concurrency,
+                launch_options,
+                har_options=har_options,
+                **page_options,
+            )
+        )
+        if output is not None:
+            if recorded:
+                _merge_har_files(recorded, output)
+                click.echo(f"Wrote to HAR file: {output}", err=True)
+            recorded = [output] if recorded else []
+    finally:
+        if output is not None:
+            # Segments are removed once merged, this covers any errors
+            for har_path in har_paths:
+                pathlib.Path(har_path).unlink(missing_ok=True)
+    if extract_options is not None:
+        for har_path in recorded:
+            _extract_har_resources(har_path, **extract_options)
+
+
+async def _record_hars(
+    jobs,
+    concurrency,
+    launch_options,
+    har_options=None,
+    timeout=None,
+    wait=None,
+    wait_for=None,
+    javascript=None,
+    log_console=False,
+    skip=False,
+    fail=False,
+):
+    """
+    Record each (url, har_path) in jobs using one shared browser, with up to
+    concurrency pages loading at once. Returns the paths that were written.
+
+    If a page fails to load or its javascript fails, the error is shown and
+    its HAR file is removed, unless fail is set in which case the whole run
+    stops.
+    """
+    browser_type, launch_kwargs, context_kwargs = _browser_launch_options(
+        **launch_options
+    )
+    semaphore = asyncio.Semaphore(concurrency)
+    recorded = {}
+
+    async def record(url, har_path):
+        async with semaphore:
+            context = await browser_obj.new_context(
+                **_har_recording_args(har_path, **(har_options or {})),
+                **context_kwargs,
+            )
+            if timeout:
+                context.set_default_timeout(timeout)
+            skipped = False
+            try:
+                page = await context.new_page()
+                if log_console:
+                    page.on("console", console_log)
+                response = await page.goto(url)
+                if response is not None and str(response.status)[0] in ("4", "5"):
+                    if skip:
+                        click.echo(
+                            f"{response.status} error for {url}, skipping", err=True
+                        )
+                        skipped = True
+                        return
+                    elif fail:
+                        raise click.ClickException(f"{response.status} error for {url}")
+                if wait:
+                    await asyncio.sleep(wait / 1000)
+                if javascript:
+                    await page.evaluate(javascript)
+                if wait_for:
+                    await page.wait_for_function(wait_for)
+            except Error as ex:
+                # Includes TimeoutError
+                message = str(ex) if isinstance(ex, TimeoutError) else ex.message
+                if fail:
+                    raise click.ClickException(message)
+                click.echo(f"Error recording '{url}': {message}", err=True)
+                skipped = True
+                return
+            finally:
+                # Closing the context writes the HAR file
+                await context.close()
+                if skipped:
+                    pathlib.Path(har_path).unlink(missing_ok=True)
+            recorded[har_path] = url
+            click.echo(f"HAR of '{url}' written to '{har_path}'", err=True)
+
+    async with async_playwright() as p:
+        browser_obj = await getattr(p, browser_type).launch(**launch_kwargs)
+        tasks = [asyncio.ensure_future(record(url, path)) for url, path in jobs]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+        finally:
+            await browser_obj.close()
+    return [har_path for _, har_path in jobs if har_path in recorded]
+
+
+@cli.command(name="har-extract")
+@click.argument(
+    "har_file",
+    type=click.Path(exists=True, file_okay=True, dir_okay=False),
+)
+@click.option(
+    "-o",
+    "--output",
+    type=click.Path(file_okay=False, dir_okay=True, writable=True),
+    help="Directory to extract resources into",
+)
+@har_extract_options
+def har_extract(
+    har_file,
+    output,
+    workers,
+    dedupe,
+    manifest,
+    content_types,
+    url_globs,
+    min_size,
+    max_size,
+    statuses,
+    first_party,
+):
+    """
+    Extract resources from an existing HAR file into a directory
+
+    Usage:
+
+        shot-scraper har-extract datasette-io.har
+
+    This extracts resources to datasette-io/ - use -o to specify a different directory:
+
+        shot-scraper har-extract trace.har.zip -o /tmp/trace
+
+    Use --dedupe to store each distinct resource once, with hardlinks for
+    any duplicates.
+
+    Use --manifest to write a manifest.db SQLite index of the resources,
+    which can be queried using 'shot-scraper har-query'.
+
+    Filter options such as --content-type and --status can be used to only
+    extract some of the resources:
+
+        shot-scraper har-extract trace.har --content-type 'image/*' --status 2xx
+    """
+    _extract_har_resources(
+        har_file,
+        extract_dir=output,
+        workers=workers,
+        dedupe=dedupe,
+        manifest=manifest,
+        entry_filter=_entry_filter(
+            content_types, url_globs, min_size, max_size, statuses, first_party
+        ),
+    )
 
-    # Determine if it's a zip file
-    is_zip = zipfile.is_zipfile(har_path)
+
+@cli.command(name="har-query")
+@click.argument("manifest", type=click.Path(exists=True))
+@click.argument("sql", default="select * from resources")
+@click.option("--csv", "csv_", is_flag=True, help="Output as CSV")
+def har_query(manifest, sql, csv_):
+    """
+    Run a SQL query against a manifest created by 'har-extract --manifest'
+
+    Pass the manifest.db file or the directory containing it, or a database
+    created by 'har-import':
+
+        shot-scraper har-query datasette-io "select path, size from resources
+        where mime_type like '%javascript%' and size > 500000"
+
+    Results are output as JSON, or use --csv for CSV. The resources table has
+    one row per HAR entry, with these columns:
+
+    id, url, method, status, mime_type, path, sha256, size, started, time,
+    blocked, dns, connect, ssl, send, wait, receive
+    """
+    manifest = pathlib.Path(manifest)
+    if manifest.is_dir():
+        manifest = manifest / MANIFEST_FILENAME
+        if not manifest.exists():
+            raise click.ClickException(
+                f"No {MANIFEST_FILENAME} found in that directory"
+            )
+    try:
+        with closing(
+            sqlite3.connect(f"{manifest.resolve().as_uri()}?mode=ro", uri=True)
+        ) as conn:
+            cursor = conn.execute(sql)
+            columns = [d[0] for d in cursor.description or ()]
+            rows = cursor.fetchall()
+    except sqlite3.Error as ex:
+        raise click.ClickException(str(ex))
+    if csv_:
+        writer = csv.writer(sys.stdout)
+        writer.writerow(columns)
+        writer.writerows(rows)
+    else:
+        click.echo(json.dumps([dict(zip(columns, row)) for row in rows], indent=2))
+
+
+@cli.command(name="har-import")
+@click.argument("database", type=click.Path(file_okay=True, dir_okay=False))
+@click.argument(
+    "har_files",
+    nargs=-1,
+    required=True,
+    type=click.Path(exists=True, file_okay=True, dir_okay=False),
+)
+@click.option("--run", help="Import into a run with this name")
+@click.option("--bodies", is_flag=True, help="Store response bodies as well")
+@click.option(
+    "--replace", is_flag=True, help="Replace runs that have already been imported"
+)
+def har_import(database, har_files, run, bodies, replace):
+    """
+    Import HAR files into a SQLite database
+
+    Usage:
+
+        shot-scraper har-import hars.db nightly/*.har.zip --run 2025-01-31
+
+    Each HAR file is imported as its own run, named after its path, unless
+    --run is used to import all of the files into a single named run.
+
+    Use --bodies to also store the response bodies - each distinct body is
+    stored once, in the bodies table.
+
+    Query the database using 'shot-scraper har-query'.
+    """
+    db = HarDatabase(database)
+    try:
+        run_id = db.start_run(run, replace) if run else None
+        for har_file in har_files:
+            count = db.import_har(
+                har_file,
+                run_id if run else db.start_run(har_file, replace),
+                bodies=bodies,
+            )
+            click.echo(
+                f"Imported {count} request{'' if count == 1 else 's'} from {har_file}",
+                err=True,
+            )
+    except HarError as ex:
+        raise click.ClickException(str(ex))
+    finally:
+        db.close()
+
+
+@cli.command(name="har-summary")
+@click.argument(
+    "har_file",
+    type=click.Path(exists=True, file_okay=True, dir_okay=False),
+)
+@click.option(
+    "--top",
+    type=click.IntRange(min=0),
+    default=10,
+    show_default=True,
+    help="Number of largest and slowest requests to show",
+)
+@click.option("json_", "--json", is_flag=True, help="Output as JSON")
+def har_summary(har_file, top, json_):
+    """
+    Summarize the performance of the requests in a HAR file
+
+    Usage:
+
+        shot-scraper har-summary datasette-io.har
+
+    Shows totals by domain and content type, the largest and slowest
+    requests, an estimate of the critical path through the request
+    waterfall and how many responses can be cached. Sizes are transfer
+    sizes where the HAR records them.
+    """
+    try:
+        summary = summarize_har(har_file, top=top)
+    except HarError as ex:
+        raise click.ClickException(str(ex))
+    if json_:
+        click.echo(json.dumps(summary, indent=2))
+        return
+    click.echo(
+        "{}: {:,} requests, {:,} bytes, {:,.0f} ms".format(
+            har_file, summary["requests"], summary["bytes"], summary["duration_ms"]
+        )
+    )
+
+    def requests(count):
+        return "{:>6,} request{}".format(count, " " if count == 1 else "s")
+
+    def section(title, rows):
+        if rows:
+            click.echo(f"\n{title}:")
+            for row in rows:
+                click.echo("  " + row)
+
+    section(
+        "By domain",
+        [
+            "{:>12,} bytes {}  {}".format(
+                d["bytes"], requests(d["requests"]), d["domain"]
+            )
+            for d in summary["domains"]
+        ],
+    )
+    section(
+        "By content type",
+        [
+            "{:>12,} bytes {}  {}".format(
+                t["bytes"], requests(t["requests"]), t["content_type"]
+            )
+            for t in summary["content_types"]
+        ],
+    )
+    section(
+        "Largest requests",
+        ["{:>12,} bytes  {}".format(r["bytes"], r["url"]) for r in summary["largest"]],
+    )
+    section(
+        "Slowest requests",
+        [
+            "{:>12,.0f} ms     {}".format(r["time_ms"], r["url"])
+            for r in summary["slowest"]
+        ],
+    )
+    critical_path = summary["critical_path"]
+    section(
+        "Critical path (estimated): {:,.0f} ms across {} request{}".format(
+            critical_path["duration_ms"],
+            len(critical_path["requests"]),
+            "" if len(critical_path["requests"]) == 1 else "s",
+        ),
+        [
+            "{:>8,.0f} ms +{:>8,.0f} ms  {}".format(
+                r["start_ms"], r["time_ms"], r["url"]
+            )
+            for r in critical_path["requests"]
+        ],
+    )
+    section(
+        "Cacheability of GET responses",
+        [
+            "{:>12,} bytes {}  {}".format(
+                stats["bytes"], requests(stats["requests"]), category
+            )
+            for category, stats in summary["cacheability"].items()
+            if stats["requests"]
+        ],
+    )
+
+
+def _extract_har_resources(
+    har_path,
+    extract_dir=None,
+    workers=1,
+    dedupe=False,
+    manifest=False,
+    entry_filter=None,
+):
+    """
+    Extract resources from a HAR file into a directory.
+
+    Filenames are allocated on this thread in entry order, so the same HAR
+    always produces the same filenames. Decoding and writing the content
+    happens on a pool of worker threads.
+
+    With dedupe=True, files with the same content as an earlier file are
+    replaced by a hardlink to that file.
+
+    With manifest=True, a manifest.db SQLite database is written to the
+    directory with a row for every entry in the HAR.
+
+    entry_filter is an optional EntryFilter - entries it does not match are
+    skipped without decoding their content, but are still recorded in the
+    manifest.
+    """
+    har_path = pathlib.Path(har_path)
 
     # Determine extract directory name (parallel to har file)
-    if str(har_path).endswith(".har.zip"):
+    if extract_dir is not None:
+        extract_dir = pathlib.Path(extract_dir)
+    elif str(har_path).endswith(".har.zip"):
         extract_dir = har_path.parent / har_path.name.replace(".har.zip", "")
     else:
         extract_dir = har_path.parent / har_path.name.replace(".har", "")
 
     # Create the extract directory
-    extract_dir.mkdir(exist_ok=True)
+    extract_dir.mkdir(parents=True, exist_ok=True)
+
+    # Only names allocated during this extraction count as duplicates, so
+    # extracting the same HAR again overwrites the same files
+    allocator = FilenameAllocator()
+
+    manifest_db = None
+    if manifest:
+        manifest_db = Manifest(extract_dir / MANIFEST_FILENAME)
+        allocator.reserve(MANIFEST_FILENAME)
+
+    # The manifest is only used from this thread, so rows are updated here
+    # as each write completes
+    def finish(future, row_id):
+        written = future.result()
+        if manifest_db is not None and written is not None:
+            file_path, sha256, size = written
+            manifest_db.set_file(row_id, file_path.name, sha256, size)
+
+    # Entries are parsed one at a time, with the zip file (if any) kept open
+    # for _file references. At most workers * 4 writes are queued at once so
+    # decoded content does not pile up in memory.
+    max_pending = workers * 4
+    pending = {}
+    deduplicator = _ResourceDeduplicator() if dedupe else None
+    try:
+        with (
+            open_har(har_path) as (entries, zip_file),
+            ThreadPoolExecutor(max_workers=workers) as executor,
+        ):
+            for entry in entries:
+                row_id = manifest_db.add(entry) if manifest_db is not None else None
+                write = _extract_har_entry(
+                    entry,
+                    extract_dir,
+                    allocator,
+                    zip_file,
+                    deduplicator,
+                    hash_content=manifest,
+                    entry_filter=entry_filter,
+                    har_dir=har_path.parent,
+                )
+                if write is None:
+                    continue
+                if len(pending) >= max_pending:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        finish(future, pending.pop(future))
+                pending[executor.submit(write)] = row_id
+            for future, row_id in pending.items():
+                finish(future, row_id)
+    except HarError as ex:
+        raise click.ClickException(str(ex))
+    finally:
+        if manifest_db is not None:
+            manifest_db.close()
 
-    # Track existing files to handle duplicates
-    existing_files = set()
+    click.echo(f"Extracted resources to: {extract_dir}", err=True)
+    if deduplicator is not None:
+        click.echo(
+            "Linked {} duplicate file{}, saving {:,} bytes".format(
+                deduplicator.linked,
+                "" if deduplicator.linked == 1 else "s",
+                deduplicator.bytes_saved,
+            ),
+            err=True,
+        )
 
-    def file_exists_in_dir(filename):
-        return filename in existing_files
 
-    # Load the HAR data (and keep zip file open if needed)
-    if is_zip:
-        with zipfile.ZipFile(har_path) as zf:
-            with zf.open("har.har") as har_file:
-                har_data = json.load(har_file)
+class _ResourceDeduplicator:
+    """
+    Tracks the content hashes of extracted files, so content that has
+    already been written is hardlinked to the earlier file instead of
+    being written again.
 
-            # Extract each entry (with zip file open for _file references)
-            for entry in har_data.get("log", {}).get("entries", []):
-                _extract_har_entry(
-                    entry, extract_dir, existing_files, file_exists_in_dir, zf
-                )
-    else:
-        with open(har_path) as har_file:
-            har_data = json.load(har_file)
+    Shared between extraction worker threads.
+    """
 
-        # Extract each entry
-        for entry in har_data.get("log", {}).get("entries", []):
-            _extract_har_entry(
-                entry, extract_dir, existing_files, file_exists_in_dir, None
-            )
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.paths = {}
+        self.linked = 0
+        self.bytes_saved = 0
 
-    click.echo(f"Extracted resources to: {extract_dir}", err=True)
+    def link(self, file_path, digest, size):
+        """
+        Hardlink file_path to an earlier file with the same content.
 
+        Returns False if there is no such file, or if the filesystem does
+        not support hardlinks - the content then has to be written.
+        """
+        with self.lock:
+            original = self.paths.get(digest)
+        if original is None or original == file_path:
+            return False
+        # Link to a temporary name first so an existing file_path is
+        # replaced rather than left missing
+        tmp_path = file_path.with_name(f".{file_path.name}.partial")
+        tmp_path.unlink(missing_ok=True)
+        try:
+            os.link(original, tmp_path)
+        except OSError:
+            return False
+        os.replace(tmp_path, file_path)
+        with self.lock:
+            self.linked += 1
+            self.bytes_saved += size
+        return True
+
+    def add(self, file_path, digest):
+        "Record that file_path has been written with this content"
+        with self.lock:
+            self.paths.setdefault(digest, file_path)
+
+
+def _extract_har_entry(
+    entry,
+    extract_dir,
+    allocator,
+    zip_file,
+    deduplicator=None,
+    hash_content=False,
+    entry_filter=None,
+    har_dir=None,
+):
+    """
+    Allocate a filename for a single HAR entry.
+
+    Returns a function that writes the entry's content to that file, or
+    None if the entry has no content to extract or does not match the
+    entry_filter. That function returns a (file_path, sha256, size) tuple,
+    or None if nothing was written. The sha256 is only calculated if
+    hash_content is True or a deduplicator is provided.
 
-def _extract_har_entry(entry, extract_dir, existing_files, file_exists_fn, zip_file):
-    """Extract a single HAR entry to the extract directory."""
+    Content attached as a separate file is read from zip_file for a
+    .har.zip, or from har_dir for a plain .har file.
+    """
+    hash_content = hash_content or deduplicator is not None
     request = entry.get("request", {})
     response = entry.get("response", {})
     content = response.get("content", {})
 
     url = request.get("url", "")
     if not url:
-        return
+        return None
+    if entry_filter is not None:
+        entry_filter.observe(url)
 
     # Get content-type from response headers
     content_type = None
@@ -1184,35 +3249,129 @@ def _extract_har_entry(entry, extract_dir, existing_files, file_exists_fn, zip_f
     encoding = content.get("encoding", "")
     file_ref = content.get("_file", "")
 
-    data = None
+    # Content is copied to disk in chunks so large bodies are never held
+    # in memory in full
+    if file_ref and zip_file:
+        # Content is stored as a separate file in the zip
+        try:
+            info = zip_file.getinfo(file_ref)
+        except KeyError:
+            return None
+        if not info.file_size:
+            return None
+        size = info.file_size
+        if (
+            info.compress_type == zipfile.ZIP_STORED
+            and zip_file.filename
+            and not hash_content
+        ):
+            # Uncompressed members are copied straight from the archive
+            chunks = None
+        else:
+
+            def chunks():
+                with zip_file.open(info) as f:
+                    yield from iter(lambda: f.read(HAR_CHUNK_SIZE), b"")
+
+    elif file_ref and har_dir is not None:
+        # Content was attached as a separate file alongside a .har file
+        attached_path = attached_file_path(har_dir, file_ref)
+        if attached_path is None:
+            return None
+        try:
+            size = os.stat(attached_path).st_size
+        except OSError:
+            return None
+        if not size:
+            return None
+
+        def chunks():
+            with open(attached_path, "rb") as f:
+                yield from iter(lambda: f.read(HAR_CHUNK_SIZE), b"")
 
-    if file_ref and zip_file:
-        # Content is stored as a separate file in the zip
-        try:
-            with zip_file.open(file_ref) as f:
-                data = f.read()
-        except KeyError:
-            pass
     elif text:
         # Decode the content from text field
         if encoding == "base64":
-            try:
-                data = base64.b64decode(text)
-            except Exception:
-                return
+            # Checked before a filename is allocated, so invalid content does
+            # not use up a name
+            size = base64_decoded_size(text)
+            if not size:
+                return None
+
+            def chunks():
+                return iter_base64_chunks(text, HAR_CHUNK_SIZE)
+
         else:
-            data = text.encode("utf-8")
+            size = len(text) if text.isascii() else len(text.encode("utf-8"))
 
-    if not data:
-        return
+            def chunks():
+                for start in range(0, len(text), HAR_CHUNK_SIZE):
+                    yield text[start : start + HAR_CHUNK_SIZE].encode("utf-8")
 
-    # Generate filename
-    filename = filename_for_har_entry(url, content_type, file_exists=file_exists_fn)
-    existing_files.add(filename)
+    else:
+        return None
 
-    # Write the file
+    if entry_filter is not None and not entry_filter.matches(
+        url, content_type or content.get("mimeType"), response.get("status"), size
+    ):
+        return None
+
+    # Generate filename
+    filename = filename_for_har_entry(url, content_type, allocator=allocator)
     file_path = extract_dir / filename
-    file_path.write_bytes(data)
+
+    def write():
+        if chunks is None:
+            copy_stored_member(zip_file.filename, info, file_path)
+            return file_path, None, info.file_size
+        sha256 = None
+        if deduplicator is not None:
+            # Hash the content before writing anything, so a duplicate is
+            # linked without being written to disk
+            hasher = hashlib.sha256()
+            size = 0
+            try:
+                for chunk in chunks():
+                    hasher.update(chunk)
+                    size += len(chunk)
+            except ValueError:
+                # Invalid base64 content
+                return None
+            if not size:
+                return None
+            sha256 = hasher.hexdigest()
+            if deduplicator.link(file_path, sha256, size):
+                return file_path, sha256, size
+        hasher = hashlib.sha256() if hash_content and sha256 is None else None
+        size = 0
+        # Write to a temporary file then move it into place, so a hardlink
+        # left by an earlier --dedupe extraction is replaced rather than
+        # written through
+        tmp_path = file_path.with_name(f".{file_path.name}.partial")
+        try:
+            with open(tmp_path, "wb") as fp:
+                for chunk in chunks():
+                    fp.write(chunk)
+                    size += len(chunk)
+                    if hasher is not None:
+                        hasher.update(chunk)
+        except ValueError:
+            # Invalid base64 content
+            size = 0
+        except BaseException:
+            tmp_path.unlink(missing_ok=True)
+            raise
+        if not size:
+            tmp_path.unlink()
+            return None
+        os.replace(tmp_path, file_path)
+        if hasher is not None:
+            sha256 = hasher.hexdigest()
+        if deduplicator is not None:
+            deduplicator.add(file_path, sha256)
+        return file_path, sha256, size
+
+    return write
 
 
 @cli.command()
@@ -1266,12 +3425,15 @@ def _extract_har_entry(entry, extract_dir, existing_files, file_exists_fn, zip_f
 )
 @browser_option
 @browser_args_option
+@launch_profile_option
 @user_agent_option
 @reduced_motion_option
 @log_console_option
 @skip_fail_options
 @bypass_csp_option
 @http_auth_options
+@resolve_options
+@replay_har_options
 def javascript(
     url,
     javascript,
@@ -1284,6 +3446,7 @@ def javascript(
     timeout,
     browser,
     browser_args,
+    launch_profile,
     user_agent,
     reduced_motion,
     log_console,
@@ -1292,6 +3455,10 @@ def javascript(
     bypass_csp,
     auth_username,
     auth_password,
+    resolve,
+    resolve_file,
+    replay_har,
+    replay_har_miss,
 ):
     """
     Execute JavaScript against the page and return the result as JSON
@@ -1326,8 +3493,12 @@ def javascript(
         context, browser_obj = _browser_context(
             p,
             auth,
+            resolve=_host_mapping(resolve, resolve_file),
+            replay_har=replay_har,
+            replay_har_miss=replay_har_miss,
             browser=browser,
             browser_args=browser_args,
+            launch_profile=launch_profile,
             user_agent=user_agent,
             reduced_motion=reduced_motion,
             timeout=timeout,
@@ -1417,6 +3588,8 @@ def javascript(
 @bypass_csp_option
 @silent_option
 @http_auth_options
+@resolve_options
+@replay_har_options
 def pdf(
     url,
     auth,
@@ -1440,6 +3613,10 @@ def pdf(
     silent,
     auth_username,
     auth_password,
+    resolve,
+    resolve_file,
+    replay_har,
+    replay_har_miss,
 ):
     """
     Create a PDF of the specified page
@@ -1464,6 +3641,9 @@ def pdf(
         context, browser_obj = _browser_context(
             p,
             auth,
+            resolve=_host_mapping(resolve, resolve_file),
+            replay_har=replay_har,
+            replay_har_miss=replay_har_miss,
             bypass_csp=bypass_csp,
             auth_username=auth_username,
             auth_password=auth_password,
@@ -1537,11 +3717,14 @@ def pdf(
 @log_console_option
 @browser_option
 @browser_args_option
+@launch_profile_option
 @user_agent_option
 @skip_fail_options
 @bypass_csp_option
 @silent_option
 @http_auth_options
+@resolve_options
+@replay_har_options
 def html(
     url,
     auth,
@@ -1554,6 +3737,7 @@ def html(
     log_console,
     browser,
     browser_args,
+    launch_profile,
     user_agent,
     skip,
     fail,
@@ -1561,6 +3745,10 @@ def html(
     silent,
     auth_username,
     auth_password,
+    resolve,
+    resolve_file,
+    replay_har,
+    replay_har_miss,
 ):
     """
     Output the final HTML of the specified page
@@ -1581,8 +3769,12 @@ def html(
         context, browser_obj = _browser_context(
             p,
             auth,
+            resolve=_host_mapping(resolve, resolve_file),
+            replay_har=replay_har,
+            replay_har_miss=replay_har_miss,
             browser=browser,
             browser_args=browser_args,
+            launch_profile=launch_profile,
             user_agent=user_agent,
             timeout=timeout,
             bypass_csp=bypass_csp,
@@ -1628,7 +3820,12 @@ def html(
     type=click.Choice(BROWSERS, case_sensitive=False),
     help="Which browser to install",
 )
-def install(browser):
+@click.option(
+    "--only-shell",
+    is_flag=True,
+    help="Only install the Chromium headless shell, not the full browser",
+)
+def install(browser, only_shell):
     """
     Install the Playwright browser needed by this tool.
 
@@ -1639,8 +3836,18 @@ def install(browser):
     Or for browsers other than the Chromium default:
 
         shot-scraper install -b firefox
+
+    Use --only-shell to install just the smaller Chromium headless shell,
+    which is used for everything except interactive sessions:
+
+        shot-scraper install --only-shell
     """
-    sys.argv = ["playwright", "install", browser]
+    if only_shell:
+        if browser not in ("chromium", "chromium-headless-shell"):
+            raise click.ClickException("--only-shell can only be used with chromium")
+        sys.argv = ["playwright", "install", "--only-shell", "chromium"]
+    else:
+        sys.argv = ["playwright", "install", browser]
     run_module("playwright", run_name="__main__")
 
 
@@ -1655,7 +3862,18 @@ def install(browser):
 @user_agent_option
 @click.option("--devtools", is_flag=True, help="Open browser DevTools")
 @log_console_option
-def auth(url, context_file, browser, browser_args, user_agent, devtools, log_console):
+@resolve_options
+def auth(
+    url,
+    context_file,
+    browser,
+    browser_args,
+    user_agent,
+    devtools,
+    log_console,
+    resolve,
+    resolve_file,
+):
     """
     Open a browser so user can manually authenticate with the specified site,
     then save the resulting authentication context to a file.
@@ -1669,6 +3887,7 @@ def auth(url, context_file, browser, browser_args, user_agent, devtools, log_con
             p,
             auth=None,
             interactive=True,
+            resolve=_host_mapping(resolve, resolve_file),
             devtools=devtools,
             browser=browser,
             browser_args=browser_args,
@@ -1720,6 +3939,11 @@ def _run_sh_command(sh):
 
 
 def _run_python_code(code):
+    if _active_python_worker is not None:
+        returncode = _active_python_worker.run(code)
+        if returncode:
+            raise click.ClickException(f"python code exited with status {returncode}")
+        return
     try:
         subprocess.run([sys.executable, "-c", code], check=True)
     except subprocess.CalledProcessError as ex:
@@ -1728,6 +3952,117 @@ def _run_python_code(code):
         ) from ex
 
 
+class _PythonWorker:
+    """
+    A persistent Python process that runs python: steps for --python-worker,
+    so each step does not have to start a new interpreter. Steps share one
+    namespace, so later steps can use the imports and variables of earlier
+    ones.
+
+    If a step makes the process exit, a new process with an empty namespace
+    is started for the next step.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.process = None
+        self.connection = None
+
+    def _start(self):
+        # spawn gives a fresh interpreter, like python -c, on every platform
+        mp_context = multiprocessing.get_context("spawn")
+        self.connection, child_connection = mp_context.Pipe()
+        self.process = mp_context.Process(
+            target=_python_worker_main, args=(child_connection,), daemon=True
+        )
+        self.process.start()
+        child_connection.close()
+
+    def run(self, code):
+        "Run code in the worker, returning its exit status"
+        with self.lock:
+            if self.process is None:
+                self._start()
+            try:
+                self.connection.send(code)
+                return self.connection.recv()
+            except (EOFError, OSError):
+                self.process.join()
+                returncode = self.process.exitcode
+                self.connection.close()
+                self.process = None
+                return returncode
+
+    def close(self):
+        if self.process is None:
+            return
+        # The worker exits once its end of the pipe is closed
+        self.connection.close()
+        self.process.join(timeout=5)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.process = None
+
+
+def _python_worker_main(connection):
+    "Target for the _PythonWorker process"
+    namespace = {"__name__": "__main__", "__builtins__": __builtins__}
+    while True:
+        try:
+            code = connection.recv()
+        except EOFError:
+            return
+        returncode = 0
+        try:
+            exec(compile(code, "<string>", "exec"), namespace)
+        except SystemExit as ex:
+            # Match the exit status python -c would use
+            if ex.code is None:
+                returncode = 0
+            elif isinstance(ex.code, int):
+                returncode = ex.code
+            else:
+                print(ex.code, file=sys.stderr)
+                returncode = 1
+        except BaseException:
+            traceback.print_exc()
+            returncode = 1
+        sys.stdout.flush()
+        sys.stderr.flush()
+        connection.send(returncode)
+
+
+# The _PythonWorker used by _run_python_code(), set by _python_worker()
+_active_python_worker = None
+
+
+def _python_worker_pids():
+    "The process id of the running _PythonWorker, as a set"
+    worker = _active_python_worker
+    if worker is None or worker.process is None:
+        return set()
+    return {worker.process.pid}
+
+
+@contextmanager
+def _python_worker(enabled=True):
+    """
+    Run python: steps in a shared _PythonWorker until the block exits. Does
+    nothing if enabled is False, leaving each step to run in a new process.
+    """
+    global _active_python_worker
+    if not enabled:
+        yield
+        return
+    previous, _active_python_worker = _active_python_worker, _PythonWorker()
+    try:
+        yield
+    finally:
+        worker, _active_python_worker = _active_python_worker, previous
+        worker.close()
+
+
 def _start_server(server):
     if isinstance(server, str):
         proc = subprocess.Popen(server, shell=True)
@@ -1790,6 +4125,8 @@ def _record_storyboard(
     timeout=None,
     browser="chromium",
     browser_args=None,
+    launch_profile=None,
+    resolve=None,
     user_agent=None,
     reduced_motion=False,
     log_console=False,
@@ -1800,6 +4137,11 @@ def _record_storyboard(
     auth_username=None,
     auth_password=None,
     leave_server=False,
+    live_mp4=False,
+    webm=True,
+    cache_dir=None,
+    timer=None,
+    virtual_time=False,
 ):
     if skip and fail:
         raise click.ClickException("--skip and --fail cannot be used together")
@@ -1808,130 +4150,559 @@ def _record_storyboard(
     if not output:
         raise click.ClickException("Storyboard must define output: or use --output")
 
-    viewport = storyboard_config.viewport_size()
-    start_url = storyboard_config.url
+    cache = None
+    storage_state = None
+    if cache_dir:
+        if auth:
+            storage_state = json.load(auth)
+            auth = None
+        cache = _SceneCache(
+            cache_dir,
+            storyboard_config,
+            dict(
+                storage_state=storage_state,
+                resolve=resolve,
+                browser=browser,
+                browser_args=browser_args,
+                launch_profile=launch_profile,
+                user_agent=user_agent,
+                reduced_motion=reduced_motion,
+                bypass_csp=bypass_csp,
+                auth_username=auth_username,
+                auth_password=auth_password,
+            ),
+        )
+        if cache.complete:
+            if not silent:
+                click.echo("All scenes are cached, skipping recording", err=True)
+            cache.concat(output)
+            if not silent:
+                _echo_storyboard_written(output)
+            return
+        if cache.start:
+            storage_state = cache.state(cache.start - 1)["storage_state"]
+
     server_processes = []
 
     try:
-        if storyboard_config.sh is not None:
-            _run_sh_command(storyboard_config.sh)
-        if storyboard_config.python is not None:
-            _run_python_code(storyboard_config.python)
-        if storyboard_config.server is not None:
-            server_processes.append(_start_server(storyboard_config.server))
-            if start_url:
-                _wait_for_server(server_processes, _resolve_storyboard_url(start_url))
-            else:
-                time.sleep(1)
+        _run_storyboard_setup(storyboard_config, server_processes, resolve, timer=timer)
 
         with sync_playwright() as p:
             context, browser_obj = _browser_context(
                 p,
                 auth,
+                storage_state=storage_state,
+                resolve=resolve,
                 browser=browser,
                 browser_args=browser_args,
+                launch_profile=launch_profile,
                 user_agent=user_agent,
                 timeout=timeout,
                 reduced_motion=reduced_motion,
                 bypass_csp=bypass_csp,
                 auth_username=auth_username,
                 auth_password=auth_password,
-                viewport=viewport,
+                viewport=storyboard_config.viewport_size(),
             )
-            if storyboard_config.cursor and (
-                storyboard_config.cursor.visible or storyboard_config.cursor.clicks
-            ):
-                context.add_init_script(
-                    _storyboard_cursor_script(storyboard_config.cursor)
+            try:
+                _record_storyboard_context(
+                    context,
+                    storyboard_config,
+                    log_console=log_console,
+                    skip=skip,
+                    fail=fail,
+                    silent=silent,
+                    live_mp4=live_mp4,
+                    webm=webm,
+                    cache=cache,
+                    timer=timer,
+                    virtual_time=virtual_time,
                 )
-            page = context.new_page()
-            context_closed = False
-            recording_started = False
-            page.set_viewport_size(viewport)
-            if log_console:
-                page.on("console", console_log)
+            finally:
+                browser_obj.close()
+    finally:
+        if server_processes:
+            _cleanup_servers(server_processes, leave_server)
 
-            try:
-                if not silent:
-                    click.echo(f"Recording video to '{output}'", err=True)
+    if timer is not None and timer.dry_run:
+        return
+    if cache is not None:
+        cache.concat(output)
+    if not silent:
+        _echo_storyboard_written(output, live_mp4, webm)
 
-                if start_url:
-                    _storyboard_goto(
-                        page,
-                        start_url,
-                        skip=skip,
-                        fail=fail,
-                    )
 
-                if storyboard_config.wait is not None:
-                    _storyboard_pause(storyboard_config.wait)
-                if storyboard_config.wait_for:
+def _echo_storyboard_written(output, live_mp4=False, webm=True):
+    if webm:
+        click.echo(f"Video written to '{output}'", err=True)
+    if live_mp4:
+        click.echo(f"MP4 written to '{_mp4_path(output)}'", err=True)
+
+
+def _run_storyboard_setup(
+    storyboard_config,
+    server_processes,
+    resolve=None,
+    commands=True,
+    server=True,
+    timer=None,
+):
+    """
+    Run the top-level sh: and python: steps of a storyboard, then start its
+    server: and wait for it to be ready. Set commands or server to False to
+    skip those steps, for example if another storyboard already ran them.
+    """
+    start_url = storyboard_config.url
+    if commands:
+        if storyboard_config.sh is not None:
+            with _timed(timer, "sh"):
+                _run_sh_command(storyboard_config.sh)
+        if storyboard_config.python is not None:
+            with _timed(timer, "python"):
+                _run_python_code(storyboard_config.python)
+    if server and storyboard_config.server is not None:
+        with _timed(timer, "server"):
+            server_processes.append(_start_server(storyboard_config.server))
+            if start_url:
+                _wait_for_server(
+                    server_processes,
+                    apply_host_mapping(_resolve_storyboard_url(start_url), resolve),
+                )
+            else:
+                time.sleep(1)
+
+
+def _record_storyboard_context(
+    context,
+    storyboard_config,
+    log_console=False,
+    skip=False,
+    fail=False,
+    silent=False,
+    prefix="",
+    live_mp4=False,
+    webm=True,
+    cache=None,
+    timer=None,
+    virtual_time=False,
+):
+    """
+    Record a storyboard to its output file using a page in this context.
+    The context is closed once the recording is finished.
+
+    With live_mp4=True the screencast frames are also encoded to an MP4
+    while recording. Set webm=False to only write that MP4.
+
+    If cache is a _SceneCache, each scene that is not already cached is
+    recorded to its own segment in the cache instead, starting from the URL
+    saved at the end of the last cached scene. The caller joins the segments.
+
+    Steps are timed if timer is a _StoryboardTimer. If that timer is a dry
+    run, the storyboard is run without starting the screencast.
+
+    With virtual_time=True the scenes are recorded by a _VirtualTimeRecorder
+    instead of the screencast.
+    """
+    output = storyboard_config.output
+    viewport = storyboard_config.viewport_size()
+    start_url = storyboard_config.url
+    start_scene = cache.start if cache is not None else 0
+    if start_scene:
+        start_url = cache.state(start_scene - 1)["url"]
+    if storyboard_config.cursor and (
+        storyboard_config.cursor.visible or storyboard_config.cursor.clicks
+    ):
+        context.add_init_script(_storyboard_cursor_script(storyboard_config.cursor))
+    if virtual_time:
+        context.clock.install()
+    page = context.new_page()
+    context_closed = False
+    recording_started = False
+    encoder = None
+    virtual = None
+    page.set_viewport_size(viewport)
+    if log_console:
+        page.on("console", console_log)
+
+    try:
+        if not silent:
+            if timer is not None and timer.dry_run:
+                message = "{}Dry run of '{}', not recording"
+            else:
+                message = "{}Recording video to '{}'"
+            click.echo(
+                message.format(prefix, output if webm else _mp4_path(output)),
+                err=True,
+            )
+
+        if start_url:
+            with _timed(timer, "open", url=start_url):
+                _storyboard_goto(
+                    page,
+                    start_url,
+                    skip=skip,
+                    fail=fail,
+                )
+
+        if not start_scene:
+            if storyboard_config.wait is not None:
+                with _timed(timer, "wait", seconds=storyboard_config.wait):
+                    _storyboard_pause(storyboard_config.wait, timer)
+            if storyboard_config.wait_for:
+                with _timed(timer, "wait_for", selector=storyboard_config.wait_for):
                     _storyboard_wait_for(page, storyboard_config.wait_for)
-                if storyboard_config.wait_for_url:
+            if storyboard_config.wait_for_url:
+                with _timed(timer, "wait_for_url", url=storyboard_config.wait_for_url):
                     page.wait_for_url(storyboard_config.wait_for_url)
-                if storyboard_config.javascript:
-                    _evaluate_js(page, storyboard_config.javascript)
-
-                page.screencast.start(path=output, size=viewport)
+        if storyboard_config.javascript:
+            # Also run when resuming from the cache, so the resumed scenes
+            # are set up the same way as the cached ones
+            with _timed(timer, "javascript"):
+                _evaluate_js(page, storyboard_config.javascript)
+
+        if timer is not None:
+            timer.start_recording()
+        if timer is not None and timer.dry_run:
+            for index, scene in enumerate(storyboard_config.scenes, 1):
+                _run_storyboard_scene(
+                    page,
+                    scene,
+                    index=index,
+                    skip=skip,
+                    fail=fail,
+                    silent=silent,
+                    prefix=prefix,
+                    timer=timer,
+                )
+        elif virtual_time:
+            virtual = _VirtualTimeRecorder(page, output)
+            virtual.start()
+            for index, scene in enumerate(storyboard_config.scenes, 1):
+                _run_storyboard_scene(
+                    page,
+                    scene,
+                    index=index,
+                    skip=skip,
+                    fail=fail,
+                    silent=silent,
+                    prefix=prefix,
+                    timer=timer,
+                    virtual=virtual,
+                )
+            recorder, virtual = virtual, None
+            recorder.close()
+        elif cache is None:
+            screencast_args = {"size": viewport}
+            if webm:
+                screencast_args["path"] = output
+            if live_mp4:
+                encoder = _LiveMP4Encoder(_mp4_path(output))
+                screencast_args["on_frame"] = encoder.add_frame
+            page.screencast.start(**screencast_args)
+            recording_started = True
+            for index, scene in enumerate(storyboard_config.scenes, 1):
+                _run_storyboard_scene(
+                    page,
+                    scene,
+                    index=index,
+                    skip=skip,
+                    fail=fail,
+                    silent=silent,
+                    prefix=prefix,
+                    timer=timer,
+                    live=encoder is not None,
+                )
+            page.screencast.stop()
+            recording_started = False
+        else:
+            for index, scene in enumerate(storyboard_config.scenes, 1):
+                if index <= start_scene:
+                    if not silent:
+                        click.echo(
+                            "{}Scene {}: {} (cached)".format(
+                                prefix, index, scene.name or f"Scene {index}"
+                            ),
+                            err=True,
+                        )
+                    continue
+                page.screencast.start(
+                    path=cache.recording_path(index - 1), size=viewport
+                )
                 recording_started = True
-                for index, scene in enumerate(storyboard_config.scenes, 1):
-                    _run_storyboard_scene(
-                        page,
-                        scene,
-                        index=index,
-                        skip=skip,
-                        fail=fail,
-                        silent=silent,
-                    )
-
+                _run_storyboard_scene(
+                    page,
+                    scene,
+                    index=index,
+                    skip=skip,
+                    fail=fail,
+                    silent=silent,
+                    prefix=prefix,
+                    timer=timer,
+                )
                 page.screencast.stop()
                 recording_started = False
-                page.close()
-                context.close()
-                context_closed = True
-            finally:
-                if recording_started:
+                cache.save(index - 1, page.url, context.storage_state())
+        if encoder is not None:
+            live_encoder, encoder = encoder, None
+            live_encoder.close()
+        page.close()
+        context.close()
+        context_closed = True
+    finally:
+        if recording_started:
+            try:
+                page.screencast.stop()
+            except Error:
+                pass
+        if encoder is not None:
+            encoder.abort()
+        if virtual is not None:
+            virtual.abort()
+        if cache is not None:
+            cache.discard_partial()
+        if not page.is_closed():
+            page.close()
+        if not context_closed:
+            context.close()
+
+
+def _record_storyboards(
+    storyboards,
+    concurrency=1,
+    mp4=False,
+    live_mp4=False,
+    webm=True,
+    auth=None,
+    timeout=None,
+    resolve=None,
+    log_console=False,
+    skip=False,
+    fail=False,
+    silent=False,
+    leave_server=False,
+    cache_dir=None,
+    virtual_time=False,
+    max_idle=None,
+    **launch_options,
+):
+    """
+    Record a list of (name, storyboard_config) pairs, with up to concurrency
+    recordings running at once.
+
+    The Playwright sync API cannot share a browser between threads, so each
+    worker thread launches one browser and records its storyboards one
+    after another, each in a fresh context. The top-level sh:, python: and
+    server: steps all run before recording starts - identical steps shared
+    by several storyboards only run once.
+    """
+    if skip and fail:
+        raise click.ClickException("--skip and --fail cannot be used together")
+    outputs = {}
+    for name, storyboard_config in storyboards:
+        output = storyboard_config.output
+        if not output:
+            raise click.ClickException(f"{name}: Storyboard must define output:")
+        if output in outputs:
+            raise click.ClickException(
+                f"{name}: output '{output}' is also used by {outputs[output]}"
+            )
+        outputs[output] = name
+
+    browser_type, launch_kwargs, context_args = _browser_launch_options(
+        auth, resolve=resolve, **launch_options
+    )
+    jobs = queue.Queue()
+    for job in storyboards:
+        jobs.put(job)
+    prefix_output = concurrency > 1 and len(storyboards) > 1
+    failed = []
+    cache_options = dict(
+        storage_state=context_args.get("storage_state"),
+        resolve=resolve,
+        **launch_options,
+    )
+
+    def record(browser_obj, name, storyboard_config):
+        output = storyboard_config.output
+        prefix = f"[{output}] " if prefix_output else ""
+        context_kwargs = dict(context_args, viewport=storyboard_config.viewport_size())
+        cache = None
+        if cache_dir:
+            cache = _SceneCache(cache_dir, storyboard_config, cache_options)
+            if cache.start and not cache.complete:
+                context_kwargs["storage_state"] = cache.state(cache.start - 1)[
+                    "storage_state"
+                ]
+        if cache is not None and cache.complete:
+            if not silent:
+                click.echo(
+                    f"{prefix}All scenes are cached, skipping recording", err=True
+                )
+        else:
+            context = browser_obj.new_context(**context_kwargs)
+            if timeout:
+                context.set_default_timeout(timeout)
+            try:
+                _record_storyboard_context(
+                    context,
+                    storyboard_config,
+                    log_console=log_console,
+                    skip=skip,
+                    fail=fail,
+                    silent=silent,
+                    prefix=prefix,
+                    live_mp4=live_mp4,
+                    webm=webm,
+                    cache=cache,
+                    virtual_time=virtual_time,
+                )
+            except SystemExit:
+                # --skip raises SystemExit for an HTTP error, which should only
+                # skip this storyboard
+                return
+        if cache is not None:
+            cache.concat(output)
+        if not silent:
+            _echo_storyboard_written(output, live_mp4, webm)
+        if max_idle:
+            _compress_idle_video(output, max_idle, silent=silent)
+        if mp4 and not live_mp4:
+            _convert_video_to_mp4(output, silent=silent)
+        if storyboard_config.exports:
+            _export_video(output, storyboard_config.exports, silent=silent)
+
+    def worker():
+        with sync_playwright() as p:
+            browser_obj = None
+            try:
+                while True:
                     try:
-                        page.screencast.stop()
-                    except Error:
-                        pass
-                if not page.is_closed():
-                    page.close()
-                if not context_closed:
-                    context.close()
-                browser_obj.close()
+                        name, storyboard_config = jobs.get_nowait()
+                    except queue.Empty:
+                        return
+                    # Relaunch if the browser crashed during the last recording
+                    if browser_obj is None or not browser_obj.is_connected():
+                        browser_obj = getattr(p, browser_type).launch(**launch_kwargs)
+                    try:
+                        record(browser_obj, name, storyboard_config)
+                    except (click.ClickException, Error) as ex:
+                        failed.append(name)
+                        click.echo(f"Error recording {name}: {ex.message}", err=True)
+            finally:
+                if browser_obj is not None:
+                    browser_obj.close()
+
+    server_processes = []
+    try:
+        commands_run = set()
+        servers_started = set()
+        for name, storyboard_config in storyboards:
+            commands = json.dumps([storyboard_config.sh, storyboard_config.python])
+            server = json.dumps(storyboard_config.server)
+            _run_storyboard_setup(
+                storyboard_config,
+                server_processes,
+                resolve,
+                commands=commands not in commands_run,
+                server=server not in servers_started,
+            )
+            commands_run.add(commands)
+            servers_started.add(server)
+
+        workers = min(concurrency, len(storyboards))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for future in [executor.submit(worker) for _ in range(workers)]:
+                future.result()
     finally:
         if server_processes:
             _cleanup_servers(server_processes, leave_server)
 
-    if not silent:
-        click.echo(f"Video written to '{output}'", err=True)
+    if failed:
+        raise click.ClickException(
+            f"{len(failed)} of {len(storyboards)} storyboards failed: "
+            + ", ".join(failed)
+        )
 
 
-def _run_storyboard_scene(page, scene, index, skip=False, fail=False, silent=False):
+def _run_storyboard_scene(
+    page,
+    scene,
+    index,
+    skip=False,
+    fail=False,
+    silent=False,
+    prefix="",
+    timer=None,
+    virtual=None,
+    live=False,
+):
     name = scene.name or f"Scene {index}"
     if not silent:
-        click.echo(f"Scene {index}: {name}", err=True)
-
-    if scene.sh is not None:
-        _run_sh_command(scene.sh)
-    if scene.python is not None:
-        _run_python_code(scene.python)
-
-    if scene.open:
-        _storyboard_goto(page, scene.open, skip=skip, fail=fail)
-    if scene.wait_for:
-        _storyboard_wait_for(page, scene.wait_for)
-    if scene.wait_for_url:
-        page.wait_for_url(scene.wait_for_url)
-
-    for action_index, action in enumerate(scene.do, 1):
-        _run_storyboard_action(page, action, index, action_index, skip=skip, fail=fail)
+        click.echo(f"{prefix}Scene {index}: {name}", err=True)
+
+    with timer.scene(index, name) if timer is not None else nullcontext():
+        if scene.sh is not None:
+            with _timed(timer, "sh"):
+                _run_sh_command(scene.sh)
+        if scene.python is not None:
+            with _timed(timer, "python"):
+                _run_python_code(scene.python)
+
+        if scene.open:
+            with _timed(timer, "open", url=scene.open):
+                _storyboard_goto(page, scene.open, skip=skip, fail=fail)
+        if scene.wait_for:
+            with _timed(timer, "wait_for", selector=scene.wait_for):
+                _storyboard_wait_for(page, scene.wait_for, virtual)
+        if scene.wait_for_url:
+            with _timed(timer, "wait_for_url", url=scene.wait_for_url):
+                page.wait_for_url(scene.wait_for_url)
+
+        for action_index, action in enumerate(scene.do, 1):
+            options = action.model_dump(exclude={"action"}) if timer else {}
+            try:
+                with _timed(timer, action.action, **options):
+                    _run_storyboard_action(
+                        page,
+                        action,
+                        index,
+                        action_index,
+                        skip=skip,
+                        fail=fail,
+                        timer=timer,
+                        virtual=virtual,
+                        live=live,
+                    )
+            except Error as ex:
+                if timer is None or not timer.dry_run:
+                    raise
+                raise click.ClickException(
+                    f"Scene {index} action {action_index} ({action.action}) "
+                    f"failed: {ex.message}"
+                )
+            if virtual is not None:
+                # Capture the result of each action
+                virtual.step()
 
 
 def _run_storyboard_action(
-    page, action, scene_index, action_index, skip=False, fail=False
+    page,
+    action,
+    scene_index,
+    action_index,
+    skip=False,
+    fail=False,
+    timer=None,
+    virtual=None,
+    live=False,
 ):
+    """
+    Run a single storyboard action on the page.
+
+    Set live=True while a _LiveMP4Encoder is receiving screencast frames,
+    so waits keep Playwright delivering those frames.
+    """
+    live_page = page if live else None
     if isinstance(action, ClickAction):
         click_kwargs = {}
         if action.button:
@@ -1940,10 +4711,20 @@ def _run_storyboard_action(
             click_kwargs["click_count"] = action.count
         page.locator(action.selector).click(**click_kwargs)
     elif isinstance(action, TypeAction):
-        type_kwargs = {}
-        if action.delay_ms is not None:
-            type_kwargs["delay"] = action.delay_ms
-        page.locator(action.target_selector).type(action.text, **type_kwargs)
+        if virtual is not None and action.delay_ms:
+            locator = page.locator(action.target_selector)
+            for character in action.text:
+                locator.type(character)
+                virtual.advance(action.delay_ms / 1000)
+        elif timer is not None and timer.dry_run and action.delay_ms:
+            # Type without the delay, but count it towards the timings
+            page.locator(action.target_selector).type(action.text)
+            timer.pause(len(action.text) * action.delay_ms / 1000)
+        else:
+            type_kwargs = {}
+            if action.delay_ms is not None:
+                type_kwargs["delay"] = action.delay_ms
+            page.locator(action.target_selector).type(action.text, **type_kwargs)
     elif isinstance(action, FillAction):
         page.locator(action.target_selector).fill(action.text)
     elif isinstance(action, PressAction):
@@ -1952,11 +4733,11 @@ def _run_storyboard_action(
         else:
             page.keyboard.press(action.key)
     elif isinstance(action, ScrollAction):
-        _storyboard_scroll(page, action)
+        _storyboard_scroll(page, action, timer, virtual, live_page)
     elif isinstance(action, PauseAction):
-        _storyboard_pause(action.seconds)
+        _storyboard_pause(action.seconds, timer, virtual, live_page)
     elif isinstance(action, WaitForAction):
-        _storyboard_wait_for(page, action.selector)
+        _storyboard_wait_for(page, action.selector, virtual)
     elif isinstance(action, WaitForUrlAction):
         page.wait_for_url(action.url)
     elif isinstance(action, OpenAction):
@@ -1964,7 +4745,11 @@ def _run_storyboard_action(
     elif isinstance(action, JavascriptAction):
         _evaluate_js(page, action.code)
     elif isinstance(action, ScreenshotAction):
-        _storyboard_screenshot(page, action)
+        if timer is None or not timer.dry_run:
+            _storyboard_screenshot(page, action)
+        elif action.selector:
+            # A dry run saves no screenshots, but checks the selector matches
+            page.locator(action.selector).wait_for()
     elif isinstance(action, ShAction):
         _run_sh_command(action.command)
     elif isinstance(action, PythonAction):
@@ -1995,63 +4780,109 @@ def _resolve_storyboard_url(url, base_url=None):
     return url_or_file_path(url, _check_and_absolutize)
 
 
-def _storyboard_wait_for(page, selector):
+def _storyboard_wait_for(page, selector, virtual=None):
     if not isinstance(selector, str):
         raise click.ClickException("wait_for: must be a selector string")
-    page.locator(selector).wait_for()
+    if virtual is not None:
+        # The page clock is paused, so keep it running while waiting
+        locator = page.locator(selector).first
+        virtual.wait_until(locator.is_visible, f"'{selector}'")
+    else:
+        page.locator(selector).wait_for()
 
 
-def _storyboard_pause(seconds):
+def _storyboard_pause(seconds, timer=None, virtual=None, live_page=None):
     try:
         seconds = float(seconds)
     except (TypeError, ValueError):
         raise click.ClickException("pause values must be numbers")
     if seconds < 0:
         raise click.ClickException("pause values must not be negative")
-    time.sleep(seconds)
+    if virtual is not None:
+        virtual.advance(seconds)
+    elif timer is not None and timer.dry_run:
+        timer.pause(seconds)
+    else:
+        _storyboard_sleep(seconds, live_page)
+
+
+def _storyboard_sleep(seconds, live_page=None):
+    """
+    Wait for seconds. With the sync API, screencast frames only reach an
+    on_frame callback while Playwright is running, so if live_page is given
+    wait with live_page.wait_for_timeout() rather than time.sleep().
+    """
+    if live_page is not None:
+        live_page.wait_for_timeout(seconds * 1000)
+    else:
+        time.sleep(seconds)
+
+
+# Scrolls by {x, y} over duration seconds, resolving once it has finished
+SMOOTH_SCROLL_JS = """
+({x, y, duration}) => new Promise(resolve => {
+    const startX = window.scrollX;
+    const startY = window.scrollY;
+    const start = performance.now();
+    const durationMs = duration * 1000;
+    const ease = t => t < 0.5 ? 2 * t * t : 1 - Math.pow(-2 * t + 2, 2) / 2;
+    const step = now => {
+        const progress = Math.min((now - start) / durationMs, 1);
+        window.scrollTo(startX + x * ease(progress), startY + y * ease(progress));
+        if (progress < 1) {
+            requestAnimationFrame(step);
+        } else {
+            resolve();
+        }
+    };
+    requestAnimationFrame(step);
+})
+"""
 
 
-def _storyboard_scroll(page, value):
+def _storyboard_scroll(page, value, timer=None, virtual=None, live_page=None):
     duration = value.duration
+    if duration and virtual is None and timer is not None and timer.dry_run:
+        # Scroll instantly, but count the duration towards the timings
+        _storyboard_scroll(page, value.model_copy(update={"duration": 0}))
+        timer.pause(duration)
+        return
 
     if value.to:
         selector = value.to
-        if duration:
+        if duration and virtual is not None:
+            # Native smooth scrolling does not follow the page clock, so
+            # scroll by the distance to the centered element instead
+            offset = page.locator(selector).evaluate("""(el) => {
+                    const rect = el.getBoundingClientRect();
+                    return rect.top + rect.height / 2 - window.innerHeight / 2;
+                }""")
+            _storyboard_scroll_by(page, 0, offset, duration, virtual)
+        elif duration:
             page.locator(selector).evaluate(
                 "(el) => el.scrollIntoView({behavior: 'smooth', block: 'center'})"
             )
-            time.sleep(duration)
+            _storyboard_sleep(duration, live_page)
         else:
             page.locator(selector).scroll_into_view_if_needed()
         return
 
-    x = value.x
-    y = value.y
-    if duration:
+    _storyboard_scroll_by(page, value.x, value.y, duration, virtual)
+
+
+def _storyboard_scroll_by(page, x, y, duration, virtual=None):
+    if not duration:
+        page.evaluate("({x, y}) => window.scrollBy(x, y)", {"x": x, "y": y})
+    elif virtual is not None:
+        # Start the scroll without waiting for it, then let the page clock
+        # run for its duration
         page.evaluate(
-            """
-            ({x, y, duration}) => new Promise(resolve => {
-                const startX = window.scrollX;
-                const startY = window.scrollY;
-                const start = performance.now();
-                const durationMs = duration * 1000;
-                const ease = t => t < 0.5 ? 2 * t * t : 1 - Math.pow(-2 * t + 2, 2) / 2;
-                const step = now => {
-                    const progress = Math.min((now - start) / durationMs, 1);
-                    window.scrollTo(startX + x * ease(progress), startY + y * ease(progress));
-                    if (progress < 1) {
-                        requestAnimationFrame(step);
-                    } else {
-                        resolve();
-                    }
-                };
-                requestAnimationFrame(step);
-            })
-            """,
+            f"(options) => {{ ({SMOOTH_SCROLL_JS})(options); }}",
             {"x": x, "y": y, "duration": duration},
         )
+        virtual.advance(duration)
     else:
-        page.evaluate("({x, y}) => window.scrollBy(x, y)", {"x": x, "y": y})
+        page.evaluate(SMOOTH_SCROLL_JS, {"x": x, "y": y, "duration": duration})
 
 
 def _storyboard_screenshot(page, action):
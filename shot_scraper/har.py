@@ -0,0 +1,923 @@
+import base64
+import bisect
+import datetime
+import email.utils
+import fnmatch
+import hashlib
+import heapq
+import io
+import json
+import os
+import re
+import sqlite3
+import string
+import struct
+import urllib.parse
+import zipfile
+from array import array
+from contextlib import contextmanager
+
+CHUNK_SIZE = 1024 * 1024
+
+_STRUCTURE_RE = re.compile(r'[{}\[\]"]')
+_SCALAR_END_RE = re.compile(r"[,\]}\s]")
+_WHITESPACE = " \t\n\r"
+_BASE64_ALPHABET = string.ascii_letters + string.digits + "+/="
+_BASE64_CHARACTERS = str.maketrans("", "", _BASE64_ALPHABET)
+_NOT_BASE64_RE = re.compile("[^{}]".format(re.escape(_BASE64_ALPHABET)))
+_BASE64_DATA_CHARACTERS = str.maketrans(
+    "", "", string.ascii_letters + string.digits + "+/"
+)
+_ZIP_LOCAL_HEADER = struct.Struct("<4s22xHH")
+
+MANIFEST_FILENAME = "manifest.db"
+TIMINGS = ("blocked", "dns", "connect", "ssl", "send", "wait", "receive")
+
+
+class HarError(ValueError):
+    pass
+
+
+@contextmanager
+def open_har(har_path, chunk_size=CHUNK_SIZE):
+    """
+    Open a .har or .har.zip file for streaming.
+
+    Yields (entries, zip_file) - entries is an iterator over the items in
+    log.entries, and zip_file is the open ZipFile for a .har.zip (needed to
+    read _file references) or None for a plain .har file.
+    """
+    if zipfile.is_zipfile(har_path):
+        with zipfile.ZipFile(har_path) as zip_file:
+            try:
+                har_file = zip_file.open("har.har")
+            except KeyError:
+                raise HarError(f"{har_path} does not contain a har.har file")
+            with har_file:
+                yield iter_har_entries(har_file, chunk_size), zip_file
+    else:
+        with open(har_path, "rb") as har_file:
+            yield iter_har_entries(har_file, chunk_size), None
+
+
+def iter_har_entries(har_file, chunk_size=CHUNK_SIZE):
+    """
+    Iterate over the entries in a HAR file without loading the whole file.
+
+    har_file can be opened in text or binary mode. Only one entry is held in
+    memory at a time, so memory use is proportional to the largest entry
+    rather than to the size of the file.
+    """
+    if not isinstance(har_file, io.TextIOBase):
+        har_file = io.TextIOWrapper(har_file, encoding="utf-8-sig")
+    scanner = _JSONScanner(har_file, chunk_size)
+    for key in scanner.object_keys():
+        if key != "log":
+            scanner.skip_value()
+            continue
+        for log_key in scanner.object_keys():
+            if log_key != "entries":
+                scanner.skip_value()
+                continue
+            for _ in scanner.array_items():
+                yield json.loads(scanner.capture_value())
+
+
+def iter_base64_chunks(text, chunk_size=CHUNK_SIZE):
+    """
+    Decode base64 text a piece at a time, yielding bytes.
+
+    Each piece is a multiple of four characters so it decodes on its own.
+    As with base64.b64decode(), characters outside the base64 alphabet
+    such as line breaks are ignored. Padding is optional and = characters
+    are ignored too, so whether text decodes only depends on how many data
+    characters it has - see base64_decoded_size().
+    """
+    if text.translate(_BASE64_CHARACTERS):
+        text = _NOT_BASE64_RE.sub("", text)
+    end = len(text)
+    while end and text[end - 1] == "=":
+        end -= 1
+    if text.find("=", 0, end) != -1:
+        text = text[:end].replace("=", "")
+        end = len(text)
+    step = max(4, chunk_size - chunk_size % 4)
+    for start in range(0, end, step):
+        piece = text[start : min(start + step, end)]
+        yield base64.b64decode(piece + "=" * (-len(piece) % 4))
+
+
+def base64_decoded_size(text):
+    """
+    The number of bytes iter_base64_chunks() decodes text to, found without
+    decoding it - or None if text is not valid base64.
+    """
+    data = len(text) - len(text.translate(_BASE64_DATA_CHARACTERS))
+    if data % 4 == 1:
+        return None
+    return data * 3 // 4
+
+
+def attached_file_path(har_dir, file_ref):
+    """
+    The path to a _file attached alongside a .har file in har_dir.
+
+    HAR files are untrusted input, so this returns None if file_ref is an
+    absolute path or resolves to somewhere outside har_dir.
+    """
+    if os.path.isabs(file_ref):
+        return None
+    base = os.path.realpath(har_dir)
+    path = os.path.realpath(os.path.join(base, file_ref))
+    if os.path.commonpath([base, path]) != base:
+        return None
+    return path
+
+
+def copy_stored_member(zip_path, info, dest_path, chunk_size=CHUNK_SIZE):
+    """
+    Copy an uncompressed (ZIP_STORED) member of a zip file to dest_path.
+
+    The bytes are copied directly from the archive on disk, using
+    os.sendfile() where it is available so they never pass through Python.
+    They are written to a temporary file that then replaces dest_path, so
+    if dest_path is a hardlink the other linked files are left unchanged.
+    """
+    dest_path = os.fspath(dest_path)
+    directory, name = os.path.split(dest_path)
+    tmp_path = os.path.join(directory, f".{name}.partial")
+    try:
+        with open(zip_path, "rb") as src, open(tmp_path, "wb", buffering=0) as dest:
+            _copy_stored_member(zip_path, info, src, dest, chunk_size)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+    os.replace(tmp_path, dest_path)
+
+
+def _copy_stored_member(zip_path, info, src, dest, chunk_size):
+    src.seek(info.header_offset)
+    signature, name_length, extra_length = _ZIP_LOCAL_HEADER.unpack(
+        src.read(_ZIP_LOCAL_HEADER.size)
+    )
+    if signature != b"PK\x03\x04":
+        raise HarError(f"Invalid zip entry for {info.filename} in {zip_path}")
+    offset = info.header_offset + _ZIP_LOCAL_HEADER.size + name_length + extra_length
+    remaining = info.file_size
+    if hasattr(os, "sendfile"):
+        try:
+            while remaining:
+                sent = os.sendfile(dest.fileno(), src.fileno(), offset, remaining)
+                if not sent:
+                    break
+                offset += sent
+                remaining -= sent
+        except OSError:
+            # Not supported for these files, copy the rest in chunks
+            pass
+    src.seek(offset)
+    while remaining:
+        chunk = src.read(min(chunk_size, remaining))
+        if not chunk:
+            raise HarError(f"Truncated zip entry {info.filename} in {zip_path}")
+        dest.write(chunk)
+        remaining -= len(chunk)
+
+
+# Statuses that can be cached without explicit freshness information,
+# from RFC 9110 section 15.1
+_HEURISTICALLY_CACHEABLE = {200, 203, 204, 206, 300, 301, 308, 404, 405, 410, 414, 501}
+CACHEABILITY = ("cacheable", "revalidate", "heuristic", "no-store", "none")
+
+
+def summarize_har(har_path, top=10):
+    """
+    Calculate performance statistics for a HAR file.
+
+    Entries are read one at a time, and apart from the top-N lists only the
+    start and end time of each request is kept, so memory use stays low
+    even for very large files. Returns a dictionary that can be serialized
+    as JSON.
+    """
+    requests = 0
+    total_bytes = 0
+    domains = {}
+    content_types = {}
+    largest = []
+    slowest = []
+    cacheability = {category: {"requests": 0, "bytes": 0} for category in CACHEABILITY}
+    # Start and end times in ms for the waterfall, with the entry index
+    starts = array("d")
+    ends = array("d")
+    indexes = array("q")
+
+    with open_har(har_path) as (entries, _):
+        for index, entry in enumerate(entries):
+            request = entry.get("request") or {}
+            response = entry.get("response") or {}
+            url = request.get("url") or ""
+            size = _transfer_size(response)
+            elapsed = entry.get("time")
+            if not isinstance(elapsed, (int, float)) or elapsed < 0:
+                elapsed = 0
+            requests += 1
+            total_bytes += size
+
+            domain = urllib.parse.urlparse(url).hostname or "(none)"
+            stats = domains.setdefault(domain, {"requests": 0, "bytes": 0, "time": 0})
+            stats["requests"] += 1
+            stats["bytes"] += size
+            stats["time"] += elapsed
+
+            content_type = _mime_type(response)
+            stats = content_types.setdefault(content_type, {"requests": 0, "bytes": 0})
+            stats["requests"] += 1
+            stats["bytes"] += size
+
+            # Bounded heaps, the index breaks ties between equal values
+            _push_top(largest, top, (size, -index, url))
+            _push_top(slowest, top, (elapsed, -index, url))
+
+            if (
+                request.get("method") == "GET"
+                and response.get("status") in _HEURISTICALLY_CACHEABLE
+            ):
+                stats = cacheability[_cacheability(response)]
+                stats["requests"] += 1
+                stats["bytes"] += size
+
+            started = _parse_started(entry.get("startedDateTime"))
+            if started is not None:
+                starts.append(started)
+                ends.append(started + elapsed)
+                indexes.append(index)
+
+    critical_path = _critical_path(starts, ends)
+    first_start = min(starts) if starts else 0
+    chain_urls = {}
+    if critical_path:
+        wanted = {indexes[i] for i in critical_path}
+        with open_har(har_path) as (entries, _):
+            for index, entry in enumerate(entries):
+                if index in wanted:
+                    chain_urls[index] = (entry.get("request") or {}).get("url")
+
+    return {
+        "requests": requests,
+        "bytes": total_bytes,
+        "duration_ms": round(max(ends) - first_start, 3) if ends else 0,
+        "domains": [
+            {
+                "domain": domain,
+                "requests": stats["requests"],
+                "bytes": stats["bytes"],
+                "time_ms": round(stats["time"], 3),
+            }
+            for domain, stats in sorted(
+                domains.items(), key=lambda item: (-item[1]["bytes"], item[0])
+            )
+        ],
+        "content_types": [
+            {"content_type": content_type, **stats}
+            for content_type, stats in sorted(
+                content_types.items(), key=lambda item: (-item[1]["bytes"], item[0])
+            )
+        ],
+        "largest": [
+            {"url": url, "bytes": size}
+            for size, _, url in sorted(largest, reverse=True)
+        ],
+        "slowest": [
+            {"url": url, "time_ms": round(elapsed, 3)}
+            for elapsed, _, url in sorted(slowest, reverse=True)
+        ],
+        "critical_path": {
+            "duration_ms": (
+                round(ends[critical_path[-1]] - starts[critical_path[0]], 3)
+                if critical_path
+                else 0
+            ),
+            "requests": [
+                {
+                    "url": chain_urls.get(indexes[i]),
+                    "start_ms": round(starts[i] - first_start, 3),
+                    "time_ms": round(ends[i] - starts[i], 3),
+                }
+                for i in critical_path
+            ],
+        },
+        "cacheability": cacheability,
+    }
+
+
+def _push_top(heap, size, item):
+    if len(heap) < size:
+        heapq.heappush(heap, item)
+    elif size and item > heap[0]:
+        heapq.heapreplace(heap, item)
+
+
+def _critical_path(starts, ends):
+    """
+    Estimate the critical path through a waterfall of requests.
+
+    Starting from the request that finished last, repeatedly step back to
+    the request that finished most recently before the current one
+    started - most likely the response that led to it being requested.
+    Returns positions in starts/ends, in chronological order.
+    """
+    if not ends:
+        return []
+    by_end = sorted(range(len(ends)), key=ends.__getitem__)
+    sorted_ends = array("d", (ends[i] for i in by_end))
+    current = by_end[-1]
+    chain = [current]
+    while True:
+        # Only requests that ended strictly before this one started
+        position = bisect.bisect_left(sorted_ends, starts[current]) - 1
+        if position < 0:
+            break
+        current = by_end[position]
+        chain.append(current)
+    chain.reverse()
+    return chain
+
+
+def _transfer_size(response):
+    for value in (
+        response.get("_transferSize"),
+        response.get("bodySize"),
+        (response.get("content") or {}).get("size"),
+    ):
+        if isinstance(value, int) and value >= 0:
+            return value
+    return 0
+
+
+def _mime_type(response):
+    mime_type = (response.get("content") or {}).get("mimeType") or ""
+    return mime_type.split(";")[0].strip().lower() or "(unknown)"
+
+
+def _cacheability(response):
+    headers = {
+        (header.get("name") or "").lower(): header.get("value") or ""
+        for header in response.get("headers") or []
+    }
+    directives = {}
+    for directive in headers.get("cache-control", "").lower().split(","):
+        name, _, value = directive.strip().partition("=")
+        if name:
+            directives[name] = value.strip('"')
+    max_age = None
+    for name in ("s-maxage", "max-age"):
+        if directives.get(name, "").isdigit():
+            max_age = int(directives[name])
+            break
+    if "no-store" in directives:
+        return "no-store"
+    if "no-cache" in directives or max_age == 0:
+        return "revalidate"
+    if max_age:
+        return "cacheable"
+    if max_age is None and "expires" in headers:
+        # An invalid date such as "0" means already expired
+        expires = _parse_http_date(headers["expires"])
+        date = _parse_http_date(headers.get("date"))
+        if expires is None or (date is not None and expires <= date):
+            return "revalidate"
+        return "cacheable"
+    if "last-modified" in headers or "etag" in headers:
+        return "heuristic"
+    return "none"
+
+
+def _parse_http_date(value):
+    try:
+        parsed = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=datetime.timezone.utc)
+    return parsed
+
+
+def _parse_started(value):
+    "Convert a HAR startedDateTime to milliseconds since the epoch"
+    if not value:
+        return None
+    if value.endswith("Z"):
+        value = value[:-1] + "+00:00"
+    try:
+        return datetime.datetime.fromisoformat(value).timestamp() * 1000
+    except ValueError:
+        return None
+
+
+class EntryFilter:
+    """
+    Decides which HAR entries should be extracted, using only the metadata
+    of each entry so non-matching content is never decoded.
+
+    content_types and url_globs are lists of glob patterns, at least one of
+    which must match. statuses is a list of status codes such as "404" or
+    classes such as "2xx". With first_party=True only entries on the same
+    site as the first request in the HAR, or its subdomains, are matched.
+    """
+
+    def __init__(
+        self,
+        content_types=(),
+        url_globs=(),
+        min_size=None,
+        max_size=None,
+        statuses=(),
+        first_party=False,
+    ):
+        self.content_types = [pattern.lower() for pattern in content_types]
+        self.url_globs = list(url_globs)
+        self.min_size = min_size
+        self.max_size = max_size
+        self.statuses = [parse_status_pattern(status) for status in statuses]
+        self.first_party = first_party
+        self.site = None
+
+    def __bool__(self):
+        return bool(
+            self.content_types
+            or self.url_globs
+            or self.min_size is not None
+            or self.max_size is not None
+            or self.statuses
+            or self.first_party
+        )
+
+    def observe(self, url):
+        "Record the URL of an entry, the first of which defines the site"
+        if self.site is None:
+            self.site = _site_for_host(urllib.parse.urlsplit(url).hostname)
+
+    def matches(self, url, content_type, status, size):
+        if self.min_size is not None and size < self.min_size:
+            return False
+        if self.max_size is not None and size > self.max_size:
+            return False
+        if self.statuses and not any(
+            _status_matches(pattern, status) for pattern in self.statuses
+        ):
+            return False
+        if self.content_types:
+            mime_type = (content_type or "").split(";")[0].strip().lower()
+            if not any(
+                fnmatch.fnmatchcase(mime_type, pattern)
+                for pattern in self.content_types
+            ):
+                return False
+        if self.url_globs and not any(
+            fnmatch.fnmatchcase(url, pattern) for pattern in self.url_globs
+        ):
+            return False
+        if self.first_party:
+            host = _site_for_host(urllib.parse.urlsplit(url).hostname)
+            if not self.site or not (
+                host == self.site or host.endswith("." + self.site)
+            ):
+                return False
+        return True
+
+
+def parse_status_pattern(value):
+    "Validate a status code such as '404' or class such as '2xx'"
+    pattern = str(value).strip().lower()
+    if re.fullmatch(r"[1-5](\d\d|xx)", pattern) is None:
+        raise ValueError(
+            f"Invalid status '{value}' - use a code such as 404 or a class such as 2xx"
+        )
+    return pattern
+
+
+def _status_matches(pattern, status):
+    status = str(status)
+    if pattern.endswith("xx"):
+        return len(status) == 3 and status[0] == pattern[0]
+    return status == pattern
+
+
+def _site_for_host(host):
+    host = (host or "").lower()
+    if host.startswith("www."):
+        host = host[4:]
+    return host
+
+
+class Manifest:
+    """
+    SQLite index of the resources extracted from a HAR file, with one row
+    in the resources table for each entry.
+
+    Rows are added in entry order. The file details are filled in later
+    using set_file(), once the resource has been written.
+    """
+
+    columns = (
+        "url",
+        "method",
+        "status",
+        "mime_type",
+        "path",
+        "sha256",
+        "size",
+        "started",
+        "time",
+    ) + TIMINGS
+    indexes = ("url", "mime_type", "status", "size", "time", "sha256")
+
+    def __init__(self, path):
+        if os.path.exists(path):
+            os.remove(path)
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("""
+            create table resources (
+                id integer primary key,
+                url text,
+                method text,
+                status integer,
+                mime_type text,
+                path text,
+                sha256 text,
+                size integer,
+                started text,
+                time real,
+                {}
+            )
+            """.format(", ".join(f"{timing} real" for timing in TIMINGS)))
+        self._insert_sql = "insert into resources ({}) values ({})".format(
+            ", ".join(self.columns), ", ".join("?" for _ in self.columns)
+        )
+
+    def add(self, entry):
+        "Add a row for this HAR entry, returning its id"
+        request = entry.get("request") or {}
+        response = entry.get("response") or {}
+        content = response.get("content") or {}
+        timings = entry.get("timings") or {}
+        size = content.get("size")
+        row = {
+            "url": request.get("url"),
+            "method": request.get("method"),
+            "status": response.get("status"),
+            "mime_type": content.get("mimeType"),
+            "size": size if isinstance(size, int) and size >= 0 else None,
+            "started": entry.get("startedDateTime"),
+            "time": entry.get("time"),
+        }
+        for timing in TIMINGS:
+            # HAR uses -1 for timings that do not apply
+            value = timings.get(timing)
+            row[timing] = (
+                value if isinstance(value, (int, float)) and value >= 0 else None
+            )
+        cursor = self.conn.execute(
+            self._insert_sql, [row.get(column) for column in self.columns]
+        )
+        return cursor.lastrowid
+
+    def set_file(self, row_id, path, sha256, size):
+        self.conn.execute(
+            "update resources set path = ?, sha256 = ?, size = ? where id = ?",
+            (path, sha256, size, row_id),
+        )
+
+    def close(self):
+        for column in self.indexes:
+            self.conn.execute(
+                f"create index idx_resources_{column} on resources ({column})"
+            )
+        self.conn.commit()
+        self.conn.close()
+
+
+class HarDatabase:
+    """
+    SQLite database of the requests from any number of HAR files, for
+    comparing captures across runs.
+
+    Each run has a name and can include several HAR files. The requests
+    table has a row per HAR entry. Response bodies are optional - when
+    they are stored, each distinct body is kept once in the bodies table,
+    keyed by its sha256.
+    """
+
+    schema = """
+        create table if not exists runs (
+            id integer primary key,
+            name text unique,
+            imported text
+        );
+        create table if not exists requests (
+            id integer primary key,
+            run_id integer references runs(id),
+            har_path text,
+            url text,
+            domain text,
+            method text,
+            status integer,
+            mime_type text,
+            started text,
+            time real,
+            size integer,
+            transfer_size integer,
+            body_sha256 text references bodies(sha256),
+            {}
+        );
+        create table if not exists bodies (
+            sha256 text primary key,
+            size integer,
+            content blob
+        );
+        create index if not exists idx_requests_run_id on requests (run_id);
+        create index if not exists idx_requests_url on requests (url);
+        create index if not exists idx_requests_domain on requests (domain);
+        create index if not exists idx_requests_mime_type on requests (mime_type);
+    """.format(", ".join(f"{timing} real" for timing in TIMINGS))
+    columns = (
+        "run_id",
+        "har_path",
+        "url",
+        "domain",
+        "method",
+        "status",
+        "mime_type",
+        "started",
+        "time",
+        "size",
+        "transfer_size",
+        "body_sha256",
+    ) + TIMINGS
+
+    def __init__(self, path):
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript(self.schema)
+        self._insert_sql = "insert into requests ({}) values ({})".format(
+            ", ".join(self.columns), ", ".join("?" for _ in self.columns)
+        )
+
+    def start_run(self, name, replace=False):
+        """
+        Create a run with this name, returning its id. If the run already
+        exists it is replaced if replace is True, otherwise HarError is raised.
+        """
+        with self.conn:
+            existing = self.conn.execute(
+                "select id from runs where name = ?", (name,)
+            ).fetchone()
+            if existing:
+                if not replace:
+                    raise HarError(f"Run '{name}' has already been imported")
+                self.conn.execute(
+                    "delete from requests where run_id = ?", (existing[0],)
+                )
+                self.conn.execute("delete from runs where id = ?", (existing[0],))
+                self.conn.execute("""
+                    delete from bodies where sha256 not in (
+                        select body_sha256 from requests
+                        where body_sha256 is not null
+                    )
+                    """)
+            imported = datetime.datetime.now(datetime.timezone.utc).isoformat()
+            return self.conn.execute(
+                "insert into runs (name, imported) values (?, ?)", (name, imported)
+            ).lastrowid
+
+    def import_har(self, har_path, run_id, bodies=False):
+        """
+        Stream the entries of a .har or .har.zip file into the requests
+        table, returning the number of requests imported.
+        """
+        count = 0
+        har_dir = os.path.dirname(os.path.abspath(har_path))
+        with self.conn, open_har(har_path) as (entries, zip_file):
+            for entry in entries:
+                request = entry.get("request") or {}
+                response = entry.get("response") or {}
+                content = response.get("content") or {}
+                timings = entry.get("timings") or {}
+                url = request.get("url") or ""
+                mime_type = _mime_type(response)
+                size = content.get("size")
+                row = {
+                    "run_id": run_id,
+                    "har_path": str(har_path),
+                    "url": url,
+                    "domain": urllib.parse.urlsplit(url).hostname,
+                    "method": request.get("method"),
+                    "status": response.get("status"),
+                    "mime_type": None if mime_type == "(unknown)" else mime_type,
+                    "started": entry.get("startedDateTime"),
+                    "time": entry.get("time"),
+                    "size": size if isinstance(size, int) and size >= 0 else None,
+                    "transfer_size": _transfer_size(response) or None,
+                }
+                for timing in TIMINGS:
+                    value = timings.get(timing)
+                    row[timing] = (
+                        value
+                        if isinstance(value, (int, float)) and value >= 0
+                        else None
+                    )
+                if bodies:
+                    body = _entry_body(content, zip_file, har_dir)
+                    if body:
+                        row["body_sha256"] = hashlib.sha256(body).hexdigest()
+                        self.conn.execute(
+                            "insert or ignore into bodies (sha256, size, content) "
+                            "values (?, ?, ?)",
+                            (row["body_sha256"], len(body), body),
+                        )
+                self.conn.execute(
+                    self._insert_sql, [row.get(column) for column in self.columns]
+                )
+                count += 1
+        return count
+
+    def close(self):
+        self.conn.close()
+
+
+def _entry_body(content, zip_file=None, har_dir=None):
+    "The response body for a HAR entry's content, as bytes, or None"
+    file_ref = content.get("_file")
+    if file_ref:
+        try:
+            if zip_file is not None:
+                return zip_file.read(file_ref)
+            if har_dir is not None:
+                path = attached_file_path(har_dir, file_ref)
+                if path is None:
+                    return None
+                with open(path, "rb") as fp:
+                    return fp.read()
+        except (KeyError, OSError):
+            return None
+        return None
+    text = content.get("text")
+    if not text:
+        return None
+    if content.get("encoding") == "base64":
+        try:
+            return b"".join(iter_base64_chunks(text))
+        except ValueError:
+            return None
+    return text.encode("utf-8")
+
+
+class _JSONScanner:
+    """
+    Walks the structure of a JSON document read from a file in chunks.
+
+    Values can be skipped without being decoded, or captured as JSON text.
+    Captured text is accumulated as a list of pieces, so capturing a very
+    large value does not repeatedly copy the buffer.
+    """
+
+    def __init__(self, fp, chunk_size):
+        self.fp = fp
+        self.chunk_size = chunk_size
+        self.buffer = ""
+        self.pos = 0
+        self.captured = None
+        self.capture_start = 0
+
+    def _read_more(self):
+        chunk = self.fp.read(self.chunk_size)
+        if not chunk:
+            raise HarError("Unexpected end of HAR file")
+        if self.captured is not None:
+            self.captured.append(self.buffer[self.capture_start :])
+            self.capture_start = 0
+            self.buffer = chunk
+        else:
+            self.buffer = self.buffer[self.pos :] + chunk
+        self.pos = 0
+
+    def peek(self):
+        while True:
+            while self.pos < len(self.buffer):
+                char = self.buffer[self.pos]
+                if char not in _WHITESPACE:
+                    return char
+                self.pos += 1
+            self._read_more()
+
+    def expect(self, expected):
+        char = self.peek()
+        if char not in expected:
+            raise HarError(f"Invalid HAR file: expected {expected!r}, got {char!r}")
+        self.pos += 1
+        return char
+
+    def object_keys(self):
+        """
+        Iterate over the keys of the object at the current position. The
+        caller must consume each value before asking for the next key.
+        """
+        self.expect("{")
+        if self.peek() == "}":
+            self.pos += 1
+            return
+        while True:
+            if self.peek() != '"':
+                raise HarError("Invalid HAR file: expected an object key")
+            key = json.loads(self.capture_value())
+            self.expect(":")
+            yield key
+            if self.expect(",}") == "}":
+                return
+
+    def array_items(self):
+        """
+        Iterate over the items of the array at the current position. The
+        caller must consume each value before asking for the next item.
+        """
+        self.expect("[")
+        if self.peek() == "]":
+            self.pos += 1
+            return
+        while True:
+            yield
+            if self.expect(",]") == "]":
+                return
+
+    def capture_value(self):
+        "Consume the next value and return it as JSON text"
+        self.peek()
+        self.captured = []
+        self.capture_start = self.pos
+        try:
+            self.skip_value()
+            self.captured.append(self.buffer[self.capture_start : self.pos])
+            return "".join(self.captured)
+        finally:
+            self.captured = None
+
+    def skip_value(self):
+        "Consume the next value without decoding it"
+        char = self.peek()
+        if char == '"':
+            self.pos += 1
+            self._skip_string()
+        elif char in "{[":
+            depth = 0
+            while True:
+                match = _STRUCTURE_RE.search(self.buffer, self.pos)
+                if match is None:
+                    self.pos = len(self.buffer)
+                    self._read_more()
+                    continue
+                self.pos = match.end()
+                char = match.group()
+                if char == '"':
+                    self._skip_string()
+                elif char in "{[":
+                    depth += 1
+                else:
+                    depth -= 1
+                    if depth == 0:
+                        return
+        elif char in ",:]}":
+            raise HarError(f"Invalid HAR file: unexpected {char!r}")
+        else:
+            # Numbers, true, false and null
+            while True:
+                match = _SCALAR_END_RE.search(self.buffer, self.pos)
+                if match is not None:
+                    self.pos = match.start()
+                    return
+                self.pos = len(self.buffer)
+                self._read_more()
+
+    def _skip_string(self):
+        # Called with the position just after the opening quote. str.find()
+        # is much faster than a regular expression over long strings such as
+        # base64 encoded bodies. quote is None when it needs finding again.
+        quote = None
+        while True:
+            if quote is None or -1 < quote < self.pos:
+                quote = self.buffer.find('"', self.pos)
+            end = len(self.buffer) if quote == -1 else quote
+            backslash = self.buffer.find("\\", self.pos, end)
+            if backslash != -1:
+                # Skip the character following the backslash
+                self.pos = backslash + 1
+                if self.pos == len(self.buffer):
+                    self._read_more()
+                    quote = None
+                self.pos += 1
+            elif quote == -1:
+                self.pos = len(self.buffer)
+                self._read_more()
+                quote = None
+            else:
+                self.pos = quote + 1
+                return
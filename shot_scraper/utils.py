@@ -1,3 +1,4 @@
+import fnmatch
 import urllib.parse
 import re
 import os.path
@@ -50,18 +51,49 @@ def file_exists_never(filename):
     return False
 
 
-def filename_for_url(url, ext=None, file_exists=file_exists_never):
+class FilenameAllocator:
+    """
+    Hands out filenames of the form base.ext, base.1.ext, base.2.ext that do
+    not collide with existing files or with each other.
+
+    Existing files are found with a single scan of directory, if provided,
+    and/or by calling file_exists(filename). The next suffix to try is
+    tracked for each base and extension, so allocating many names with the
+    same base does not re-check all of the earlier names each time.
+    """
+
+    def __init__(self, directory=None, file_exists=file_exists_never):
+        self.taken = set()
+        self.file_exists = file_exists
+        self.next_suffix = {}
+        if directory is not None and os.path.isdir(directory):
+            self.taken.update(os.listdir(directory))
+
+    def reserve(self, filename):
+        "Mark filename as taken without allocating it"
+        self.taken.add(filename)
+
+    def allocate(self, base, ext):
+        key = (base, ext)
+        suffix = self.next_suffix.get(key, 0)
+        while True:
+            filename = f"{base}.{suffix}.{ext}" if suffix else f"{base}.{ext}"
+            suffix += 1
+            if filename not in self.taken and not self.file_exists(filename):
+                break
+        self.next_suffix[key] = suffix
+        self.taken.add(filename)
+        return filename
+
+
+def filename_for_url(url, ext=None, file_exists=file_exists_never, allocator=None):
     ext = ext or "png"
     bits = urllib.parse.urlparse(url)
     filename = (bits.netloc + bits.path).replace(".", "-").replace("/", "-").rstrip("-")
     # Remove any characters outside of the allowed range
     base_filename = disallowed_re.sub("", filename).lstrip("-")
-    filename = base_filename + "." + ext
-    suffix = 0
-    while file_exists(filename):
-        suffix += 1
-        filename = f"{base_filename}.{suffix}.{ext}"
-    return filename
+    allocator = allocator or FilenameAllocator(file_exists=file_exists)
+    return allocator.allocate(base_filename, ext)
 
 
 def url_or_file_path(url, file_exists=file_exists_never):
@@ -74,6 +106,45 @@ def url_or_file_path(url, file_exists=file_exists_never):
     return url
 
 
+def parse_host_mapping(rules):
+    """
+    Parse host=address rules into a {host: address} dictionary.
+
+    The address can include a port, e.g. example.com=127.0.0.1:8000 - and
+    the host can use * wildcards. Blank lines and # comments are ignored.
+    """
+    mapping = {}
+    for rule in rules:
+        rule = rule.split("#")[0].strip()
+        if not rule:
+            continue
+        host, _, address = rule.partition("=")
+        host = host.strip()
+        address = address.strip()
+        if not host or not address or any(c in host + address for c in " ,"):
+            raise ValueError(f"Invalid host mapping '{rule}', expected host=address")
+        mapping[host] = address
+    return mapping
+
+
+def apply_host_mapping(url, mapping):
+    """
+    Return url with its host replaced by the matching address from mapping,
+    keeping the original port unless the address specifies one.
+    """
+    if not mapping:
+        return url
+    bits = urllib.parse.urlparse(url)
+    if not bits.hostname:
+        return url
+    for host, address in mapping.items():
+        if fnmatch.fnmatch(bits.hostname, host):
+            if not re.search(r":\d+$", address) and bits.port:
+                address = f"{address}:{bits.port}"
+            return urllib.parse.urlunparse(bits._replace(netloc=address))
+    return url
+
+
 def load_github_script(github_path: str) -> str:
     """
     Load JavaScript script from GitHub
@@ -129,7 +200,9 @@ def extension_for_content_type(content_type):
     return CONTENT_TYPE_EXTENSIONS.get(mime_type)
 
 
-def filename_for_har_entry(url, content_type, file_exists=file_exists_never):
+def filename_for_har_entry(
+    url, content_type, file_exists=file_exists_never, allocator=None
+):
     """
     Derive a filename for a HAR entry based on its URL and content-type.
 
@@ -137,6 +210,8 @@ def filename_for_har_entry(url, content_type, file_exists=file_exists_never):
     - If the URL has an extension that matches the content-type, use it
     - If the URL has no extension, or the extension doesn't match, use content-type
     - If neither URL nor content-type provide an extension, use .bin
+
+    Pass a FilenameAllocator to avoid names allocated by earlier calls.
     """
     bits = urllib.parse.urlparse(url)
     url_path = bits.path
@@ -177,9 +252,5 @@ def filename_for_har_entry(url, content_type, file_exists=file_exists_never):
     else:
         ext = "bin"
 
-    filename = f"{base}.{ext}"
-    suffix = 0
-    while file_exists(filename):
-        suffix += 1
-        filename = f"{base}.{suffix}.{ext}"
-    return filename
+    allocator = allocator or FilenameAllocator(file_exists=file_exists)
+    return allocator.allocate(base, ext)
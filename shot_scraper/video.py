@@ -1,3 +1,4 @@
+import pathlib
 from typing import Annotated, Literal, Union
 
 import yaml
@@ -6,6 +7,7 @@ from pydantic import (
     ConfigDict,
     Field,
     NonNegativeFloat,
+    PositiveFloat,
     PositiveInt,
     ValidationError,
     field_validator,
@@ -169,6 +171,29 @@ STORYBOARD_ACTIONS = {
 }
 
 
+class VideoExport(StoryboardBaseModel):
+    format: Literal["mp4", "gif", "webm", "png"]
+    output: str | None = None
+    width: PositiveInt | None = None
+    height: PositiveInt | None = None
+    fps: PositiveFloat | None = None
+    at: NonNegativeFloat | None = None
+
+    @model_validator(mode="after")
+    def validate_export(self):
+        if self.format == "png" and self.fps is not None:
+            raise ValueError("fps: cannot be used with format: png")
+        if self.format != "png" and self.at is not None:
+            raise ValueError("at: can only be used with format: png")
+        return self
+
+    def output_path(self, video_output):
+        "The output filename, defaulting to the video filename with a new suffix"
+        if self.output:
+            return self.output
+        return str(pathlib.Path(video_output).with_suffix(f".{self.format}"))
+
+
 class StoryboardScene(StoryboardBaseModel):
     name: str | None = None
     open: str | None = None
@@ -201,6 +226,20 @@ class Storyboard(StoryboardBaseModel):
     wait_for_url: str | None = None
     javascript: str | None = None
     scenes: list[StoryboardScene] = Field(default_factory=list)
+    exports: list[VideoExport] = Field(default_factory=list)
+
+    @field_validator("exports", mode="before")
+    @classmethod
+    def normalize_exports(cls, exports):
+        if exports is None:
+            return []
+        if not isinstance(exports, list):
+            raise ValueError("exports: must be a list")
+        # "- gif" is short for "- format: gif"
+        return [
+            {"format": export} if isinstance(export, str) else export
+            for export in exports
+        ]
 
     @field_validator("cursor", mode="before")
     @classmethod
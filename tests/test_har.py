@@ -0,0 +1,1071 @@
+import asyncio
+import base64
+import datetime
+import hashlib
+import io
+import json
+import os
+import pathlib
+import urllib.parse
+import zipfile
+
+import pytest
+from click.testing import CliRunner
+
+from shot_scraper import cli as cli_module
+from shot_scraper.cli import _extract_har_resources, cli
+from shot_scraper.har import (
+    HarError,
+    Manifest,
+    copy_stored_member,
+    base64_decoded_size,
+    iter_base64_chunks,
+    iter_har_entries,
+    open_har,
+)
+
+HAR = {
+    "log": {
+        "version": "1.2",
+        "creator": {"name": "Playwright", "version": "1.50"},
+        "pages": [{"id": "page@1", "title": 'Page with "quotes" and {braces}'}],
+        "entries": [
+            {
+                "request": {"url": "https://example.com/", "headers": []},
+                "response": {
+                    "status": 200,
+                    "content": {
+                        "size": 32,
+                        "mimeType": "text/html",
+                        "text": '<p class="x">[{ \\ }]</p>\n☃',
+                    },
+                },
+                "time": 12.5,
+                "cache": {},
+            },
+            {
+                "request": {"url": "https://example.com/empty.js"},
+                "response": {"status": 204, "content": {"size": -1}},
+                "_serverIPAddress": None,
+                "pageref": "page@1",
+                "comment": 'escapes \\"\\\\" ending in a backslash \\',
+                "flags": [True, False, 1e-3],
+            },
+        ],
+        "comment": "after entries",
+    },
+    "extra": [{"log": {"entries": [{"ignored": True}]}}],
+}
+
+
+@pytest.mark.parametrize("chunk_size", (1, 3, 7, 4096))
+@pytest.mark.parametrize("indent", (None, 2))
+def test_iter_har_entries(chunk_size, indent):
+    data = json.dumps(HAR, indent=indent)
+    entries = list(iter_har_entries(io.StringIO(data), chunk_size=chunk_size))
+    assert entries == HAR["log"]["entries"]
+    # Binary files are decoded as UTF-8
+    data = json.dumps(HAR, indent=indent, ensure_ascii=False).encode("utf-8")
+    entries = list(iter_har_entries(io.BytesIO(data), chunk_size=chunk_size))
+    assert entries == HAR["log"]["entries"]
+
+
+@pytest.mark.parametrize(
+    "data",
+    (
+        {},
+        {"log": {}},
+        {"log": {"entries": []}},
+    ),
+)
+def test_iter_har_entries_no_entries(data):
+    assert list(iter_har_entries(io.StringIO(json.dumps(data)))) == []
+
+
+@pytest.mark.parametrize(
+    "data",
+    (
+        "",
+        '{"log": {"entries": [{"request": {}}',
+        '{"log": {"entries": [1 2]}}',
+        '["log"]',
+        '{"log" 1}',
+    ),
+)
+def test_iter_har_entries_invalid(data):
+    with pytest.raises(HarError):
+        list(iter_har_entries(io.StringIO(data), chunk_size=4))
+
+
+def test_open_har_zip(tmp_path):
+    path = tmp_path / "trace.har.zip"
+    with zipfile.ZipFile(path, "w") as zf:
+        zf.writestr("har.har", json.dumps(HAR))
+        zf.writestr("abc.js", "1")
+    with open_har(path, chunk_size=5) as (entries, zip_file):
+        assert list(entries) == HAR["log"]["entries"]
+        assert zip_file.read("abc.js") == b"1"
+
+
+def test_extract_har_resources(tmp_path):
+    path = tmp_path / "trace.har"
+    path.write_text(json.dumps(HAR))
+    _extract_har_resources(path)
+    files = list((tmp_path / "trace").iterdir())
+    assert len(files) == 1
+    assert (
+        files[0].read_text("utf-8")
+        == HAR["log"]["entries"][0]["response"]["content"]["text"]
+    )
+
+
+def _har_with_duplicates(count):
+    return {
+        "log": {
+            "entries": [
+                {
+                    "request": {"url": "https://example.com/app.js?v={}".format(i)},
+                    "response": {
+                        "headers": [
+                            {"name": "Content-Type", "value": "text/javascript"}
+                        ],
+                        "content": {
+                            "encoding": "base64",
+                            "text": base64.b64encode(
+                                "console.log({})".format(i).encode()
+                            ).decode(),
+                        },
+                    },
+                }
+                for i in range(count)
+            ]
+        }
+    }
+
+
+@pytest.mark.parametrize("workers", (1, 3))
+def test_har_extract(tmp_path, workers):
+    path = tmp_path / "trace.har"
+    path.write_text(json.dumps(_har_with_duplicates(20)))
+    runner = CliRunner()
+    result = runner.invoke(
+        cli,
+        ["har-extract", str(path), "-o", str(tmp_path / "out"), "--workers", workers],
+    )
+    assert result.exit_code == 0, result.output
+    # Filenames are allocated in entry order regardless of worker scheduling
+    assert (tmp_path / "out" / "example-com-app-js.js").read_text() == "console.log(0)"
+    for i in range(1, 20):
+        assert (
+            tmp_path / "out" / f"example-com-app-js.{i}.js"
+        ).read_text() == f"console.log({i})"
+
+
+def test_har_extract_invalid_base64_uses_no_name(tmp_path):
+    har = _har_with_duplicates(3)
+    har["log"]["entries"][1]["response"]["content"]["text"] = "Q"
+    path = tmp_path / "trace.har"
+    path.write_text(json.dumps(har))
+    result = CliRunner().invoke(cli, ["har-extract", str(path)])
+    assert result.exit_code == 0, result.output
+    out = tmp_path / "trace"
+    assert sorted(p.name for p in out.iterdir()) == [
+        "example-com-app-js.1.js",
+        "example-com-app-js.js",
+    ]
+    assert (out / "example-com-app-js.1.js").read_text() == "console.log(2)"
+
+
+def test_har_extract_dedupe(tmp_path):
+    har = _har_with_duplicates(5)
+    # Entries 1-4 share the same content
+    for entry in har["log"]["entries"][1:]:
+        entry["response"]["content"]["text"] = base64.b64encode(b"shared").decode()
+    path = tmp_path / "trace.har"
+    path.write_text(json.dumps(har))
+    runner = CliRunner()
+    result = runner.invoke(cli, ["har-extract", str(path), "--dedupe"])
+    assert result.exit_code == 0, result.output
+    assert "Linked 3 duplicate files, saving 18 bytes" in result.output
+    out = tmp_path / "trace"
+    paths = [out / "example-com-app-js.js"] + [
+        out / f"example-com-app-js.{i}.js" for i in range(1, 5)
+    ]
+    assert sorted(out.iterdir()) == sorted(paths)
+    assert paths[0].read_text() == "console.log(0)"
+    assert paths[0].stat().st_nlink == 1
+    assert {p.read_text() for p in paths[1:]} == {"shared"}
+    assert {p.stat().st_ino for p in paths[1:]} == {paths[1].stat().st_ino}
+
+
+def test_har_extract_dedupe_skips_duplicate_writes(tmp_path, mocker):
+    har = _har_with_duplicates(4)
+    for entry in har["log"]["entries"]:
+        entry["response"]["content"]["text"] = base64.b64encode(b"shared").decode()
+    path = tmp_path / "trace.har"
+    path.write_text(json.dumps(har))
+    real_open = open
+    written = []
+
+    def tracking_open(file, mode="r", *args, **kwargs):
+        if "w" in mode:
+            written.append(pathlib.Path(file).name)
+        return real_open(file, mode, *args, **kwargs)
+
+    mocker.patch("builtins.open", side_effect=tracking_open)
+    out = tmp_path / "out"
+    result = CliRunner().invoke(
+        cli,
+        ["har-extract", str(path), "-o", str(out), "--dedupe", "--workers", "1"],
+    )
+    assert result.exit_code == 0, result.output
+    # Only the first copy of the content is written
+    assert written == [".example-com-app-js.js.partial"]
+    assert len({p.stat().st_ino for p in out.iterdir()}) == 1
+    assert len(list(out.iterdir())) == 4
+
+
+def test_har_extract_over_deduped_files(tmp_path):
+    # Extracting again must not write through hardlinks from --dedupe
+    har = _har_with_duplicates(2)
+    for entry in har["log"]["entries"]:
+        entry["response"]["content"]["text"] = base64.b64encode(b"shared").decode()
+    path = tmp_path / "trace.har"
+    path.write_text(json.dumps(har))
+    out = tmp_path / "out"
+    runner = CliRunner()
+    result = runner.invoke(cli, ["har-extract", str(path), "-o", str(out), "--dedupe"])
+    assert result.exit_code == 0, result.output
+    first, second = out / "example-com-app-js.js", out / "example-com-app-js.1.js"
+    assert first.stat().st_ino == second.stat().st_ino
+    path.write_text(json.dumps(_har_with_duplicates(2)))
+    result = runner.invoke(cli, ["har-extract", str(path), "-o", str(out)])
+    assert result.exit_code == 0, result.output
+    assert first.read_text() == "console.log(0)"
+    assert second.read_text() == "console.log(1)"
+    assert sorted(out.iterdir()) == sorted([first, second])
+
+
+@pytest.mark.parametrize("chunk_size", (1, 4, 6, 1024))
+def test_iter_base64_chunks(chunk_size):
+    data = bytes(range(256)) * 3
+    encoded = base64.b64encode(data).decode()
+    assert b"".join(iter_base64_chunks(encoded, chunk_size)) == data
+    # Line breaks are ignored, as with base64.b64decode()
+    wrapped = "\n".join(encoded[i : i + 76] for i in range(0, len(encoded), 76))
+    assert b"".join(iter_base64_chunks(wrapped, chunk_size)) == data
+    assert base64_decoded_size(wrapped) == len(data)
+
+
+@pytest.mark.parametrize(
+    "text,expected",
+    (
+        ("QUJD", b"ABC"),
+        ("QUI=", b"AB"),
+        ("QUI", b"AB"),
+        ("QQ==\n", b"A"),
+        ("", b""),
+        ("Q", None),
+        ("QUJDR===", None),
+    ),
+)
+def test_base64_decoded_size(text, expected):
+    if expected is None:
+        assert base64_decoded_size(text) is None
+        with pytest.raises(ValueError):
+            b"".join(iter_base64_chunks(text, 4))
+    else:
+        assert base64_decoded_size(text) == len(expected)
+        assert b"".join(iter_base64_chunks(text, 4)) == expected
+
+
+@pytest.mark.parametrize("sendfile", (True, False))
+def test_copy_stored_member(tmp_path, monkeypatch, sendfile):
+    if not sendfile:
+        monkeypatch.delattr(os, "sendfile", raising=False)
+    data = os.urandom(10000)
+    path = tmp_path / "trace.har.zip"
+    with zipfile.ZipFile(path, "w") as zf:
+        zf.writestr("first.bin", b"first", compress_type=zipfile.ZIP_STORED)
+        zf.writestr("data.bin", data, compress_type=zipfile.ZIP_STORED)
+    with zipfile.ZipFile(path) as zf:
+        copy_stored_member(path, zf.getinfo("data.bin"), tmp_path / "out.bin", 999)
+    assert (tmp_path / "out.bin").read_bytes() == data
+    # Copying over a hardlink replaces it instead of writing through it
+    os.link(tmp_path / "out.bin", tmp_path / "linked.bin")
+    with zipfile.ZipFile(path) as zf:
+        copy_stored_member(path, zf.getinfo("first.bin"), tmp_path / "out.bin", 999)
+    assert (tmp_path / "out.bin").read_bytes() == b"first"
+    assert (tmp_path / "linked.bin").read_bytes() == data
+    assert sorted(p.name for p in tmp_path.iterdir()) == [
+        "linked.bin",
+        "out.bin",
+        "trace.har.zip",
+    ]
+
+
+@pytest.mark.parametrize("dedupe", (False, True))
+def test_har_extract_zip(tmp_path, dedupe):
+    path = tmp_path / "trace.har.zip"
+    har = {
+        "log": {
+            "entries": [
+                {
+                    "request": {"url": f"https://example.com/{name}"},
+                    "response": {
+                        "headers": [{"name": "content-type", "value": "image/png"}],
+                        "content": {"_file": name},
+                    },
+                }
+                for name in ("stored.png", "deflated.png", "missing.png", "empty.png")
+            ]
+        }
+    }
+    with zipfile.ZipFile(path, "w") as zf:
+        zf.writestr("har.har", json.dumps(har))
+        zf.writestr("stored.png", b"stored", compress_type=zipfile.ZIP_STORED)
+        zf.writestr("deflated.png", b"deflated" * 100, zipfile.ZIP_DEFLATED)
+        zf.writestr("empty.png", b"")
+    args = ["har-extract", str(path)] + (["--dedupe"] if dedupe else [])
+    result = CliRunner().invoke(cli, args)
+    assert result.exit_code == 0, result.output
+    out = tmp_path / "trace"
+    assert sorted(p.name for p in out.iterdir()) == [
+        "example-com-deflated.png",
+        "example-com-stored.png",
+    ]
+    assert (out / "example-com-stored.png").read_bytes() == b"stored"
+    assert (out / "example-com-deflated.png").read_bytes() == b"deflated" * 100
+
+
+FILTER_HAR = {
+    "log": {
+        "entries": [
+            {
+                "request": {"url": url},
+                "response": {
+                    "status": status,
+                    "headers": [{"name": "Content-Type", "value": content_type}],
+                    "content": {
+                        "encoding": "base64",
+                        "text": base64.b64encode(b"x" * size).decode(),
+                    },
+                },
+            }
+            for url, status, content_type, size in (
+                ("https://www.example.com/", 200, "text/html; charset=utf-8", 100),
+                ("https://cdn.example.com/logo.png", 200, "image/png", 5000),
+                ("https://example.com/missing.png", 404, "image/png", 10),
+                ("https://tracker.net/pixel.gif", 200, "image/gif", 1),
+                ("https://example.com/app.js", 304, "text/javascript", 2),
+            )
+        ]
+    }
+}
+
+
+@pytest.mark.parametrize(
+    "args,expected",
+    (
+        ([], ["/", "/logo.png", "/missing.png", "/pixel.gif", "/app.js"]),
+        (["--content-type", "image/*"], ["/logo.png", "/missing.png", "/pixel.gif"]),
+        (["--content-type", "TEXT/HTML"], ["/"]),
+        (
+            ["--url-glob", "*.png", "--url-glob", "*.js"],
+            ["/logo.png", "/missing.png", "/app.js"],
+        ),
+        (["--min-size", "10", "--max-size", "100"], ["/", "/missing.png"]),
+        (["--status", "200"], ["/", "/logo.png", "/pixel.gif"]),
+        (["--status", "3xx", "--status", "404"], ["/missing.png", "/app.js"]),
+        (["--first-party"], ["/", "/logo.png", "/missing.png", "/app.js"]),
+        (
+            ["--first-party", "--content-type", "image/*", "--status", "2xx"],
+            ["/logo.png"],
+        ),
+    ),
+)
+def test_har_extract_filters(tmp_path, args, expected):
+    path = tmp_path / "trace.har"
+    path.write_text(json.dumps(FILTER_HAR))
+    result = CliRunner().invoke(cli, ["har-extract", str(path), "--manifest"] + args)
+    assert result.exit_code == 0, result.output
+    # Skipped entries are still listed in the manifest, without a path
+    result = CliRunner().invoke(
+        cli,
+        [
+            "har-query",
+            str(tmp_path / "trace"),
+            "select url, path from resources order by id",
+        ],
+    )
+    rows = json.loads(result.output)
+    assert len(rows) == 5
+    extracted = [urllib.parse.urlsplit(row["url"]).path for row in rows if row["path"]]
+    assert extracted == expected
+    assert len(list((tmp_path / "trace").iterdir())) == len(expected) + 1
+
+
+def test_har_extract_filters_skip_decoding(tmp_path, mocker):
+    path = tmp_path / "trace.har"
+    path.write_text(json.dumps(FILTER_HAR))
+    chunks = mocker.patch.object(
+        cli_module, "iter_base64_chunks", side_effect=iter_base64_chunks
+    )
+    result = CliRunner().invoke(
+        cli, ["har-extract", str(path), "--min-size", "1000", "--workers", "1"]
+    )
+    assert result.exit_code == 0, result.output
+    assert chunks.call_count == 1
+    assert [p.name for p in (tmp_path / "trace").iterdir()] == [
+        "cdn-example-com-logo.png"
+    ]
+
+
+def test_har_extract_filters_invalid_status(tmp_path):
+    path = tmp_path / "trace.har"
+    path.write_text(json.dumps(FILTER_HAR))
+    result = CliRunner().invoke(cli, ["har-extract", str(path), "--status", "20x"])
+    assert result.exit_code == 2
+    assert "Invalid status '20x'" in result.output
+
+
+def test_har_extract_manifest(tmp_path):
+    har = _har_with_duplicates(3)
+    har["log"]["entries"][0].update(
+        {
+            "startedDateTime": "2025-01-01T00:00:00.000Z",
+            "time": 52.5,
+            "timings": {"dns": -1, "connect": 10, "wait": 40.5, "receive": 2},
+        }
+    )
+    for entry in har["log"]["entries"]:
+        entry["request"]["method"] = "GET"
+        entry["response"]["status"] = 200
+        entry["response"]["content"]["mimeType"] = "text/javascript"
+    # An entry with no content still gets a row
+    har["log"]["entries"].append(
+        {
+            "request": {"url": "https://example.com/204", "method": "POST"},
+            "response": {"status": 204, "content": {"size": 0}},
+        }
+    )
+    path = tmp_path / "trace.har"
+    path.write_text(json.dumps(har))
+    runner = CliRunner()
+    result = runner.invoke(cli, ["har-extract", str(path), "--manifest"])
+    assert result.exit_code == 0, result.output
+    out = tmp_path / "trace"
+    assert (out / "manifest.db").exists()
+
+    result = runner.invoke(
+        cli,
+        [
+            "har-query",
+            str(out),
+            "select url, method, status, mime_type, path, sha256, size, "
+            "time, dns, connect, wait from resources order by id",
+        ],
+    )
+    assert result.exit_code == 0, result.output
+    rows = json.loads(result.output)
+    assert rows[0] == {
+        "url": "https://example.com/app.js?v=0",
+        "method": "GET",
+        "status": 200,
+        "mime_type": "text/javascript",
+        "path": "example-com-app-js.js",
+        "sha256": hashlib.sha256(b"console.log(0)").hexdigest(),
+        "size": 14,
+        "time": 52.5,
+        "dns": None,
+        "connect": 10.0,
+        "wait": 40.5,
+    }
+    assert [row["path"] for row in rows] == [
+        "example-com-app-js.js",
+        "example-com-app-js.1.js",
+        "example-com-app-js.2.js",
+        None,
+    ]
+    assert rows[3]["status"] == 204
+
+    result = runner.invoke(
+        cli,
+        [
+            "har-query",
+            str(out / "manifest.db"),
+            "select path, size from resources where path is not null limit 2",
+            "--csv",
+        ],
+    )
+    assert result.exit_code == 0, result.output
+    assert result.output.splitlines() == [
+        "path,size",
+        "example-com-app-js.js,14",
+        "example-com-app-js.1.js,14",
+    ]
+
+
+def test_har_query_errors(tmp_path):
+    runner = CliRunner()
+    result = runner.invoke(cli, ["har-query", str(tmp_path)])
+    assert result.exit_code == 1
+    assert "No manifest.db found in that directory" in result.output
+    Manifest(tmp_path / "manifest.db").close()
+    result = runner.invoke(cli, ["har-query", str(tmp_path), "select * from nope"])
+    assert result.exit_code == 1
+    assert "no such table: nope" in result.output
+
+
+@pytest.mark.parametrize("sql", ("select * from resources", "select * from nope"))
+def test_har_query_closes_connection(tmp_path, mocker, sql):
+    Manifest(tmp_path / "manifest.db").close()
+    connections = []
+    connect = cli_module.sqlite3.connect
+
+    def tracking_connect(*args, **kwargs):
+        connections.append(mocker.MagicMock(wraps=connect(*args, **kwargs)))
+        return connections[-1]
+
+    mocker.patch.object(cli_module.sqlite3, "connect", side_effect=tracking_connect)
+    CliRunner().invoke(cli, ["har-query", str(tmp_path), sql])
+    assert len(connections) == 1
+    connections[0].close.assert_called_once_with()
+
+
+def test_har_import(tmp_path):
+    # Two captures of the same page, one as a .har and one as a .har.zip
+    har = _har_with_duplicates(2)
+    for entry in har["log"]["entries"]:
+        entry["request"]["method"] = "GET"
+        entry["response"]["status"] = 200
+        entry["response"]["content"]["mimeType"] = "text/javascript; charset=utf-8"
+        entry["timings"] = {"dns": -1, "wait": 12.5}
+    (tmp_path / "one.har").write_text(json.dumps(har))
+    for entry in har["log"]["entries"]:
+        entry["response"]["content"] = {
+            "mimeType": "text/javascript",
+            "_file": entry["request"]["url"][-1] + ".js",
+        }
+    with zipfile.ZipFile(tmp_path / "two.har.zip", "w") as zf:
+        zf.writestr("har.har", json.dumps(har))
+        zf.writestr("0.js", "console.log(0)")
+        zf.writestr("1.js", "console.log(2)")
+    db_path = str(tmp_path / "hars.db")
+    runner = CliRunner()
+    result = runner.invoke(
+        cli,
+        [
+            "har-import",
+            db_path,
+            str(tmp_path / "one.har"),
+            str(tmp_path / "two.har.zip"),
+            "--bodies",
+        ],
+    )
+    assert result.exit_code == 0, result.output
+    assert "Imported 2 requests from {}".format(tmp_path / "one.har") in (result.output)
+
+    def query(sql):
+        result = runner.invoke(cli, ["har-query", db_path, sql])
+        assert result.exit_code == 0, result.output
+        return json.loads(result.output)
+
+    assert query(
+        "select runs.name, domain, mime_type, dns, wait, body_sha256 "
+        "from requests join runs on runs.id = run_id order by requests.id"
+    ) == [
+        {
+            "name": str(tmp_path / name),
+            "domain": "example.com",
+            "mime_type": "text/javascript",
+            "dns": None,
+            "wait": 12.5,
+            "body_sha256": hashlib.sha256(body).hexdigest(),
+        }
+        for name, body in (
+            ("one.har", b"console.log(0)"),
+            ("one.har", b"console.log(1)"),
+            ("two.har.zip", b"console.log(0)"),
+            ("two.har.zip", b"console.log(2)"),
+        )
+    ]
+    # Identical bodies are only stored once
+    assert query("select count(*) as n from bodies") == [{"n": 3}]
+
+    # Runs cannot be imported twice, unless --replace is used
+    args = ["har-import", db_path, str(tmp_path / "one.har"), "--run", "nightly"]
+    assert runner.invoke(cli, args).exit_code == 0
+    result = runner.invoke(cli, args)
+    assert result.exit_code == 1
+    assert "Run 'nightly' has already been imported" in result.output
+    result = runner.invoke(cli, args + ["--replace"])
+    assert result.exit_code == 0, result.output
+    assert query(
+        "select name, count(*) as n from requests join runs on runs.id = run_id "
+        "group by name order by min(runs.id)"
+    ) == [
+        {"name": str(tmp_path / "one.har"), "n": 2},
+        {"name": str(tmp_path / "two.har.zip"), "n": 2},
+        {"name": "nightly", "n": 2},
+    ]
+
+
+def _fake_async_playwright(mocker, statuses=None, errors=None, script_errors=None):
+    """
+    Mock async_playwright() with a browser whose contexts write a small HAR
+    file when closed. Returns a dict recording the peak number of pages
+    loading at once. errors maps URLs to exceptions raised by page.goto(),
+    and script_errors to exceptions raised by page.evaluate(). A status of
+    None makes page.goto() return None.
+    """
+    stats = {"loading": 0, "peak": 0, "contexts": []}
+    statuses = statuses or {}
+    errors = errors or {}
+    script_errors = script_errors or {}
+
+    def new_context(record_har_path, **kwargs):
+        context = mocker.MagicMock()
+        page = mocker.MagicMock()
+        stats["contexts"].append((record_har_path, kwargs))
+
+        async def goto(url):
+            page.url = url
+            stats["loading"] += 1
+            stats["peak"] = max(stats["peak"], stats["loading"])
+            await asyncio.sleep(0.01)
+            stats["loading"] -= 1
+            if url in errors:
+                raise errors[url]
+            status = statuses.get(url, 200)
+            if status is None:
+                return None
+            return mocker.MagicMock(status=status, url=url)
+
+        async def evaluate(javascript):
+            if page.url in script_errors:
+                raise script_errors[page.url]
+
+        async def close():
+            entry = {"request": {"url": page.url}, "response": {}}
+            pathlib.Path(record_har_path).write_text(
+                json.dumps({"log": {"pages": [], "entries": [entry]}})
+            )
+
+        page.goto = goto
+        page.evaluate = evaluate
+        page.wait_for_function = mocker.AsyncMock()
+        context.new_page = mocker.AsyncMock(return_value=page)
+        context.close = close
+        return context
+
+    browser = mocker.MagicMock()
+    browser.new_context = mocker.AsyncMock(side_effect=new_context)
+    browser.close = mocker.AsyncMock()
+    p = mocker.MagicMock()
+    p.chromium.launch = mocker.AsyncMock(return_value=browser)
+    manager = mocker.MagicMock()
+    manager.__aenter__ = mocker.AsyncMock(return_value=p)
+    manager.__aexit__ = mocker.AsyncMock(return_value=False)
+    mocker.patch.object(cli_module, "async_playwright", return_value=manager)
+    return stats
+
+
+URLS = (
+    "https://example.com/\n# A comment\n\nhttps://example.com/\nhttps://datasette.io/\n"
+)
+
+
+@pytest.mark.parametrize("concurrency", (1, 2))
+def test_har_urls(mocker, tmp_path, monkeypatch, concurrency):
+    monkeypatch.chdir(tmp_path)
+    stats = _fake_async_playwright(mocker)
+    result = CliRunner().invoke(
+        cli,
+        ["har", "--urls", "-", "--concurrency", str(concurrency), "--bypass-csp"],
+        input=URLS,
+    )
+    assert result.exit_code == 0, result.output
+    assert stats["peak"] == concurrency
+    assert [path for path, _ in stats["contexts"]] == [
+        "example-com.har",
+        "example-com.1.har",
+        "datasette-io.har",
+    ]
+    assert all(kwargs == {"bypass_csp": True} for _, kwargs in stats["contexts"])
+    har = json.loads((tmp_path / "datasette-io.har").read_text())
+    assert har["log"]["entries"][0]["request"]["url"] == "https://datasette.io/"
+    assert "HAR of 'https://datasette.io/' written to 'datasette-io.har'" in (
+        result.output
+    )
+
+
+def test_har_urls_combined(mocker, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    _fake_async_playwright(mocker, statuses={"https://datasette.io/": 404})
+    (tmp_path / "urls.txt").write_text(URLS)
+    result = CliRunner().invoke(
+        cli, ["har", "--urls", "urls.txt", "-o", "combined", "--skip"]
+    )
+    assert result.exit_code == 0, result.output
+    assert "404 error for https://datasette.io/, skipping" in result.output
+    assert "Wrote to HAR file: combined.har" in result.output
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["combined.har", "urls.txt"]
+    har = json.loads((tmp_path / "combined.har").read_text())
+    assert [entry["request"]["url"] for entry in har["log"]["entries"]] == [
+        "https://example.com/",
+        "https://example.com/",
+    ]
+
+
+def test_har_urls_recording_options(mocker, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    stats = _fake_async_playwright(mocker)
+    result = CliRunner().invoke(
+        cli,
+        ["har", "--urls", "-", "--har-content", "omit", "--har-url-filter", "*.js"],
+        input=URLS,
+    )
+    assert result.exit_code == 0, result.output
+    assert all(
+        kwargs == {"record_har_content": "omit", "record_har_url_filter": "*.js"}
+        for _, kwargs in stats["contexts"]
+    )
+
+
+def test_extract_har_resources_attached(tmp_path):
+    # --har-content attach with a .har file writes bodies alongside it
+    (tmp_path / "0123abcd.js").write_text("console.log(1)")
+    har = {
+        "log": {
+            "entries": [
+                {
+                    "request": {"url": f"https://example.com/{name}.js"},
+                    "response": {
+                        "headers": [
+                            {"name": "Content-Type", "value": "text/javascript"}
+                        ],
+                        "content": {"_file": f"{name}.js"},
+                    },
+                }
+                for name in ("0123abcd", "missing")
+            ]
+        }
+    }
+    path = tmp_path / "trace.har"
+    path.write_text(json.dumps(har))
+    _extract_har_resources(path)
+    assert [p.name for p in (tmp_path / "trace").iterdir()] == [
+        "example-com-0123abcd-js.js"
+    ]
+    assert (tmp_path / "trace" / "example-com-0123abcd-js.js").read_text() == (
+        "console.log(1)"
+    )
+
+
+def test_extract_har_resources_attached_outside_har_dir(tmp_path):
+    # _file references must not reach files outside the HAR's directory
+    (tmp_path / "secret.js").write_text("secret")
+    har_dir = tmp_path / "hars"
+    har_dir.mkdir()
+    (har_dir / "ok.js").write_text("ok")
+    har = {
+        "log": {
+            "entries": [
+                {
+                    "request": {"url": f"https://example.com/{i}.js"},
+                    "response": {"content": {"_file": file_ref}},
+                }
+                for i, file_ref in enumerate(
+                    ("../secret.js", str(tmp_path / "secret.js"), "ok.js")
+                )
+            ]
+        }
+    }
+    path = har_dir / "trace.har"
+    path.write_text(json.dumps(har))
+    _extract_har_resources(path)
+    extracted = list((har_dir / "trace").iterdir())
+    assert [p.read_text() for p in extracted] == ["ok"]
+
+
+def test_har_import_attached_outside_har_dir(tmp_path):
+    (tmp_path / "secret.js").write_text("secret")
+    har_dir = tmp_path / "hars"
+    har_dir.mkdir()
+    (har_dir / "ok.js").write_text("ok")
+    har = _har_with_duplicates(3)
+    file_refs = ("../secret.js", str(tmp_path / "secret.js"), "ok.js")
+    for entry, file_ref in zip(har["log"]["entries"], file_refs):
+        entry["response"]["content"] = {"_file": file_ref}
+    (har_dir / "trace.har").write_text(json.dumps(har))
+    db_path = str(tmp_path / "hars.db")
+    runner = CliRunner()
+    result = runner.invoke(
+        cli, ["har-import", db_path, str(har_dir / "trace.har"), "--bodies"]
+    )
+    assert result.exit_code == 0, result.output
+    result = runner.invoke(
+        cli,
+        ["har-query", db_path, "select cast(content as text) as content from bodies"],
+    )
+    assert result.exit_code == 0, result.output
+    assert json.loads(result.output) == [{"content": "ok"}]
+
+
+def test_har_urls_fail(mocker, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    _fake_async_playwright(mocker, statuses={"https://example.com/": 500})
+    result = CliRunner().invoke(cli, ["har", "--urls", "-", "--fail"], input=URLS)
+    assert result.exit_code == 1
+    assert "Error: 500 error for https://example.com/" in result.output
+
+
+@pytest.mark.parametrize("fail", (False, True))
+def test_har_urls_page_error(mocker, tmp_path, monkeypatch, fail):
+    monkeypatch.chdir(tmp_path)
+    _fake_async_playwright(
+        mocker,
+        errors={
+            "https://datasette.io/": cli_module.TimeoutError(
+                "Timeout 30000ms exceeded."
+            )
+        },
+    )
+    (tmp_path / "urls.txt").write_text(URLS)
+    result = CliRunner().invoke(
+        cli,
+        ["har", "--urls", "urls.txt", "-o", "combined", "--concurrency", "3"]
+        + (["--fail"] if fail else []),
+    )
+    if fail:
+        assert result.exit_code == 1
+        assert "Error: Timeout 30000ms exceeded." in result.output
+        assert sorted(p.name for p in tmp_path.iterdir()) == ["urls.txt"]
+        return
+    assert result.exit_code == 0, result.output
+    assert (
+        "Error recording 'https://datasette.io/': Timeout 30000ms exceeded."
+        in result.output
+    )
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["combined.har", "urls.txt"]
+    har = json.loads((tmp_path / "combined.har").read_text())
+    assert [entry["request"]["url"] for entry in har["log"]["entries"]] == [
+        "https://example.com/",
+        "https://example.com/",
+    ]
+
+
+def test_har_urls_no_response_and_javascript_error(mocker, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    _fake_async_playwright(
+        mocker,
+        statuses={"https://example.com/": None},
+        script_errors={
+            "https://datasette.io/": cli_module.Error("boom is not defined")
+        },
+    )
+    result = CliRunner().invoke(
+        cli,
+        ["har", "--urls", "-", "-o", "combined", "--javascript", "boom()"],
+        input=URLS,
+    )
+    assert result.exit_code == 0, result.output
+    assert "Error recording 'https://datasette.io/': boom is not defined" in (
+        result.output
+    )
+    har = json.loads((tmp_path / "combined.har").read_text())
+    assert [entry["request"]["url"] for entry in har["log"]["entries"]] == [
+        "https://example.com/",
+        "https://example.com/",
+    ]
+
+
+def test_har_urls_page_error_separate_files(mocker, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    _fake_async_playwright(
+        mocker,
+        errors={
+            "https://datasette.io/": cli_module.Error("net::ERR_NAME_NOT_RESOLVED")
+        },
+    )
+    result = CliRunner().invoke(cli, ["har", "--urls", "-"], input=URLS)
+    assert result.exit_code == 0, result.output
+    assert "Error recording 'https://datasette.io/': net::ERR_NAME_NOT_RESOLVED" in (
+        result.output
+    )
+    assert sorted(p.name for p in tmp_path.iterdir()) == [
+        "example-com.1.har",
+        "example-com.har",
+    ]
+
+
+@pytest.mark.parametrize(
+    "args,error",
+    (
+        (["https://example.com/", "--urls", "-"], "Pass either a URL or --urls"),
+        (["--urls", "-"], "No URLs to record"),
+        ([], "Missing argument 'URL'"),
+    ),
+)
+def test_har_urls_errors(args, error):
+    result = CliRunner().invoke(cli, ["har"] + args, input="")
+    assert result.exit_code != 0
+    assert error in result.output
+
+
+def _summary_entry(offset_ms, time, method, url, status, mime_type, headers, **sizes):
+    started = datetime.datetime(2025, 1, 1, tzinfo=datetime.timezone.utc)
+    started += datetime.timedelta(milliseconds=offset_ms)
+    return {
+        "startedDateTime": started.isoformat().replace("+00:00", "Z"),
+        "time": time,
+        "request": {"method": method, "url": url},
+        "response": {
+            "status": status,
+            "bodySize": sizes.get("body_size", -1),
+            "content": {"size": sizes.get("size", 0), "mimeType": mime_type},
+            "headers": [{"name": n, "value": v} for n, v in headers.items()],
+            **(
+                {"_transferSize": sizes["transfer_size"]}
+                if "transfer_size" in sizes
+                else {}
+            ),
+        },
+    }
+
+
+SUMMARY_HAR = {
+    "log": {
+        "entries": [
+            _summary_entry(
+                0,
+                100,
+                "GET",
+                "https://example.com/",
+                200,
+                "text/html; charset=utf-8",
+                {"Cache-Control": "no-cache"},
+                body_size=5000,
+            ),
+            _summary_entry(
+                110,
+                50,
+                "GET",
+                "https://cdn.example.com/app.js",
+                200,
+                "application/javascript",
+                {"cache-control": "public, max-age=31536000"},
+                transfer_size=20000,
+                body_size=19000,
+            ),
+            _summary_entry(
+                120,
+                300,
+                "GET",
+                "https://cdn.example.com/font.woff2",
+                200,
+                "font/woff2",
+                {"Last-Modified": "Wed, 01 Jan 2025 00:00:00 GMT"},
+                body_size=30000,
+            ),
+            _summary_entry(
+                170,
+                80,
+                "POST",
+                "https://api.example.com/data",
+                200,
+                "application/json",
+                {},
+                body_size=100,
+            ),
+            _summary_entry(
+                250,
+                20,
+                "GET",
+                "https://example.com/img.png",
+                200,
+                "image/png",
+                {"Expires": "0"},
+                size=700,
+            ),
+            _summary_entry(
+                260,
+                10,
+                "GET",
+                "https://example.com/private",
+                200,
+                "",
+                {"Cache-Control": "no-store"},
+                body_size=10,
+            ),
+        ]
+    }
+}
+
+
+def test_har_summary_json(tmp_path):
+    path = tmp_path / "trace.har"
+    path.write_text(json.dumps(SUMMARY_HAR))
+    result = CliRunner().invoke(cli, ["har-summary", str(path), "--json", "--top", "2"])
+    assert result.exit_code == 0, result.output
+    summary = json.loads(result.output)
+    assert summary["requests"] == 6
+    assert summary["bytes"] == 55810
+    assert summary["duration_ms"] == 420
+    assert summary["domains"] == [
+        {"domain": "cdn.example.com", "requests": 2, "bytes": 50000, "time_ms": 350},
+        {"domain": "example.com", "requests": 3, "bytes": 5710, "time_ms": 130},
+        {"domain": "api.example.com", "requests": 1, "bytes": 100, "time_ms": 80},
+    ]
+    assert [t["content_type"] for t in summary["content_types"]] == [
+        "font/woff2",
+        "application/javascript",
+        "text/html",
+        "image/png",
+        "application/json",
+        "(unknown)",
+    ]
+    assert summary["largest"] == [
+        {"url": "https://cdn.example.com/font.woff2", "bytes": 30000},
+        {"url": "https://cdn.example.com/app.js", "bytes": 20000},
+    ]
+    assert summary["slowest"] == [
+        {"url": "https://cdn.example.com/font.woff2", "time_ms": 300},
+        {"url": "https://example.com/", "time_ms": 100},
+    ]
+    assert summary["critical_path"] == {
+        "duration_ms": 420,
+        "requests": [
+            {"url": "https://example.com/", "start_ms": 0, "time_ms": 100},
+            {
+                "url": "https://cdn.example.com/font.woff2",
+                "start_ms": 120,
+                "time_ms": 300,
+            },
+        ],
+    }
+    # The POST request is not counted
+    assert summary["cacheability"] == {
+        "cacheable": {"requests": 1, "bytes": 20000},
+        "revalidate": {"requests": 2, "bytes": 5700},
+        "heuristic": {"requests": 1, "bytes": 30000},
+        "no-store": {"requests": 1, "bytes": 10},
+        "none": {"requests": 0, "bytes": 0},
+    }
+
+
+def test_har_summary_text(tmp_path):
+    path = tmp_path / "trace.har"
+    path.write_text(json.dumps(SUMMARY_HAR))
+    result = CliRunner().invoke(cli, ["har-summary", str(path), "--top", "1"])
+    assert result.exit_code == 0, result.output
+    assert result.output.startswith(
+        f"{path}: 6 requests, 55,810 bytes, 420 ms\n\nBy domain:\n"
+        "        50,000 bytes      2 requests  cdn.example.com\n"
+    )
+    assert "Critical path (estimated): 420 ms across 2 requests:\n" in result.output
+    assert (
+        "Largest requests:\n"
+        "        30,000 bytes  https://cdn.example.com/font.woff2\n"
+    ) in result.output
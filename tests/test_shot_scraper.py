@@ -1,5 +1,10 @@
+import io
+import os
 import pathlib
+import re
+import shutil
 import socket
+import subprocess
 import sys
 import threading
 import time
@@ -11,6 +16,7 @@ from click.testing import CliRunner
 import pytest
 import shot_scraper.cli as cli_module
 from shot_scraper.cli import cli
+from shot_scraper.video import VideoExport
 import zipfile
 import json
 from conftest import find_free_port
@@ -320,6 +326,41 @@ def test_multi_commands_fail_on_non_zero_exit(yaml, expected):
         assert not pathlib.Path("should-not-run").exists()
 
 
+def test_python_worker(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+    def exit_status(code):
+        with pytest.raises(click.ClickException) as ex:
+            cli_module._run_python_code(code)
+        return ex.value.message
+
+    with cli_module._python_worker():
+        worker = cli_module._active_python_worker
+        # Steps share imports and variables
+        cli_module._run_python_code("import pathlib\ncount = 1")
+        cli_module._run_python_code("count += 1")
+        cli_module._run_python_code("pathlib.Path('count.txt').write_text(str(count))")
+        assert (tmp_path / "count.txt").read_text() == "2"
+        pid = worker.process.pid
+        assert exit_status("raise ValueError('bad')") == (
+            "python code exited with status 1"
+        )
+        assert exit_status("import sys\nsys.exit(3)") == (
+            "python code exited with status 3"
+        )
+        cli_module._run_python_code("raise SystemExit(0)")
+        assert worker.process.pid == pid
+        # If the worker exits, the next step gets a new one
+        assert exit_status("import os\nos._exit(4)") == (
+            "python code exited with status 4"
+        )
+        assert exit_status("count") == "python code exited with status 1"
+        cli_module._run_python_code("count = 5")
+        assert worker.process.pid != pid
+    assert cli_module._active_python_worker is None
+    assert worker.process is None
+
+
 @pytest.mark.parametrize("input", ("key: value", "This is a string", "3.55"))
 def test_multi_error_on_non_list(input):
     runner = CliRunner()
@@ -328,6 +369,20 @@ def test_multi_error_on_non_list(input):
     assert result.output == "Error: YAML file must contain a list\n"
 
 
+@pytest.mark.skipif(
+    not pathlib.Path("/proc/self/status").exists(), reason="Requires /proc"
+)
+def test_process_tree_rss_excludes_python_worker():
+    assert cli_module._python_worker_pids() == set()
+    with cli_module._python_worker():
+        cli_module._run_python_code("data = bytearray(50 * 1024 * 1024)")
+        pids = cli_module._python_worker_pids()
+        assert pids == {cli_module._active_python_worker.process.pid}
+        rss = cli_module._process_tree_rss(os.getpid())
+        assert cli_module._process_tree_rss(os.getpid(), pids) < rss - 40 * 1024 * 1024
+    assert cli_module._python_worker_pids() == set()
+
+
 @pytest.mark.parametrize(
     "args,expected_shot_count",
     (
@@ -735,6 +790,786 @@ scenes:
         ) in result.output
 
 
+class FakeFFmpeg:
+    def __init__(self, args, returncode=0, stderr=b""):
+        self.args = args
+        self.stdin = io.BytesIO()
+        self.stdin.close = lambda: None
+        self.stderr = io.BytesIO(stderr)
+        self.returncode = returncode
+
+    def wait(self):
+        return self.returncode
+
+    def kill(self):
+        pass
+
+
+def test_live_mp4_encoder_constant_frame_rate(mocker):
+    processes = []
+
+    def popen(args, **kwargs):
+        processes.append(FakeFFmpeg(args))
+        return processes[-1]
+
+    mocker.patch.object(cli_module.subprocess, "Popen", side_effect=popen)
+    monotonic = mocker.patch.object(cli_module.time, "monotonic", return_value=100.0)
+    encoder = cli_module._LiveMP4Encoder("demo.mp4")
+    assert processes[0].args[-1] == "demo.mp4"
+    assert processes[0].args[processes[0].args.index("-framerate") + 1] == "25"
+    # Frames only arrive when the page changes
+    encoder.add_frame({"data": b"A", "timestamp": 5000.0})
+    encoder.add_frame({"data": b"B", "timestamp": 5120.0})
+    encoder.add_frame({"data": b"C", "timestamp": 5200.0})
+    monotonic.return_value = 100.4
+    encoder.close()
+    # 40ms per frame: A until 120ms, B until 200ms, C until recording stopped
+    assert processes[0].stdin.getvalue() == b"AAABBCCCCC"
+
+
+def test_live_mp4_encoder_errors(mocker):
+    mocker.patch.object(
+        cli_module.subprocess, "Popen", side_effect=FileNotFoundError("ffmpeg")
+    )
+    with pytest.raises(click.ClickException) as excinfo:
+        cli_module._LiveMP4Encoder("demo.mp4")
+    assert excinfo.value.message == (
+        "MP4 encoding failed: ffmpeg is not installed or not on PATH"
+    )
+    mocker.patch.object(
+        cli_module.subprocess,
+        "Popen",
+        side_effect=lambda args, **kwargs: FakeFFmpeg(
+            args, returncode=1, stderr=b"Unknown encoder 'libx264'\n"
+        ),
+    )
+    encoder = cli_module._LiveMP4Encoder("demo.mp4")
+    encoder.add_frame({"data": b"A", "timestamp": 0})
+    with pytest.raises(click.ClickException) as excinfo:
+        encoder.close()
+    assert excinfo.value.message == "MP4 encoding failed: Unknown encoder 'libx264'"
+
+
+@pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="ffmpeg is not installed")
+def test_live_mp4_encoder_ffmpeg(tmp_path):
+    frames = []
+    for color in ("red", "blue"):
+        frames.append(
+            subprocess.run(
+                ["ffmpeg", "-loglevel", "error", "-f", "lavfi", "-i"]
+                + [f"color={color}:s=64x48", "-frames:v", "1", "-f", "mjpeg", "-"],
+                check=True,
+                capture_output=True,
+            ).stdout
+        )
+    output = tmp_path / "demo.mp4"
+    encoder = cli_module._LiveMP4Encoder(str(output))
+    encoder.add_frame({"data": frames[0], "timestamp": 0})
+    encoder.add_frame({"data": frames[1], "timestamp": 400})
+    encoder.close()
+    assert output.read_bytes()[4:8] == b"ftyp"
+
+
+@pytest.mark.parametrize("webm", (True, False))
+def test_video_live_mp4(mocker, tmp_path, monkeypatch, webm):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "storyboard.yml").write_text(
+        "output: demo.webm\nurl: https://example.com/\nscenes:\n- name: One\n"
+    )
+    context = MagicMock()
+    page = context.new_page.return_value
+    page.is_closed.return_value = False
+    mocker.patch.object(
+        cli_module, "_browser_context", return_value=(context, MagicMock())
+    )
+    mocker.patch.object(cli_module, "sync_playwright", return_value=MagicMock())
+    mocker.patch.object(cli_module, "_storyboard_goto")
+    mocker.patch.object(cli_module, "_run_storyboard_scene")
+    encoder = mocker.patch.object(cli_module, "_LiveMP4Encoder")
+    convert = mocker.patch.object(cli_module, "_convert_video_to_mp4")
+    args = ["video", "storyboard.yml", "--mp4", "--live"]
+    result = CliRunner().invoke(cli, args + ([] if webm else ["--no-webm"]))
+    assert result.exit_code == 0, result.output
+    encoder.assert_called_once_with("demo.mp4")
+    expected = {
+        "size": {"width": 1280, "height": 720},
+        "on_frame": encoder.return_value.add_frame,
+    }
+    if webm:
+        expected["path"] = "demo.webm"
+    page.screencast.start.assert_called_once_with(**expected)
+    encoder.return_value.close.assert_called_once_with()
+    encoder.return_value.abort.assert_not_called()
+    convert.assert_not_called()
+    assert ("Video written to 'demo.webm'" in result.output) == webm
+    assert "MP4 written to 'demo.mp4'" in result.output
+
+
+def test_video_live_mp4_frames_during_pause(mocker, tmp_path, monkeypatch):
+    # Frames only reach on_frame while Playwright is running, so pauses and
+    # timed scrolls must not block it with time.sleep()
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "storyboard.yml").write_text("""
+output: demo.webm
+url: https://example.com/
+scenes:
+- name: One
+  do:
+  - pause: 0.2
+  - scroll: {to: "#footer", duration: 0.1}
+""")
+    page = _mock_storyboard_browser(mocker)
+    processes = []
+
+    def popen(args, **kwargs):
+        processes.append(FakeFFmpeg(args))
+        return processes[-1]
+
+    mocker.patch.object(cli_module.subprocess, "Popen", side_effect=popen)
+    sleep = mocker.patch.object(cli_module.time, "sleep")
+    timestamps = iter((0, 200, 300))
+
+    def start(**kwargs):
+        page.on_frame = kwargs["on_frame"]
+        page.on_frame({"data": b"A", "timestamp": next(timestamps)})
+
+    def wait_for_timeout(timeout):
+        page.on_frame({"data": b"B", "timestamp": next(timestamps)})
+
+    page.screencast.start.side_effect = start
+    page.wait_for_timeout.side_effect = wait_for_timeout
+    result = CliRunner().invoke(
+        cli, ["video", "storyboard.yml", "--mp4", "--live", "--no-webm"]
+    )
+    assert result.exit_code == 0, result.output
+    sleep.assert_not_called()
+    assert [call.args for call in page.wait_for_timeout.call_args_list] == [
+        (200.0,),
+        (100.0,),
+    ]
+    assert processes[0].stdin.getvalue().startswith(b"AAAAABB")
+
+
+@pytest.mark.parametrize(
+    "args,error",
+    (
+        (["--live"], "--live can only be used with --mp4"),
+        (["--mp4", "--no-webm"], "--no-webm can only be used with --mp4 --live"),
+    ),
+)
+def test_video_live_mp4_errors(args, error):
+    result = CliRunner().invoke(cli, ["video", "storyboard.yml"] + args)
+    assert result.exit_code == 2
+    assert error in result.output
+
+
+def test_virtual_time_recorder(mocker):
+    processes = []
+
+    def popen(args, **kwargs):
+        processes.append(FakeFFmpeg(args))
+        return processes[-1]
+
+    mocker.patch.object(cli_module.subprocess, "Popen", side_effect=popen)
+    page = MagicMock()
+    # Date.now() under an installed clock can be fractional
+    page.evaluate.return_value = 1700000000999.75
+    page.screenshot.return_value = b"F"
+    recorder = cli_module._VirtualTimeRecorder(page, "demo.webm")
+    recorder.start()
+    # Paused at a whole second safely ahead of the page clock
+    page.clock.pause_at.assert_called_once_with(1700000002)
+    assert processes[0].args[-1] == "demo.webm"
+    assert "libvpx-vp9" in processes[0].args
+    assert page.screenshot.call_count == 1
+
+    recorder.advance(1)
+    assert page.clock.run_for.call_count == 25
+    assert {call.args[0] for call in page.clock.run_for.call_args_list} == {40}
+    # Part frames carry over to the next advance()
+    recorder.advance(0.02)
+    assert page.clock.run_for.call_count == 25
+    recorder.advance(0.02)
+    assert page.clock.run_for.call_count == 26
+    assert processes[0].stdin.getvalue() == b"F" * 27
+
+    checks = iter([False, False, True])
+    recorder.wait_until(lambda: next(checks), "'h1'")
+    assert page.clock.run_for.call_count == 28
+    recorder.wait_limit = 1
+    with pytest.raises(click.ClickException) as ex:
+        recorder.wait_until(lambda: False, "'h2'")
+    assert ex.value.message == ("Timed out after 1s of virtual time waiting for 'h2'")
+    recorder.close()
+
+
+def test_video_virtual_time(mocker, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "storyboard.yml").write_text(
+        "output: demo.webm\nurl: https://example.com/\nscenes:\n- name: One\n"
+        "  do:\n  - pause: 2\n  - type: {into: input, text: abc, delay_ms: 100}\n"
+        "  - scroll: {y: 400, duration: 0.5}\n  - wait_for: h1\n"
+    )
+    context = MagicMock()
+    page = context.new_page.return_value
+    page.is_closed.return_value = False
+    page.evaluate.return_value = 1700000000000
+    page.screenshot.return_value = b"F"
+    mocker.patch.object(
+        cli_module, "_browser_context", return_value=(context, MagicMock())
+    )
+    mocker.patch.object(cli_module, "sync_playwright", return_value=MagicMock())
+    mocker.patch.object(cli_module, "_storyboard_goto")
+    processes = []
+
+    def popen(args, **kwargs):
+        processes.append(FakeFFmpeg(args))
+        return processes[-1]
+
+    mocker.patch.object(cli_module.subprocess, "Popen", side_effect=popen)
+    sleep = mocker.patch.object(cli_module.time, "sleep")
+    result = CliRunner().invoke(cli, ["video", "storyboard.yml", "--virtual-time"])
+    assert result.exit_code == 0, result.output
+    context.clock.install.assert_called_once()
+    page.screencast.start.assert_not_called()
+    sleep.assert_not_called()
+    assert [call.args[0] for call in page.locator.return_value.type.call_args_list] == [
+        "a",
+        "b",
+        "c",
+    ]
+    # pause: 50 frames, type: 3 x 2.5 frames, scroll: 12.5 frames, plus
+    # one frame after each action and the first frame
+    assert page.clock.run_for.call_count == 50 + 7 + 13 + 4
+    assert page.screenshot.call_count == page.clock.run_for.call_count + 1
+    assert "Video written to 'demo.webm'" in result.output
+
+
+def test_video_virtual_time_errors():
+    result = CliRunner().invoke(
+        cli,
+        ["video", "storyboard.yml", "--virtual-time", "--cache-dir", "cache"],
+    )
+    assert result.exit_code == 2
+    assert "--virtual-time cannot be used with" in result.output
+
+
+def test_video_export_args():
+    exports = [
+        VideoExport(format="mp4"),
+        VideoExport(format="gif", width=640, fps=12, output="readme.gif"),
+        VideoExport(format="webm", height=360, output="small.webm"),
+        VideoExport(format="png", at=2.5),
+    ]
+    args = cli_module._video_export_args("demo.webm", exports)
+    assert args[:5] == ["ffmpeg", "-y", "-i", "demo.webm", "-filter_complex"]
+    assert args[5].split(";") == [
+        "[0:v]split=4[in0][in1][in2][in3]",
+        "[in0]pad=ceil(iw/2)*2:ceil(ih/2)*2[out0]",
+        "[in1]fps=12,scale=640:-2:flags=lanczos,split[gif1][pal1]",
+        "[pal1]palettegen=stats_mode=diff[palette1]",
+        "[gif1][palette1]paletteuse=dither=bayer:bayer_scale=5[out1]",
+        "[in2]scale=-2:360[out2]",
+        "[in3]trim=start=2.5,setpts=PTS-STARTPTS[out3]",
+    ]
+    assert args[6:] == (
+        ["-map", "[out0]", "-c:v", "libx264", "-pix_fmt", "yuv420p"]
+        + ["-movflags", "+faststart", "demo.mp4"]
+        + ["-map", "[out1]", "readme.gif"]
+        + ["-map", "[out2]", "-c:v", "libvpx-vp9", "-b:v", "0", "-crf", "32"]
+        + ["small.webm"]
+        + ["-map", "[out3]", "-frames:v", "1", "-update", "1", "demo.png"]
+    )
+
+
+@pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="ffmpeg is not installed")
+def test_video_export_ffmpeg(tmp_path):
+    source = str(tmp_path / "demo.webm")
+    subprocess.run(
+        ["ffmpeg", "-loglevel", "error", "-f", "lavfi", "-i"]
+        + ["testsrc=size=64x48:rate=10:duration=1", "-c:v", "libvpx-vp9", source],
+        check=True,
+    )
+    exports = [
+        VideoExport(format="gif", fps=5),
+        VideoExport(format="png", at=0.5, width=32),
+    ]
+    cli_module._export_video(source, exports, silent=True)
+    assert (tmp_path / "demo.gif").read_bytes()[:3] == b"GIF"
+    assert (tmp_path / "demo.png").read_bytes()[:4] == b"\x89PNG"
+
+
+FREEZEDETECT_STDERR = """
+[freezedetect @ 0x1] lavfi.freezedetect.freeze_start: 2.04
+[freezedetect @ 0x1] lavfi.freezedetect.freeze_duration: 6
+[freezedetect @ 0x1] lavfi.freezedetect.freeze_end: 8.04
+[freezedetect @ 0x1] lavfi.freezedetect.freeze_start: 12
+frame=  300 fps=0.0 q=-0.0 size=N/A time=00:00:05.00 bitrate=N/A\r
+frame=  500 fps=0.0 q=-0.0 Lsize=N/A time=00:00:20.00 bitrate=N/A speed= 90x
+"""
+
+
+def test_video_max_idle(mocker, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "storyboard.yml").write_text(
+        "output: demo.webm\nurl: https://example.com/\nscenes:\n- name: One\n"
+    )
+    mocker.patch.object(cli_module, "_record_storyboard")
+    calls = []
+
+    def run(args, **kwargs):
+        calls.append(args)
+        if len(calls) == 1:
+            return subprocess.CompletedProcess(args, 0, "", FREEZEDETECT_STDERR)
+        pathlib.Path(args[-1]).write_bytes(b"compressed")
+        return subprocess.CompletedProcess(args, 0, "", "")
+
+    mocker.patch.object(cli_module.subprocess, "run", side_effect=run)
+    (tmp_path / "demo.webm").write_bytes(b"original")
+    result = CliRunner().invoke(
+        cli, ["video", "storyboard.yml", "--max-idle", "1.5", "--mp4"]
+    )
+    assert result.exit_code == 0, result.output
+    assert "freezedetect=n=0.003:d=1.5" in calls[0][calls[0].index("-vf") + 1]
+    assert calls[1][calls[1].index("-filter_complex") + 1] == (
+        "[0:v]trim=start=0:end=3.54,setpts=PTS-STARTPTS[v0];"
+        "[0:v]trim=start=8.04:end=13.5,setpts=PTS-STARTPTS[v1];"
+        "[v0][v1]concat=n=2:v=1:a=0[out]"
+    )
+    assert (tmp_path / "demo.webm").read_bytes() == b"compressed"
+    assert not (tmp_path / "demo.idle.webm").exists()
+    # The MP4 is converted from the compressed video
+    assert calls[2][calls[2].index("-i") + 1] == "demo.webm"
+    assert (
+        "Idle from 2.0s to 8.0s: shortened from 6.0s to 1.5s\n"
+        "Idle from 12.0s to 20.0s: shortened from 8.0s to 1.5s\n"
+        "Removed 11.0s of idle video from 'demo.webm', 20.0s to 9.0s\n"
+    ) in result.output
+
+
+def test_video_max_idle_nothing_idle(mocker, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "storyboard.yml").write_text(
+        "output: demo.webm\nurl: https://example.com/\nscenes:\n- name: One\n"
+    )
+    mocker.patch.object(cli_module, "_record_storyboard")
+    run = mocker.patch.object(
+        cli_module.subprocess,
+        "run",
+        return_value=subprocess.CompletedProcess([], 0, "", "time=00:00:04.00"),
+    )
+    result = CliRunner().invoke(cli, ["video", "storyboard.yml", "--max-idle", "2"])
+    assert result.exit_code == 0, result.output
+    run.assert_called_once()
+    assert "No idle stretches longer than 2s" in result.output
+
+
+@pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="ffmpeg is not installed")
+def test_compress_idle_video_ffmpeg(tmp_path):
+    source = str(tmp_path / "demo.webm")
+    # One second of motion, three seconds of a still frame, then more motion
+    subprocess.run(
+        ["ffmpeg", "-loglevel", "error", "-f", "lavfi", "-i"]
+        + ["testsrc=size=64x48:rate=10:duration=5"]
+        + ["-vf", "freezeframes=first=10:last=39:replace=10"]
+        + ["-c:v", "libvpx-vp9", source],
+        check=True,
+    )
+    stretches, duration = cli_module._idle_stretches(source, 1)
+    assert len(stretches) == 1
+    assert stretches[0][0] == pytest.approx(1, abs=0.2)
+    cli_module._compress_idle_video(source, 1, silent=True)
+    _, new_duration = cli_module._idle_stretches(source, 1)
+    assert new_duration == pytest.approx(duration - 2, abs=0.3)
+
+
+def test_video_exports(mocker, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "storyboard.yml").write_text(
+        "output: demo.webm\nurl: https://example.com/\nscenes:\n- name: One\n"
+        "exports:\n- gif\n- format: png\n  output: poster.png\n"
+    )
+    mocker.patch.object(cli_module, "_record_storyboard")
+    run = mocker.patch.object(cli_module.subprocess, "run")
+    result = CliRunner().invoke(cli, ["video", "storyboard.yml", "-o", "out.webm"])
+    assert result.exit_code == 0, result.output
+    # All of the exports are created by a single ffmpeg process
+    run.assert_called_once()
+    args = run.call_args.args[0]
+    assert args[3] == "out.webm"
+    assert args[-1] == "poster.png"
+    assert "GIF written to 'out.gif'" in result.output
+    assert "PNG written to 'poster.png'" in result.output
+
+
+@pytest.mark.parametrize(
+    "exports,args,error",
+    (
+        ("- mp4\n- mp4", [], "exports: mp4 output 'demo.mp4' is already in use"),
+        ("- webm", [], "exports: webm output 'demo.webm' is already in use"),
+        ("- gif", ["--mp4", "--live", "--no-webm"], "cannot be used with --no-webm"),
+        ("- mp4", ["--mp4"], "exports: mp4 output 'demo.mp4' is also written by --mp4"),
+        ("- mp4", ["--mp4", "--live"], "is also written by --mp4"),
+    ),
+)
+def test_video_exports_errors(tmp_path, monkeypatch, exports, args, error):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "storyboard.yml").write_text(
+        "output: demo.webm\nurl: https://example.com/\nscenes:\n- name: One\n"
+        "exports:\n" + exports
+    )
+    result = CliRunner().invoke(cli, ["video", "storyboard.yml"] + args)
+    assert result.exit_code == 1
+    assert error in result.output
+
+
+CACHED_STORYBOARD = """
+output: demo.webm
+url: https://example.com/
+scenes:
+- name: One
+- name: Two
+  do:
+  - pause: {pause}
+- name: Three
+"""
+
+
+def test_video_cache_dir(mocker, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    storyboard = tmp_path / "storyboard.yml"
+    recorded = []
+    joined = []
+
+    def make_context(*args, **kwargs):
+        context = MagicMock()
+        context.storage_state.return_value = {"cookies": [], "origins": ["o"]}
+        page = context.new_page.return_value
+        page.is_closed.return_value = False
+        page.url = "https://example.com/next"
+
+        def start(path, size):
+            page.screencast.path = path
+
+        def stop():
+            pathlib.Path(page.screencast.path).write_bytes(b"segment")
+
+        page.screencast.start.side_effect = start
+        page.screencast.stop.side_effect = stop
+        return context, MagicMock()
+
+    def run(args, **kwargs):
+        list_file = pathlib.Path(args[args.index("-i") + 1])
+        joined.append(list_file.read_text().splitlines())
+        pathlib.Path(args[-1]).write_bytes(b"video")
+
+    browser_context = mocker.patch.object(
+        cli_module, "_browser_context", side_effect=make_context
+    )
+    mocker.patch.object(cli_module, "sync_playwright", return_value=MagicMock())
+    goto = mocker.patch.object(cli_module, "_storyboard_goto")
+    mocker.patch.object(
+        cli_module,
+        "_run_storyboard_scene",
+        side_effect=lambda page, scene, **kwargs: recorded.append(scene.name),
+    )
+    mocker.patch.object(cli_module.subprocess, "run", side_effect=run)
+    args = ["video", "storyboard.yml", "--cache-dir", "cache"]
+
+    storyboard.write_text(CACHED_STORYBOARD.format(pause=1))
+    result = CliRunner().invoke(cli, args)
+    assert result.exit_code == 0, result.output
+    assert recorded == ["One", "Two", "Three"]
+    assert len(joined[0]) == 3
+    assert all(line.startswith("file '/") for line in joined[0])
+    assert len(list((tmp_path / "cache").glob("*.webm"))) == 3
+    assert not list((tmp_path / "cache").glob("*.partial.webm"))
+    assert "Video written to 'demo.webm'" in result.output
+
+    # Changing the second scene re-records it and the scenes after it
+    recorded.clear()
+    storyboard.write_text(CACHED_STORYBOARD.format(pause=2))
+    result = CliRunner().invoke(cli, args)
+    assert result.exit_code == 0, result.output
+    assert recorded == ["Two", "Three"]
+    assert "Scene 1: One (cached)" in result.output
+    assert joined[1][0] == joined[0][0]
+    assert joined[1][1:] != joined[0][1:]
+    assert browser_context.call_args.kwargs["storage_state"] == {
+        "cookies": [],
+        "origins": ["o"],
+    }
+    assert goto.call_args.args[1] == "https://example.com/next"
+
+    # Nothing changed, so nothing is recorded
+    recorded.clear()
+    calls = browser_context.call_count
+    result = CliRunner().invoke(cli, args)
+    assert result.exit_code == 0, result.output
+    assert recorded == []
+    assert browser_context.call_count == calls
+    assert "All scenes are cached, skipping recording" in result.output
+    assert joined[2] == joined[1]
+
+
+def test_video_cache_dir_discards_failed_scene(mocker, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "storyboard.yml").write_text(CACHED_STORYBOARD.format(pause=1))
+    context = MagicMock()
+    page = context.new_page.return_value
+    context.storage_state.return_value = {}
+    page.url = "https://example.com/"
+    page.is_closed.return_value = False
+    page.screencast.start.side_effect = lambda path, size: pathlib.Path(
+        path
+    ).write_bytes(b"partial")
+    mocker.patch.object(
+        cli_module, "_browser_context", return_value=(context, MagicMock())
+    )
+    mocker.patch.object(cli_module, "sync_playwright", return_value=MagicMock())
+    mocker.patch.object(cli_module, "_storyboard_goto")
+
+    def run_scene(page, scene, **kwargs):
+        if scene.name == "Two":
+            raise click.ClickException("Scene failed")
+
+    mocker.patch.object(cli_module, "_run_storyboard_scene", side_effect=run_scene)
+    result = CliRunner().invoke(
+        cli, ["video", "storyboard.yml", "--cache-dir", "cache"]
+    )
+    assert result.exit_code == 1
+    assert "Scene failed" in result.output
+    assert len(list((tmp_path / "cache").glob("*.json"))) == 1
+    assert len(list((tmp_path / "cache").glob("*.webm"))) == 1
+
+
+def test_scene_cache_distinct_partial_files(mocker, tmp_path):
+    # Storyboards that differ only in output share scene keys
+    storyboards = [
+        cli_module.load_storyboard(
+            CACHED_STORYBOARD.format(pause=1).replace("demo.webm", output)
+        )
+        for output in ("one.webm", "two.webm")
+    ]
+    first, second = (
+        cli_module._SceneCache(tmp_path, storyboard, {}) for storyboard in storyboards
+    )
+    assert first.keys == second.keys
+    assert first.recording_path(0) != second.recording_path(0)
+    pathlib.Path(first.recording_path(0)).write_bytes(b"first")
+    pathlib.Path(second.recording_path(0)).write_bytes(b"second")
+    first.save(0, "https://example.com/", {})
+    assert (tmp_path / f"{first.keys[0]}.webm").read_bytes() == b"first"
+    assert pathlib.Path(second.recording_path(0)).read_bytes() == b"second"
+    second.save(0, "https://example.com/", {})
+    assert (tmp_path / f"{first.keys[0]}.webm").read_bytes() == b"second"
+    assert not list(tmp_path.glob("*.partial.*"))
+
+    list_files = []
+    mocker.patch.object(
+        cli_module.subprocess,
+        "run",
+        side_effect=lambda args, **kwargs: list_files.append(
+            args[args.index("-i") + 1]
+        ),
+    )
+    first.concat("one.webm")
+    second.concat("two.webm")
+    assert list_files[0] != list_files[1]
+    assert not list(tmp_path.glob("*.txt"))
+
+
+def test_video_cache_dir_resume_runs_javascript(mocker, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    storyboard = tmp_path / "storyboard.yml"
+    page = _mock_storyboard_browser(mocker)
+    page.url = "https://example.com/next"
+    page.screencast.start.side_effect = lambda path, size: pathlib.Path(
+        path
+    ).write_bytes(b"segment")
+    context = cli_module._browser_context.return_value[0]
+    context.storage_state.return_value = {}
+    evaluate_js = mocker.patch.object(cli_module, "_evaluate_js")
+    mocker.patch.object(cli_module, "_run_storyboard_scene")
+    mocker.patch.object(cli_module.subprocess, "run")
+    args = ["video", "storyboard.yml", "--cache-dir", "cache"]
+    for pause in (1, 2):
+        storyboard.write_text(
+            CACHED_STORYBOARD.format(pause=pause) + "javascript: hideBanner()\n"
+        )
+        result = CliRunner().invoke(cli, args)
+        assert result.exit_code == 0, result.output
+    assert "Scene 1: One (cached)" in result.output
+    # The setup javascript runs again after resuming at the cached URL
+    assert [call.args[1] for call in evaluate_js.call_args_list] == [
+        "hideBanner()",
+        "hideBanner()",
+    ]
+
+
+def test_video_cache_dir_live():
+    result = CliRunner().invoke(
+        cli,
+        ["video", "storyboard.yml", "--mp4", "--live", "--cache-dir", "cache"],
+    )
+    assert result.exit_code == 2
+    assert "--cache-dir cannot be used with --live" in result.output
+
+
+PROFILED_STORYBOARD = """
+output: demo.webm
+url: https://example.com/
+wait: 3
+scenes:
+- name: One
+  do:
+  - pause: 5
+  - click: "#go"
+  - screenshot: {output: shot.png, selector: h1}
+- name: Two
+  do:
+  - pause: 2.5
+"""
+
+
+def _mock_storyboard_browser(mocker):
+    context = MagicMock()
+    page = context.new_page.return_value
+    page.is_closed.return_value = False
+    mocker.patch.object(
+        cli_module, "_browser_context", return_value=(context, MagicMock())
+    )
+    mocker.patch.object(cli_module, "sync_playwright", return_value=MagicMock())
+    mocker.patch.object(cli_module, "_storyboard_goto")
+    return page
+
+
+def test_video_dry_run_and_profile(mocker, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "storyboard.yml").write_text(PROFILED_STORYBOARD)
+    page = _mock_storyboard_browser(mocker)
+    sleep = mocker.patch.object(cli_module.time, "sleep")
+    result = CliRunner().invoke(
+        cli,
+        ["video", "storyboard.yml", "--dry-run", "--profile", "timeline.json"],
+    )
+    assert result.exit_code == 0, result.output
+    assert "Dry run of 'demo.webm', not recording" in result.output
+    # Real time spent running the mocked steps is included, so allow for it
+    for pattern, expected in (
+        (r"Scene 1: One - ([\d.]+)s", 5),
+        (r"Scene 2: Two - ([\d.]+)s", 2.5),
+        (r"Estimated video duration: ([\d.]+)s", 7.5),
+    ):
+        match = re.search(pattern, result.output)
+        assert match, result.output
+        assert float(match.group(1)) == pytest.approx(expected, abs=0.3)
+    sleep.assert_not_called()
+    page.screencast.start.assert_not_called()
+    page.locator.return_value.screenshot.assert_not_called()
+    page.locator.assert_any_call("h1")
+    assert not (tmp_path / "demo.webm").exists()
+
+    timeline = json.loads((tmp_path / "timeline.json").read_text())
+    assert timeline["dry_run"] is True
+    assert timeline["video_duration"] == pytest.approx(7.5, abs=0.1)
+    assert [step["step"] for step in timeline["setup"]] == ["open", "wait"]
+    assert timeline["setup"][1]["duration"] == pytest.approx(3, abs=0.1)
+    scene = timeline["scenes"][0]
+    assert (scene["scene"], scene["name"]) == (1, "One")
+    assert [step["step"] for step in scene["steps"]] == [
+        "pause",
+        "click",
+        "screenshot",
+    ]
+    assert scene["steps"][1]["options"]["selector"] == "#go"
+    assert scene["steps"][1]["start"] == pytest.approx(
+        timeline["scenes"][0]["start"] + 5, abs=0.1
+    )
+
+
+def test_video_dry_run_skips_scroll_and_typing_delays(mocker, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "storyboard.yml").write_text("""
+output: demo.webm
+url: https://example.com/
+scenes:
+- name: One
+  do:
+  - type: {into: "#search", text: hello, delay_ms: 200}
+  - scroll: {to: "#footer", duration: 1.5}
+  - scroll: {y: 400, duration: 2}
+""")
+    page = _mock_storyboard_browser(mocker)
+    sleep = mocker.patch.object(cli_module.time, "sleep")
+    result = CliRunner().invoke(
+        cli,
+        ["video", "storyboard.yml", "--dry-run", "--profile", "timeline.json"],
+    )
+    assert result.exit_code == 0, result.output
+    sleep.assert_not_called()
+    timeline = json.loads((tmp_path / "timeline.json").read_text())
+    assert timeline["video_duration"] == pytest.approx(4.5, abs=0.3)
+    page.locator.return_value.type.assert_called_once_with("hello")
+    page.locator.return_value.scroll_into_view_if_needed.assert_called_once()
+    page.locator.return_value.evaluate.assert_not_called()
+    page.evaluate.assert_any_call(
+        "({x, y}) => window.scrollBy(x, y)", {"x": 0, "y": 400}
+    )
+
+
+def test_video_profile_records(mocker, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "storyboard.yml").write_text(PROFILED_STORYBOARD)
+    page = _mock_storyboard_browser(mocker)
+    sleep = mocker.patch.object(cli_module.time, "sleep")
+    result = CliRunner().invoke(
+        cli, ["video", "storyboard.yml", "--profile", "timeline.json"]
+    )
+    assert result.exit_code == 0, result.output
+    assert [call.args[0] for call in sleep.call_args_list] == [3.0, 5.0, 2.5]
+    page.screencast.start.assert_called_once()
+    page.locator.return_value.screenshot.assert_called_once_with(path="shot.png")
+    timeline = json.loads((tmp_path / "timeline.json").read_text())
+    assert timeline["dry_run"] is False
+    assert len(timeline["scenes"]) == 2
+
+
+def test_video_dry_run_reports_failing_action(mocker, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "storyboard.yml").write_text(PROFILED_STORYBOARD)
+    page = _mock_storyboard_browser(mocker)
+    page.locator.return_value.click.side_effect = cli_module.Error("No element")
+    result = CliRunner().invoke(
+        cli,
+        ["video", "storyboard.yml", "--dry-run", "--profile", "timeline.json"],
+    )
+    assert result.exit_code == 1
+    assert "Scene 1 action 2 (click) failed: No element" in result.output
+    timeline = json.loads((tmp_path / "timeline.json").read_text())
+    assert timeline["scenes"][0]["steps"][1]["error"] == "No element"
+
+
+@pytest.mark.parametrize(
+    "args,error",
+    (
+        (["--dry-run", "--mp4"], "--dry-run cannot be used with --mp4"),
+        (["--dry-run", "--cache-dir", "cache"], "--dry-run cannot be used"),
+        (
+            ["other.yml", "--profile", "timeline.json"],
+            "--profile and --dry-run can only be used with a single storyboard",
+        ),
+    ),
+)
+def test_video_dry_run_errors(tmp_path, monkeypatch, args, error):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "storyboard.yml").write_text(PROFILED_STORYBOARD)
+    (tmp_path / "other.yml").write_text(PROFILED_STORYBOARD)
+    result = CliRunner().invoke(cli, ["video", "storyboard.yml"] + args)
+    assert result.exit_code == 2
+    assert error in result.output
+
+
 def test_video_starts_screencast_after_initial_navigation(mocker):
     events = []
 
@@ -1062,6 +1897,122 @@ def test_video_server_waits_for_readiness(mocker):
     assert server_index < wait_index < goto_index
 
 
+STORYBOARD = """
+output: {output}
+url: http://localhost:8123/{output}
+sh: echo setup
+server: serve
+scenes:
+- do:
+  - pause: 0.1
+"""
+
+
+@pytest.mark.parametrize("concurrency", (1, 3))
+def test_video_multiple_storyboards(mocker, tmp_path, monkeypatch, concurrency):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "demos").mkdir()
+    for name in ("one", "two", "three"):
+        (tmp_path / "demos" / f"{name}.yml").write_text(
+            STORYBOARD.format(output=f"{name}.webm")
+        )
+    (tmp_path / "four.yaml").write_text(
+        STORYBOARD.format(output="four.webm").replace("echo setup", "echo four")
+    )
+    events = []
+    lock = threading.Lock()
+    threads = set()
+    recording = {"now": 0, "peak": 0}
+
+    def record_context(context, storyboard_config, **kwargs):
+        with lock:
+            threads.add(threading.get_ident())
+            recording["now"] += 1
+            recording["peak"] = max(recording["peak"], recording["now"])
+        time.sleep(0.05)
+        with lock:
+            recording["now"] -= 1
+        pathlib.Path(storyboard_config.output).write_bytes(b"webm")
+
+    mocker.patch.object(cli_module, "sync_playwright", side_effect=lambda: MagicMock())
+    mocker.patch.object(
+        cli_module, "_record_storyboard_context", side_effect=record_context
+    )
+    mocker.patch.object(
+        cli_module,
+        "_run_sh_command",
+        side_effect=lambda command: events.append(command),
+    )
+    server_process = MagicMock()
+    server_process.poll.return_value = None
+    mocker.patch.object(
+        cli_module,
+        "_start_server",
+        side_effect=lambda server: events.append(server) or (server_process, server),
+    )
+    mocker.patch.object(cli_module, "_wait_for_server")
+    result = CliRunner().invoke(
+        cli, ["video", "demos", "*.yaml", "--concurrency", str(concurrency)]
+    )
+    assert result.exit_code == 0, result.output
+    for name in ("one", "two", "three", "four"):
+        assert f"Video written to '{name}.webm'" in result.output
+        assert (tmp_path / f"{name}.webm").exists()
+    # Shared setup steps and servers only run once
+    assert events == ["echo setup", "serve", "echo four"]
+    assert server_process.kill.call_count == 1
+    assert recording["peak"] == concurrency
+    assert len(threads) == concurrency
+
+
+def test_video_multiple_storyboards_failures(mocker, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    for name in ("one", "two"):
+        (tmp_path / f"{name}.yml").write_text(
+            "output: {}.webm\nurl: https://example.com/\nscenes:\n- name: x\n".format(
+                name
+            )
+        )
+
+    def record_context(context, storyboard_config, **kwargs):
+        if storyboard_config.output == "one.webm":
+            raise cli_module.TimeoutError("Timeout 30000ms exceeded")
+
+    mocker.patch.object(cli_module, "sync_playwright", side_effect=lambda: MagicMock())
+    mocker.patch.object(
+        cli_module, "_record_storyboard_context", side_effect=record_context
+    )
+    result = CliRunner().invoke(cli, ["video", "*.yml", "--concurrency", "2"])
+    assert result.exit_code == 1
+    assert "Error recording one.yml: Timeout 30000ms exceeded" in result.output
+    assert "Video written to 'two.webm'" in result.output
+    assert "Error: 1 of 2 storyboards failed: one.yml" in result.output
+
+
+@pytest.mark.parametrize(
+    "args,error",
+    (
+        (["missing.yml"], "No storyboards found matching 'missing.yml'"),
+        (["."], "No .yml or .yaml storyboards found in '.'"),
+        (
+            ["a.yml", "b.yml", "-o", "out.webm"],
+            "--output can only be used with a single storyboard",
+        ),
+        (["a.yml", "b.yml"], "b.yml: output 'demo.webm' is also used by a.yml"),
+    ),
+)
+def test_video_multiple_storyboards_errors(tmp_path, monkeypatch, args, error):
+    monkeypatch.chdir(tmp_path)
+    if args != ["."]:
+        for name in ("a.yml", "b.yml"):
+            (tmp_path / name).write_text(
+                "output: demo.webm\nurl: https://example.com/\nscenes:\n- name: x\n"
+            )
+    result = CliRunner().invoke(cli, ["video"] + args)
+    assert result.exit_code != 0
+    assert error in result.output
+
+
 @pytest.mark.parametrize(
     "command,args,expected",
     [
@@ -1104,6 +2055,410 @@ def test_error_on_invalid_scale_factors(command, args, expected):
     assert result.output == expected
 
 
+def test_browser_context_launch_profile():
+    p = MagicMock()
+    # Chromium uses the last value of a repeated switch, so a later
+    # --js-flags overrides the heap size set by the profile
+    browser_args = ["--js-flags=--max-old-space-size=2048"]
+    cli_module._browser_context(
+        p, None, browser_args=browser_args, launch_profile="low-memory"
+    )
+    launch_kwargs = p.chromium.launch.call_args.kwargs
+    args = launch_kwargs["args"]
+    assert args == cli_module.LAUNCH_PROFILES["low-memory"]["args"] + browser_args
+    assert args.index("--js-flags=--max-old-space-size=512") < args.index(
+        browser_args[0]
+    )
+    # Site isolation is a security boundary, so no profile turns it off
+    assert "--disable-site-isolation-trials" not in args
+    new_context = p.chromium.launch.return_value.new_context
+    assert new_context.call_args.kwargs == {"service_workers": "block"}
+
+
+def test_browser_context_resolve():
+    p = MagicMock()
+    cli_module._browser_context(
+        p,
+        None,
+        browser_args=["--disable-gpu"],
+        resolve={"example.com": "127.0.0.1:8000", "*.cdn.com": "10.0.0.5"},
+    )
+    assert p.chromium.launch.call_args.kwargs["args"] == [
+        "--disable-gpu",
+        "--host-resolver-rules=MAP example.com 127.0.0.1:8000, MAP *.cdn.com 10.0.0.5",
+    ]
+    with pytest.raises(click.ClickException) as excinfo:
+        cli_module._browser_context(
+            MagicMock(), None, browser="webkit", resolve={"example.com": "127.0.0.1"}
+        )
+    assert "Chromium-based browsers" in excinfo.value.message
+
+
+def test_multi_resolve(mocker):
+    mocker.patch.object(cli_module, "take_shot")
+    mocker.patch.object(cli_module, "sync_playwright", return_value=MagicMock())
+    browser_context = mocker.patch.object(
+        cli_module, "_browser_context", return_value=(MagicMock(), MagicMock())
+    )
+    runner = CliRunner()
+    with runner.isolated_filesystem():
+        pathlib.Path("hosts.txt").write_text("# Staging\ncdn.example.com=10.0.0.5\n")
+        pathlib.Path("shots.yml").write_text(
+            "- resolve:\n"
+            "    www.example.com: 127.0.0.1:8000\n"
+            "- url: https://www.example.com/\n"
+            "  output: example.png\n"
+        )
+        result = runner.invoke(
+            cli,
+            [
+                "multi",
+                "shots.yml",
+                "--resolve-file",
+                "hosts.txt",
+                "--resolve",
+                "api.example.com=10.0.0.6",
+            ],
+        )
+    assert result.exit_code == 0, result.output
+    assert browser_context.call_args.kwargs["resolve"] == {
+        "cdn.example.com": "10.0.0.5",
+        "api.example.com": "10.0.0.6",
+        "www.example.com": "127.0.0.1:8000",
+    }
+
+
+def test_resolve_invalid():
+    result = CliRunner().invoke(
+        cli, ["html", "https://example.com/", "--resolve", "example.com"]
+    )
+    assert result.exit_code == 1
+    assert (
+        "Error: Invalid host mapping 'example.com', expected host=address"
+        in result.output
+    )
+
+
+def test_browser_context_replay_har():
+    p = MagicMock()
+    context, _ = cli_module._browser_context(p, None, replay_har="trace.har.zip")
+    context.route_from_har.assert_called_once_with("trace.har.zip", not_found="abort")
+    p = MagicMock()
+    context, _ = cli_module._browser_context(p, None)
+    context.route_from_har.assert_not_called()
+
+
+@pytest.mark.parametrize(
+    "args",
+    (
+        ["shot", "https://example.com/", "-o", "out.png"],
+        ["html", "https://example.com/", "-o", "out.html"],
+        ["pdf", "https://example.com/", "-o", "out.pdf"],
+        ["javascript", "https://example.com/", "1 + 1"],
+        ["multi", "shots.yml"],
+    ),
+)
+def test_replay_har_option(mocker, args):
+    mocker.patch.object(cli_module, "take_shot")
+    mocker.patch.object(cli_module, "sync_playwright", return_value=MagicMock())
+    context = MagicMock()
+    context.new_page.return_value.evaluate.return_value = 2
+    context.new_page.return_value.content.return_value = "<html></html>"
+    context.new_page.return_value.pdf.return_value = b"%PDF"
+    browser_context = mocker.patch.object(
+        cli_module, "_browser_context", return_value=(context, MagicMock())
+    )
+    runner = CliRunner()
+    with runner.isolated_filesystem():
+        pathlib.Path("trace.har").write_text("{}")
+        pathlib.Path("shots.yml").write_text(
+            "- url: https://example.com/\n  output: example.png\n"
+        )
+        result = runner.invoke(
+            cli, args + ["--replay-har", "trace.har", "--replay-har-miss", "fallback"]
+        )
+    assert result.exit_code == 0, result.output
+    assert browser_context.call_args.kwargs["replay_har"] == "trace.har"
+    assert browser_context.call_args.kwargs["replay_har_miss"] == "fallback"
+
+
+def test_browser_context_headless_shell():
+    p = MagicMock()
+    cli_module._browser_context(p, None, browser="chromium-headless-shell")
+    launch_kwargs = p.chromium.launch.call_args.kwargs
+    assert launch_kwargs["channel"] == "chromium-headless-shell"
+    assert launch_kwargs["headless"] is True
+    with pytest.raises(click.ClickException) as excinfo:
+        cli_module._browser_context(
+            MagicMock(), None, browser="chromium-headless-shell", interactive=True
+        )
+    assert "cannot be used for interactive sessions" in excinfo.value.message
+
+
+@pytest.mark.parametrize(
+    "args,expected_argv",
+    (
+        ([], ["playwright", "install", "chromium"]),
+        (["-b", "firefox"], ["playwright", "install", "firefox"]),
+        (
+            ["-b", "chromium-headless-shell"],
+            ["playwright", "install", "chromium-headless-shell"],
+        ),
+        (["--only-shell"], ["playwright", "install", "--only-shell", "chromium"]),
+    ),
+)
+def test_install(mocker, args, expected_argv):
+    run_module = mocker.patch.object(cli_module, "run_module")
+    mocker.patch.object(cli_module.sys, "argv", [])
+    result = CliRunner().invoke(cli, ["install"] + args)
+    assert result.exit_code == 0, result.output
+    assert cli_module.sys.argv == expected_argv
+    run_module.assert_called_once_with("playwright", run_name="__main__")
+
+
+def test_browser_context_launch_profile_requires_chromium():
+    with pytest.raises(click.ClickException) as excinfo:
+        cli_module._browser_context(
+            MagicMock(), None, browser="firefox", launch_profile="throughput"
+        )
+    assert "Chromium-based browsers" in excinfo.value.message
+
+
+def test_browser_session_recycles_and_merges_har_segments(
+    mocker, tmp_path, monkeypatch
+):
+    monkeypatch.chdir(tmp_path)
+    merge_har_files = mocker.patch.object(cli_module, "_merge_har_files")
+    p = MagicMock()
+    session = cli_module._BrowserSession(p, har_file="trace.har.zip", timeout=500)
+    assert session.recycle_reason(recycle_after=2) is None
+    session.shot_finished()
+    session.shot_finished()
+    assert session.recycle_reason(recycle_after=2) == "2 shots since launch"
+    session.relaunch("2 shots since launch", silent=True)
+    assert session.shots_since_launch == 0
+    assert session.recycle_reason(recycle_after=2) is None
+    record_har_paths = [
+        call.kwargs["record_har_path"]
+        for call in p.chromium.launch.return_value.new_context.call_args_list
+    ]
+    assert record_har_paths == ["trace.har.zip", "trace.part1.har.zip"]
+    for path in record_har_paths:
+        pathlib.Path(path).write_bytes(b"")
+    session.close()
+    merge_har_files.assert_called_once_with(
+        ["trace.har.zip", "trace.part1.har.zip"], "trace.har.zip"
+    )
+
+
+def test_browser_session_har_recording_options():
+    p = MagicMock()
+    session = cli_module._BrowserSession(
+        p,
+        har_file="trace.har",
+        record_har_content="omit",
+        record_har_mode="minimal",
+        record_har_url_filter="**/api/**",
+    )
+    new_context = p.chromium.launch.return_value.new_context
+    assert new_context.call_args.kwargs == {
+        "record_har_path": "trace.har",
+        "record_har_content": "omit",
+        "record_har_mode": "minimal",
+        "record_har_url_filter": "**/api/**",
+    }
+    # The options are only used when a HAR is being recorded
+    p = MagicMock()
+    cli_module._browser_context(p, None, record_har_content="omit")
+    assert p.chromium.launch.return_value.new_context.call_args.kwargs == {}
+
+
+def test_multi_har_recording_options_require_har(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "shots.yml").write_text("- url: https://example.com/\n")
+    result = CliRunner().invoke(cli, ["multi", "shots.yml", "--har-content", "omit"])
+    assert result.exit_code == 1
+    assert "--har-content, --har-mode and --har-url-filter require --har" in (
+        result.output
+    )
+
+
+@pytest.mark.parametrize(
+    "crash_retries,crashes,expected_calls",
+    (
+        (2, 1, 2),
+        (2, 2, 3),
+        (1, 5, 2),
+        (0, 1, 1),
+    ),
+)
+def test_multi_relaunches_after_crash(mocker, crash_retries, crashes, expected_calls):
+    calls = []
+
+    def take_shot(context, shot, **kwargs):
+        calls.append(shot["url"])
+        if shot["url"] == "https://example.com/crash" and len(calls) <= crashes:
+            raise cli_module.Error("Target crashed")
+
+    mocker.patch.object(cli_module, "take_shot", side_effect=take_shot)
+    mocker.patch.object(cli_module, "sync_playwright", return_value=MagicMock())
+    browser_context = mocker.patch.object(
+        cli_module,
+        "_browser_context",
+        side_effect=lambda *args, **kwargs: (MagicMock(), MagicMock()),
+    )
+    runner = CliRunner()
+    with runner.isolated_filesystem():
+        pathlib.Path("shots.yml").write_text(
+            "- url: https://example.com/crash\n"
+            "  output: crash.png\n"
+            "- url: https://example.com/after\n"
+            "  output: after.png\n"
+        )
+        result = runner.invoke(
+            cli, ["multi", "shots.yml", "--crash-retries", str(crash_retries)]
+        )
+    assert result.exit_code == 0, result.output
+    assert calls.count("https://example.com/crash") == expected_calls
+    # Later entries still run after the crash
+    assert calls[-1] == "https://example.com/after"
+    assert "Relaunching browser: browser crashed: Target crashed" in result.output
+    assert browser_context.call_count == 1 + min(crashes, crash_retries + 1)
+    if crashes > crash_retries:
+        assert "Browser crashed {} times".format(crash_retries + 1) in result.output
+
+
+def test_shot_default_output_name_does_not_scan_directory(
+    mocker, tmp_path, monkeypatch
+):
+    # A single default name only checks the candidates, not every file
+    monkeypatch.chdir(tmp_path)
+    listdir = mocker.patch("shot_scraper.utils.os.listdir")
+    take_shot = mocker.patch.object(cli_module, "take_shot")
+    mocker.patch.object(cli_module, "sync_playwright", return_value=MagicMock())
+    mocker.patch.object(
+        cli_module, "_browser_context", return_value=(MagicMock(), MagicMock())
+    )
+    (tmp_path / "example-com.png").write_text("")
+    result = CliRunner().invoke(cli, ["shot", "https://example.com/"])
+    assert result.exit_code == 0, result.output
+    assert take_shot.call_args.args[1]["output"] == "example-com.1.png"
+    listdir.assert_not_called()
+
+
+def test_multi_default_output_names(mocker):
+    outputs = []
+
+    def take_shot(context, shot, **kwargs):
+        outputs.append(shot["output"])
+        # The first attempt at the second shot crashes
+        if len(outputs) == 2:
+            raise cli_module.Error("Target crashed")
+
+    mocker.patch.object(cli_module, "take_shot", side_effect=take_shot)
+    mocker.patch.object(cli_module, "sync_playwright", return_value=MagicMock())
+    mocker.patch.object(
+        cli_module,
+        "_browser_context",
+        side_effect=lambda *args, **kwargs: (MagicMock(), MagicMock()),
+    )
+    runner = CliRunner()
+    with runner.isolated_filesystem():
+        pathlib.Path("example-com.png").write_text("")
+        pathlib.Path("shots.yml").write_text(
+            "- url: https://example.com/\n" * 3
+            + "- sh: touch example-com.4.png\n"
+            + "- url: https://example.com/\n"
+        )
+        result = runner.invoke(cli, ["multi", "shots.yml"])
+    assert result.exit_code == 0, result.output
+    # Retrying after a crash reuses the same name, and files created by
+    # earlier steps are not overwritten
+    assert outputs == [
+        "example-com.1.png",
+        "example-com.2.png",
+        "example-com.2.png",
+        "example-com.3.png",
+        "example-com.5.png",
+    ]
+
+
+def test_multi_crash_with_fail(mocker):
+    mocker.patch.object(
+        cli_module, "take_shot", side_effect=cli_module.Error("Target crashed")
+    )
+    mocker.patch.object(cli_module, "sync_playwright", return_value=MagicMock())
+    mocker.patch.object(
+        cli_module,
+        "_browser_context",
+        side_effect=lambda *args, **kwargs: (MagicMock(), MagicMock()),
+    )
+    runner = CliRunner()
+    with runner.isolated_filesystem():
+        pathlib.Path("shots.yml").write_text("- url: https://example.com/\n")
+        result = runner.invoke(
+            cli, ["multi", "shots.yml", "--crash-retries", "1", "--fail"]
+        )
+    assert result.exit_code == 1
+    assert (
+        "Error: Browser crashed 2 times taking shot of 'https://example.com/'"
+        in result.output
+    )
+
+
+@pytest.mark.parametrize("zip_", (False, True))
+def test_merge_har_files(tmp_path, zip_):
+    paths = []
+    for i in range(2):
+        har_data = {
+            "log": {
+                "pages": [{"id": f"page@{i}"}],
+                "entries": [{"request": {"url": f"https://example.com/{i}"}}],
+            }
+        }
+        if zip_:
+            path = tmp_path / (f"trace.part{i}.har.zip" if i else "trace.har.zip")
+            with zipfile.ZipFile(path, "w") as zf:
+                zf.writestr("har.har", json.dumps(har_data))
+                zf.writestr(f"resource{i}.html", f"<p>{i}</p>")
+        else:
+            path = tmp_path / (f"trace.part{i}.har" if i else "trace.har")
+            path.write_text(json.dumps(har_data))
+        paths.append(str(path))
+    cli_module._merge_har_files(paths, paths[0])
+    assert not pathlib.Path(paths[1]).exists()
+    if zip_:
+        with zipfile.ZipFile(paths[0]) as zf:
+            assert sorted(zf.namelist()) == [
+                "har.har",
+                "resource0.html",
+                "resource1.html",
+            ]
+            merged = json.loads(zf.read("har.har"))
+    else:
+        merged = json.loads(pathlib.Path(paths[0]).read_text())
+    assert [page["id"] for page in merged["log"]["pages"]] == ["page@0", "page@1"]
+    assert [entry["request"]["url"] for entry in merged["log"]["entries"]] == [
+        "https://example.com/0",
+        "https://example.com/1",
+    ]
+
+
+@pytest.mark.skipif(
+    not pathlib.Path("/proc/self/status").exists(), reason="Requires /proc"
+)
+def test_process_tree_rss():
+    process = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(10)"])
+    try:
+        time.sleep(0.2)
+        rss = cli_module._process_tree_rss(os.getpid())
+        assert rss > 0
+        assert cli_module._process_tree_rss(os.getpid(), {process.pid}) < rss
+    finally:
+        process.kill()
+        process.wait()
+
+
 @pytest.mark.parametrize(
     "args,expect_zip",
     (
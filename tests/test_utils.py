@@ -1,8 +1,11 @@
 import pytest
 from shot_scraper.utils import (
+    FilenameAllocator,
+    apply_host_mapping,
     filename_for_url,
     extension_for_content_type,
     filename_for_har_entry,
+    parse_host_mapping,
 )
 
 
@@ -39,6 +42,47 @@ def test_filename_for_url_if_exists(url, existing_files, expected):
     assert filename_for_url(url, file_exists=lambda s: s in existing_files) == expected
 
 
+def test_filename_allocator(tmp_path):
+    for name in ("datasette-io.png", "datasette-io.2.png", "other.txt"):
+        (tmp_path / name).write_text("")
+    checked = []
+
+    def file_exists(filename):
+        checked.append(filename)
+        return filename == "datasette-io.4.png"
+
+    allocator = FilenameAllocator(tmp_path, file_exists=file_exists)
+    allocator.reserve("datasette-io.5.png")
+    names = [
+        filename_for_url("https://datasette.io/", allocator=allocator) for _ in range(5)
+    ]
+    assert names == [
+        "datasette-io.1.png",
+        "datasette-io.3.png",
+        "datasette-io.6.png",
+        "datasette-io.7.png",
+        "datasette-io.8.png",
+    ]
+    # Each candidate name is only checked once
+    assert len(checked) == len(set(checked))
+    assert filename_for_url("https://datasette.io/", "jpg", allocator=allocator) == (
+        "datasette-io.jpg"
+    )
+
+
+def test_filename_allocator_har_entries():
+    allocator = FilenameAllocator()
+    names = [
+        filename_for_har_entry(
+            f"https://cdn.example.com/image.png?v={i}", "image/png", allocator=allocator
+        )
+        for i in range(1000)
+    ]
+    assert len(set(names)) == 1000
+    assert names[:2] == ["cdn-example-com-image.png", "cdn-example-com-image.1.png"]
+    assert names[-1] == "cdn-example-com-image.999.png"
+
+
 @pytest.mark.parametrize(
     "content_type,expected",
     (
@@ -122,3 +166,36 @@ def test_filename_for_har_entry(url, content_type, existing_files, expected):
         )
         == expected
     )
+
+
+def test_parse_host_mapping():
+    assert parse_host_mapping(
+        [
+            "# Local build",
+            "example.com=127.0.0.1:8000",
+            "",
+            " *.cdn.example.com = 10.0.0.5 ",
+            "example.com=127.0.0.1:9000  # later rules win",
+        ]
+    ) == {"example.com": "127.0.0.1:9000", "*.cdn.example.com": "10.0.0.5"}
+
+
+@pytest.mark.parametrize("rule", ("example.com", "=127.0.0.1", "a b=127.0.0.1"))
+def test_parse_host_mapping_invalid(rule):
+    with pytest.raises(ValueError) as excinfo:
+        parse_host_mapping([rule])
+    assert "expected host=address" in str(excinfo.value)
+
+
+@pytest.mark.parametrize(
+    "url,expected",
+    (
+        ("https://example.com/path?q=1", "https://127.0.0.1:8000/path?q=1"),
+        ("http://img.cdn.example.com:8080/a.png", "http://10.0.0.5:8080/a.png"),
+        ("https://other.com/", "https://other.com/"),
+        ("file:///tmp/index.html", "file:///tmp/index.html"),
+    ),
+)
+def test_apply_host_mapping(url, expected):
+    mapping = {"example.com": "127.0.0.1:8000", "*.cdn.example.com": "10.0.0.5"}
+    assert apply_host_mapping(url, mapping) == expected
@@ -153,6 +153,33 @@ scenes:
     assert storyboard.cursor.click_size == 60
 
 
+def test_load_storyboard_exports():
+    storyboard = parse_storyboard("""
+output: videos/demo.webm
+url: https://example.com/
+scenes:
+- name: Home
+exports:
+- mp4
+- format: gif
+  width: 640
+  fps: 12
+  output: readme.gif
+- format: png
+  at: 2.5
+""")
+
+    assert [export.format for export in storyboard.exports] == ["mp4", "gif", "png"]
+    assert storyboard.exports[1].width == 640
+    assert storyboard.exports[1].fps == 12
+    assert storyboard.exports[2].at == 2.5
+    assert [export.output_path(storyboard.output) for export in storyboard.exports] == [
+        "videos/demo.mp4",
+        "readme.gif",
+        "videos/demo.png",
+    ]
+
+
 @pytest.mark.parametrize(
     "yaml,expected",
     (
@@ -204,6 +231,29 @@ scenes:
 """,
             "scenes.0.banana: Extra inputs are not permitted",
         ),
+        (
+            """
+output: demo.webm
+url: https://example.com/
+scenes:
+- name: Home
+exports:
+- format: avi
+""",
+            "exports.0.format: Input should be 'mp4', 'gif', 'webm' or 'png'",
+        ),
+        (
+            """
+output: demo.webm
+url: https://example.com/
+scenes:
+- name: Home
+exports:
+- format: gif
+  at: 1
+""",
+            "exports.0: at: can only be used with format: png",
+        ),
     ),
 )
 def test_load_storyboard_validation_errors(yaml, expected):